@@ -1,22 +1,147 @@
 __author__ = 'Simon'
+"""Game graphics
+
+Images needed every round are packed into one atlas. The decoded atlas and its index are cached in
+assets/cache/atlas.bin together with a hash of the source PNGs, so later starts read raw pixels instead of decoding
+every PNG. Help screen images are loaded on first access. All paths are relative to this file.
+"""
+
+import hashlib
+import json
+import os.path
+import struct
+import time
 import pygame
 
+ASSETDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+CACHEFILE = os.path.join(ASSETDIR, "cache", "atlas.bin")
+CACHEMAGIC = b"CLATLAS1"
+
+# packed into the atlas
+SPRITES = (
+    ("landerLightGreen", "landing_light_green.png"),
+    ("landerLightRed", "landing_light_red.png"),
+    ("landerBody", "lander_body_prelim.png"),
+    ("rotorA", "rotor_A.png"),
+    ("rotorB", "rotor_B.png"),
+    ("yellowBox", "yellow_box.png"),
+    ("redBox", "red_box.png"),
+    ("blueBox", "blue_box.png"),
+    ("boxOverlay", "box_overlay.png"),
+    ("background", "background.png"),
+)
+
+# only needed for the help screen, loaded on first access
+LAZYSPRITES = {
+    "upArrow": "upArrow.png",
+    "leftArrow": "leftArrow.png",
+    "rightArrow": "rightArrow.png",
+    "space": "space.png",
+    "ESC": "ESC.png",
+    "mouse": "mouse.png",
+}
+
 
 class Assets(object):
-    def __init__(self):
-        self.landerLightGreen = pygame.image.load("assets/landing_light_green.png").convert()
-        self.landerLightRed = pygame.image.load("assets/landing_light_red.png").convert()
-        self.landerBody = pygame.image.load("assets/lander_body_prelim.png").convert()
-        self.rotorA = pygame.image.load("assets/rotor_A.png").convert()
-        self.rotorB = pygame.image.load("assets/rotor_B.png").convert()
-        self.yellowBox = pygame.image.load("assets/yellow_box.png").convert()
-        self.redBox = pygame.image.load("assets/red_box.png").convert()
-        self.blueBox = pygame.image.load("assets/blue_box.png").convert()
-        self.boxOverlay = pygame.image.load("assets/box_overlay.png").convert()
-        self.background = pygame.image.load("assets/background.png").convert()
-        self.upArrow = pygame.image.load("assets/upArrow.png").convert()
-        self.leftArrow = pygame.image.load("assets/leftArrow.png").convert()
-        self.rightArrow = pygame.image.load("assets/rightArrow.png").convert()
-        self.space = pygame.image.load("assets/space.png").convert()
-        self.ESC = pygame.image.load("assets/ESC.png").convert()
-        self.mouse = pygame.image.load("assets/mouse.png").convert()
\ No newline at end of file
+    def __init__(self, useCache=True):
+        start = time.time()
+        sourceHash = self.hashSources()
+        atlas, index = None, None
+        if useCache:
+            atlas, index = self.readCache(sourceHash)
+        self.source = "cache"
+        if atlas is None:
+            self.source = "png"
+            atlas, index = self.buildAtlas()
+            if useCache:
+                self.writeCache(sourceHash, atlas, index)
+        self.atlas = atlas
+        for name, rect, colorkey in index:
+            image = atlas.subsurface(rect)
+            if colorkey is not None:
+                image.set_colorkey(colorkey)
+            setattr(self, name, image)
+        self.loadTime = time.time() - start
+
+    def __getattr__(self, name):
+        """Load help screen images on first access"""
+        if name in LAZYSPRITES:
+            image = pygame.image.load(os.path.join(ASSETDIR, LAZYSPRITES[name])).convert()
+            setattr(self, name, image)
+            return image
+        raise AttributeError(name)
+
+    def hashSources(self):
+        sha = hashlib.sha1()
+        for name, fileName in SPRITES:
+            sha.update(fileName.encode("utf-8"))
+            with open(os.path.join(ASSETDIR, fileName), "rb") as f:
+                sha.update(f.read())
+        return sha.hexdigest()
+
+    def buildAtlas(self):
+        """Decode all SPRITES and pack them into rows (shelves) of one surface, return atlas and index"""
+        images = [(name, pygame.image.load(os.path.join(ASSETDIR, fileName)).convert()) for name, fileName in SPRITES]
+        width = max(image.get_width() for name, image in images)
+        placed = list()
+        x, y, rowHeight = 0, 0, 0
+        for name, image in sorted(images, key=lambda entry: entry[1].get_height(), reverse=True):
+            if x + image.get_width() > width:
+                x, y, rowHeight = 0, y + rowHeight, 0
+            placed.append((name, image, (x, y) + image.get_size()))
+            x += image.get_width()
+            rowHeight = max(rowHeight, image.get_height())
+        atlas = pygame.Surface((width, y + rowHeight)).convert()
+        index = list()
+        for name, image, rect in placed:
+            colorkey = image.get_colorkey()
+            # copy keyed pixels as well, the key is set again on the subsurface
+            image.set_colorkey(None)
+            atlas.blit(image, rect[:2])
+            index.append((name, rect, None if colorkey is None else tuple(colorkey)[:3]))
+        return atlas, index
+
+    def readCache(self, sourceHash):
+        """Return atlas and index from CACHEFILE or (None, None) if it is missing or outdated"""
+        try:
+            with open(CACHEFILE, "rb") as f:
+                if f.read(len(CACHEMAGIC)) != CACHEMAGIC:
+                    return None, None
+                headerLength = struct.unpack("<I", f.read(4))[0]
+                header = json.loads(f.read(headerLength).decode("utf-8"))
+                if header["hash"] != sourceHash:
+                    return None, None
+                pixels = f.read()
+        except (IOError, OSError, ValueError, KeyError, struct.error):
+            return None, None
+        size = tuple(header["size"])
+        if len(pixels) != size[0] * size[1] * 3:
+            return None, None
+        atlas = pygame.image.fromstring(pixels, size, "RGB").convert()
+        index = [(name, tuple(rect), None if colorkey is None else tuple(colorkey))
+                 for name, rect, colorkey in header["index"]]
+        return atlas, index
+
+    def writeCache(self, sourceHash, atlas, index):
+        """Write atlas to CACHEFILE via a temporary file, a read-only install just skips the cache"""
+        header = json.dumps({"hash": sourceHash, "size": atlas.get_size(), "index": index}).encode("utf-8")
+        try:
+            if not os.path.isdir(os.path.dirname(CACHEFILE)):
+                os.makedirs(os.path.dirname(CACHEFILE))
+            tempFile = CACHEFILE + ".tmp"
+            with open(tempFile, "wb") as f:
+                f.write(CACHEMAGIC)
+                f.write(struct.pack("<I", len(header)))
+                f.write(header)
+                f.write(pygame.image.tostring(atlas, "RGB"))
+            os.rename(tempFile, CACHEFILE)
+        except (IOError, OSError):
+            pass
+
+
+if __name__ == "__main__":
+    pygame.init()
+    pygame.display.set_mode((320, 480))
+    for useCache in (False, True, True):
+        myAssets = Assets(useCache)
+        print("%-5s %.1f ms, atlas %dx%d" % ((myAssets.source, myAssets.loadTime * 1000) + myAssets.atlas.get_size()))
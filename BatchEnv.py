@@ -0,0 +1,235 @@
+__author__ = 'Simon'
+"""Batch environment for training and evaluating landing controllers
+
+BatchEnv runs thousands of independent single drone games at once. Movement is stepped by Physics.step, landing and
+crashing follow Lander.collide/checkCollision against the platforms of the level (see Level), or Simulation.collideSwept
+with Parameters(sweptCollision=True). Rewards follow Simulation.updateLanders (3 for the platform of the drone's color,
+1 for another one). All games are updated with NumPy operations, there is no Python loop over games.
+
+    env = BatchEnv(parameters=Simulation.Parameters())
+    observations = env.reset(4096)
+    observations, rewards, dones, info = env.step(actions)   # actions[:, 0] thrust, actions[:, 1] -1/0/1 steering
+"""
+
+import numpy
+import Grid
+import Impact
+import Lander
+import Level
+import Physics
+import Simulation
+
+# columns of an observation
+OBSERVATIONS = ("xPos", "yPos", "fallSpeed", "horizontalSpeed", "fuelLeft", "color", "targetX")
+
+
+class BatchEnv(object):
+    def __init__(self, x=320, y=480, parameters=None, deltaTime=1 / 60.0, seed=None, autoReset=False, level=None):
+        """Games are played in the world of Simulation(x, y, parameters=parameters, level=level)
+
+        Size, wrap width, spawn band and platforms come from level (default Level.forSize(x, y)), the integrator from
+        parameters. A game ends when its drone landed, crashed or the round length of parameters ran out.
+        With autoReset finished games start over at once, else they stay done until reset or resetDone.
+        """
+        if parameters is None:
+            parameters = Simulation.Parameters()
+        if level is None:
+            level = Level.forSize(x, y)
+        self.parameters = parameters
+        self.level = level
+        self.drawSize = level.size
+        self.deltaTime = deltaTime
+        self.autoReset = autoReset
+        self.random = numpy.random.default_rng(seed)
+        self.physics = Physics.Physics(parameters.gravity, 1, integrator=parameters.integrator,
+                                       wrapWidth=level.wrapWidth)
+        self.landerSize = Lander.SIZE
+        self.platforms = Grid.StaticIndex(level.createPlatforms())
+        platforms = self.platforms.objects
+        self.platformRects = numpy.array([(p.xPos, p.yPos, p.drawSize[0], p.drawSize[1]) for p in platforms],
+                                         dtype=float).reshape(-1, 4)
+        self.platformColors = numpy.array([Lander.COLORS.index(p.color) for p in platforms], dtype=int)
+        self.count = 0
+        self.colors = numpy.zeros(0, dtype=int)
+        # per game: x a drone has to reach to be centered on the nearest platform of its color and that platform's y
+        self.targetX = numpy.zeros(0)
+        self.targetY = numpy.zeros(0)
+        self.timeLeft = numpy.zeros(0)
+        self.done = numpy.zeros(0, dtype=bool)
+
+    def reset(self, n):
+        """Start n new games and return their observations"""
+        physics = self.physics
+        physics.reset()
+        if physics.capacity < n:
+            physics.allocate(n)
+        physics.size = n
+        self.count = n
+        self.colors = numpy.zeros(n, dtype=int)
+        self.targetX = numpy.zeros(n)
+        self.targetY = numpy.zeros(n)
+        self.timeLeft = numpy.zeros(n)
+        self.done = numpy.zeros(n, dtype=bool)
+        self.resetGames(numpy.ones(n, dtype=bool))
+        return self.observe()
+
+    def resetDone(self):
+        """Start finished games over, return all observations"""
+        self.resetGames(self.done.copy())
+        return self.observe()
+
+    def resetGames(self, mask):
+        """Spawn a fresh drone (random color and x like Simulation.spawnLander) in every game selected by mask"""
+        count = int(mask.sum())
+        physics = self.physics
+        n = self.count
+        xMin, xMax = self.level.spawnBand
+        physics.xPos[:n][mask] = self.random.integers(xMin, xMax + 1, count)
+        self.colors[mask] = self.random.integers(0, len(Lander.COLORS), count)
+        self.aim(mask)
+        for name, value in (("yPos", 0), ("fallSpeed", 0), ("horizontalSpeed", 0), ("isThrustOn", False),
+                            ("thrustPower", self.parameters.thrustPower), ("fuelLeft", self.parameters.fuel),
+                            ("horizontalThrustLeftOn", False), ("horizontalThrustRightOn", False),
+                            ("isAlive", True)):
+            getattr(physics, name)[:n][mask] = value
+        self.timeLeft[mask] = self.parameters.roundLength
+        self.done[mask] = False
+
+    def aim(self, mask):
+        """Pick the platform of its color nearest to the drone (any platform if the level has none) as target"""
+        if not len(self.platformRects):
+            return
+        xPos = self.physics.xPos[:self.count][mask]
+        left, top, width = self.platformRects[:, 0], self.platformRects[:, 1], self.platformRects[:, 2]
+        centers = left + (width - self.landerSize[0]) / 2.0
+        distance = numpy.abs(centers[None, :] - xPos[:, None])
+        distance += (self.platformColors[None, :] != self.colors[mask][:, None]) * 1e9
+        nearest = distance.argmin(axis=1)
+        self.targetX[mask] = centers[nearest]
+        self.targetY[mask] = top[nearest]
+
+    def observe(self):
+        """Return observations of all games, one row per game with the columns of OBSERVATIONS"""
+        n = self.count
+        physics = self.physics
+        return numpy.stack((physics.xPos[:n], physics.yPos[:n], physics.fallSpeed[:n], physics.horizontalSpeed[:n],
+                            physics.fuelLeft[:n], self.colors, self.targetX), axis=1)
+
+    def step(self, actions):
+        """Apply actions, advance all running games by one frame and return (observations, rewards, dones, info)
+
+        actions is an (n, 2) array: column 0 non-zero thrusts upwards (needs fuel, see Lander.thrust), column 1 steers
+        -1 left, 1 right, 0 not at all. rewards are 3 or 1 in the frame a drone lands, dones are True for finished
+        games. info holds boolean arrays "landed", "crashed" and "timeUp" of games that ended in this frame.
+        """
+        n = self.count
+        physics = self.physics
+        actions = numpy.asarray(actions)
+        alive = physics.isAlive[:n]
+        # like Simulation.updateTimeLeft a round whose time ran out ends before its drone moves again
+        timeUp = alive & (self.timeLeft <= 0)
+        alive &= ~timeUp
+        self.timeLeft -= self.deltaTime * alive
+        thrust = (actions[:, 0] != 0) & (physics.fuelLeft[:n] > 0)
+        numpy.copyto(physics.isThrustOn[:n], thrust, where=alive)
+        numpy.copyto(physics.horizontalThrustLeftOn[:n], actions[:, 1] < 0, where=alive)
+        numpy.copyto(physics.horizontalThrustRightOn[:n], actions[:, 1] > 0, where=alive)
+        physics.step(self.deltaTime)
+        if self.parameters.sweptCollision:
+            landed, crashed, partner = self.collideSwept(alive)
+        else:
+            landed, crashed, partner = self.collide(alive)
+        finished = landed | crashed | timeUp
+        alive &= ~finished
+        self.done |= finished
+
+        rewards = numpy.where(landed, numpy.where(partner == self.colors, 3, 1), 0)
+        info = {"landed": landed, "crashed": crashed, "timeUp": timeUp}
+        dones = self.done.copy()
+        if self.autoReset and finished.any():
+            self.resetGames(finished)
+        return self.observe(), rewards, dones, info
+
+    def collide(self, alive):
+        """Lander.collide: leaving the screen crashes, then every overlapped platform decides (the last one counts)
+
+        Returns boolean arrays landed and crashed and the color index of the touched platform (-1 for none).
+        """
+        n = self.count
+        physics = self.physics
+        xPos = physics.xPos[:n]
+        yPos = physics.yPos[:n]
+        edge = alive & (yPos > self.drawSize[1])
+        platforms, tests = self.platforms.lastOverlap(xPos, yPos, xPos + self.landerSize[0], yPos + self.landerSize[1])
+        touched = alive & ~edge & (platforms >= 0)
+        partner = numpy.where(touched, self.platformColors[platforms], -1)
+        slow = physics.fallSpeed[:n] <= self.parameters.crashSpeed
+        return touched & slow, edge | (touched & ~slow), partner
+
+    def collideSwept(self, alive):
+        """Simulation.collideSwept for one drone per game: the first contact during the step decides
+
+        Leaving the screen wins a tie, then the platform first in the level. Landing needs the fall speed at the moment
+        of impact to be at most crashSpeed.
+        """
+        n = self.count
+        physics = self.physics
+        deltaTime = physics.deltaTime
+        startX, deltaX, startY = physics.startX[:n], physics.deltaX[:n], physics.startY[:n]
+        curveB, curveC = physics.curveB[:n], physics.curveC[:n]
+        edgeTimes = Impact.firstContact(startX, 0, -numpy.inf, numpy.inf, startY, curveB, curveC, self.drawSize[1],
+                                        numpy.inf, deltaTime)
+        edgeTimes[~alive] = numpy.inf
+        games, platforms = self.platforms.overlapPairs(*Impact.sweptBoxes(physics, self.landerSize))
+        rects = self.platformRects[platforms]
+        times = Impact.firstContact(startX[games] - rects[:, 0], deltaX[games], -self.landerSize[0], rects[:, 2],
+                                    startY[games] - rects[:, 1], curveB[games], curveC[games], -self.landerSize[1],
+                                    rects[:, 3], deltaTime)
+        hits = alive[games] & numpy.isfinite(times)
+        games, platforms, times = games[hits], platforms[hits], times[hits]
+        # earliest contact per game, ties go to the platform first in the level
+        order = numpy.lexsort((platforms, times, games))
+        first = order[numpy.r_[True, games[order][1:] != games[order][:-1]]] if len(order) else order
+        platformTimes = numpy.full(n, numpy.inf)
+        platformTimes[games[first]] = times[first]
+        touchedPlatform = numpy.full(n, -1)
+        touchedPlatform[games[first]] = platforms[first]
+        edge = numpy.isfinite(edgeTimes) & (edgeTimes <= platformTimes)
+        touched = ~edge & (touchedPlatform >= 0)
+        partner = numpy.where(touched, self.platformColors[touchedPlatform], -1)
+        speed = physics.speedAt(numpy.arange(n), numpy.where(touched, platformTimes, 0))
+        slow = speed <= self.parameters.crashSpeed
+        return touched & slow, edge | (touched & ~slow), partner
+
+
+def autopilot(observations, env):
+    """Vectorized version of Sweep.Autopilot, returns actions for observations of env"""
+    xPos, yPos, fallSpeed, horizontalSpeed, fuelLeft, color, targetX = observations.T
+    offset = targetX - xPos
+    steering = numpy.where((offset > 5) & (horizontalSpeed < 20), 1,
+                           numpy.where((offset < -5) & (horizontalSpeed > -20), -1, 0))
+    parameters = env.parameters
+    height = numpy.maximum(env.targetY - yPos - env.landerSize[1], 0)
+    braking = max(parameters.thrustPower - parameters.gravity, 1.0)
+    safeSpeed = numpy.sqrt((0.7 * parameters.crashSpeed) ** 2 + 1.6 * braking * height)
+    return numpy.stack((fallSpeed > safeSpeed, steering), axis=1).astype(int)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    myEnv = BatchEnv(seed=0, autoReset=True)
+    myObservations = myEnv.reset(games)
+    totals = {"landed": 0, "crashed": 0, "timeUp": 0}
+    reward = 0
+    steps = 600
+    start = time.time()
+    for i in range(steps):
+        myObservations, myRewards, myDones, myInfo = myEnv.step(autopilot(myObservations, myEnv))
+        reward += myRewards.sum()
+        for name in totals:
+            totals[name] += myInfo[name].sum()
+    duration = time.time() - start
+    print("%d games x %d steps in %.2f s: %.0f game steps/s" % (games, steps, duration, games * steps / duration))
+    print("landed %(landed)d, crashed %(crashed)d, time up %(timeUp)d" % totals + ", reward %d" % reward)
@@ -0,0 +1,300 @@
+__author__ = 'Simon'
+"""Benchmark suite
+
+Runs scripted scenarios under SDL's dummy video driver, each in a fresh process so peak memory is per scenario.
+Every scenario uses fixed seeds and a fixed time step and reports steps per second, step (frame) time percentiles
+and peak memory. Results are printed or written as JSON and can be compared against a stored baseline:
+
+    python Benchmark.py                                   run all scenarios, print JSON
+    python Benchmark.py drones_1000 render_full           run some scenarios
+    python Benchmark.py --baseline [benchmark_baseline.json]    exit with 1 if a metric regressed beyond its threshold
+    python Benchmark.py --save-baseline [benchmark_baseline.json]
+    python Benchmark.py --repeat 3 drones_1               median of each metric over 3 runs
+
+Baseline runs repeat every scenario BASELINEREPEATS times and compare the medians, single runs vary too much.
+"""
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DELTATIME = 1 / 60.0
+# allowed relative and absolute change of the median over repeats before a metric counts as regression, and whether
+# higher values are better; tail percentiles of short scenarios jump with single scheduler hiccups
+THRESHOLDS = {"stepsPerSecond": (0.35, 0.0, True), "p95Ms": (0.5, 0.1, False), "p99Ms": (1.0, 0.5, False),
+              "peakMemoryMB": (0.2, 2.0, False)}
+# runs per scenario when comparing against or saving a baseline
+BASELINEREPEATS = 5
+BASELINE = "benchmark_baseline.json"
+
+
+def timings(stepTimes):
+    """Return steps per second and percentiles of step times given in seconds"""
+    stepTimes = numpy.array(stepTimes)
+    p50, p95, p99 = numpy.percentile(stepTimes, (50, 95, 99)) * 1000
+    return {"steps": len(stepTimes), "stepsPerSecond": len(stepTimes) / stepTimes.sum(),
+            "p50Ms": p50, "p95Ms": p95, "p99Ms": p99}
+
+
+def peakMemory():
+    """Peak resident memory of this process in MB, None where unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024.0 / 1024.0 if sys.platform == "darwin" else peak / 1024.0
+
+
+def populate(simulation, count, top):
+    """Add count landers stacked in 6 columns from top downwards
+
+    Columns are 50 px apart and all landers fall alike, so they never touch each other and the count stays constant
+    until they reach the bottom edge. The spawn band only has room for a few landers, it is bypassed here.
+    """
+    import Lander
+    for index in range(count):
+        lander = simulation.addLander(10 + 50 * (index % 6), Lander.COLORS[index % 3])
+        lander.yPos = top + 50 * (index // 6)
+    simulation.landerCount = len(simulation.landerList)
+
+
+def runningSimulation(height, seed=0, level=None):
+    import Simulation
+    import enums
+    simulation = Simulation.Simulation(320, height, seed, level=level)
+    simulation.GAMESTATE = enums.GAMESTATE.RUNNING
+    simulation.secondsLeft = 10 ** 9
+    simulation.lives = 10 ** 9
+    return simulation
+
+
+def droneScenario(count, steps, width=None):
+    """Step count landers falling below the platforms
+
+    With width the level is that wide with generated platforms (Level.generate) over all of it, still above the
+    landers, to compare against the classic screen.
+    """
+    def scenario():
+        import Level
+        top = 500
+        height = top + 50 * (count // 6 + 1) + 5000
+        level = None
+        if width is not None:
+            layout = Level.generate(width, 480)
+            level = Level.Level(width, height, layout.platforms, layout.wrapWidth)
+        simulation = runningSimulation(height, level=level)
+        populate(simulation, count, top)
+        stepTimes = list()
+        pairTests = 0
+        for i in range(steps):
+            start = time.perf_counter()
+            simulation.step(DELTATIME)
+            stepTimes.append(time.perf_counter() - start)
+            pairTests += simulation.grid.pairTests
+        result = timings(stepTimes)
+        result.update(drones=simulation.landerCount, platforms=len(simulation.platformList),
+                      pairTestsPerStep=pairTests / float(steps))
+        return result
+    return scenario
+
+
+def spawnStorm(steps=2000, spawnsPerStep=10):
+    """Press space spawnsPerStep times every step, the spawn band stays full"""
+    import Controls
+    simulation = runningSimulation(480)
+    controls = Controls.ControlState()
+    controls.spawns = spawnsPerStep
+    stepTimes = list()
+    drones = 0
+    for i in range(steps):
+        start = time.perf_counter()
+        simulation.step(DELTATIME, controls)
+        stepTimes.append(time.perf_counter() - start)
+        drones += simulation.landerCount
+    result = timings(stepTimes)
+    result.update(meanDrones=drones / float(steps), spawnSuccessRate=simulation.spawner.successRate(),
+                  spawnLatencyUs=simulation.spawner.meanLatency() * 1e6)
+    return result
+
+
+def highscoreScenario(entries=50000, saves=1000):
+    """Import a large highscores.xml, reopen the database and save single scores"""
+    import random
+    import Highscore
+    directory = tempfile.mkdtemp()
+    try:
+        xmlFile = os.path.join(directory, "highscores.xml")
+        rng = random.Random(0)
+        with open(xmlFile, "w") as output:
+            output.write("<Highscore>\n")
+            for index in range(entries):
+                output.write('<Entry no="%d"><Name>P%d</Name><Score>%d</Score></Entry>\n' %
+                             (index + 1, index, rng.randint(0, 999)))
+            output.write("</Highscore>\n")
+        databaseFile = os.path.join(directory, "highscores.db")
+        start = time.perf_counter()
+        highscore = Highscore.Highscore(databaseFile, xmlFile)
+        importMs = (time.perf_counter() - start) * 1000
+        highscore.close()
+        start = time.perf_counter()
+        highscore = Highscore.Highscore(databaseFile, xmlFile)
+        openMs = (time.perf_counter() - start) * 1000
+        stepTimes = list()
+        for i in range(saves):
+            start = time.perf_counter()
+            highscore.insertScore(name="BENCH", score=rng.randint(0, 999))
+            highscore.writeHighscores()
+            stepTimes.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        highscore.insertScores([["BATCH", rng.randint(0, 999)] for i in range(entries)])
+        batchMs = (time.perf_counter() - start) * 1000
+        result = timings(stepTimes)
+        result.update(entries=highscore.count(), importMs=importMs, openMs=openMs, batchInsertMs=batchMs)
+        highscore.close()
+        return result
+    finally:
+        shutil.rmtree(directory)
+
+
+def renderScenario(drones=100, frames=500, full=True):
+    """Draw the running game with drones landers, redrawing the whole screen (full) or only dirty rectangles"""
+    def scenario():
+        import pygame
+        import Game
+        import Highscore
+        game = Game.Game(320, 480, Highscore.Highscore(":memory:"))
+        populate(game.simulation, drones, 0)
+        gameArea = pygame.Surface((320, 460))
+        staticLayer = game.assets.background.copy()
+        game.drawPlatforms(staticLayer)
+        gameArea.blit(staticLayer, (0, 0))
+        layers = ((gameArea, (0, 20)), (game.topBar, (0, 0)))
+        landerRects = list()
+        stepTimes = list()
+        for i in range(frames):
+            start = time.perf_counter()
+            game.simulation.secondsLeft -= DELTATIME
+            if game.drawTopBar():
+                game.renderer.addDirty(game.topBar.get_rect())
+            if full:
+                gameArea.blit(staticLayer, (0, 0))
+                game.renderer.invalidate()
+            for rect in landerRects:
+                gameArea.blit(staticLayer, rect, rect)
+                game.renderer.addDirty(rect.move(0, 20))
+            landerRects = game.drawLanders(gameArea)
+            for rect in landerRects:
+                game.renderer.addDirty(rect.move(0, 20))
+            game.renderer.present(layers)
+            stepTimes.append(time.perf_counter() - start)
+        result = timings(stepTimes)
+        result.update(fullFrames=game.renderer.fullFrames, partialFrames=game.renderer.partialFrames)
+        game.highscore.close()
+        pygame.quit()
+        return result
+    return scenario
+
+
+SCENARIOS = {
+    "drones_1": droneScenario(1, 2000),
+    "drones_100": droneScenario(100, 1000),
+    "drones_1000": droneScenario(1000, 200),
+    "drones_10000": droneScenario(10000, 30),
+    "level_wide": droneScenario(100, 1000, width=200000),
+    "spawn_storm": spawnStorm,
+    "highscore": highscoreScenario,
+    "render_full": renderScenario(full=True),
+    "render_dirty": renderScenario(drones=10, full=False),
+}
+
+
+def runScenario(name, repeats=1):
+    """Run one scenario repeats times, each in a fresh interpreter, and return the median of every metric"""
+    results = list()
+    for i in range(repeats):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--scenario", name],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        results.append(json.loads(output.decode("utf-8").strip().splitlines()[-1]))
+    return medianResult(results)
+
+
+def medianResult(results):
+    """Merge results of repeated runs of a scenario into the median of each numeric metric"""
+    merged = dict(results[0])
+    for key in merged:
+        values = [result[key] for result in results]
+        if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values) \
+                and len(set(values)) > 1:
+            merged[key] = float(numpy.median(values))
+    merged["repeats"] = len(results)
+    return merged
+
+
+def compare(results, baseline):
+    """Return a list of regressions (scenario, metric, baseline value, value)"""
+    regressions = list()
+    for name, result in results["scenarios"].items():
+        reference = baseline["scenarios"].get(name)
+        if reference is None:
+            continue
+        for metric, (relative, absolute, higherIsBetter) in THRESHOLDS.items():
+            if result.get(metric) is None or reference.get(metric) is None:
+                continue
+            if higherIsBetter:
+                regressed = result[metric] < reference[metric] * (1 - relative) - absolute
+            else:
+                regressed = result[metric] > reference[metric] * (1 + relative) + absolute
+            if regressed:
+                regressions.append((name, metric, reference[metric], result[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CargoLander benchmark suite")
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run (default all): %s" % ", ".join(SCENARIOS))
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE,
+                        help="compare against this results file (default %s)" % BASELINE)
+    parser.add_argument("--save-baseline", dest="saveBaseline", nargs="?", const=BASELINE,
+                        help="store results as new baseline (default %s)" % BASELINE)
+    parser.add_argument("--repeat", type=int, help="runs per scenario, metrics are their median (default 1, %d with "
+                                                   "--baseline or --save-baseline)" % BASELINEREPEATS)
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.scenario is not None:
+        myResult = SCENARIOS[arguments.scenario]()
+        myResult["peakMemoryMB"] = peakMemory()
+        print(json.dumps(myResult))
+        sys.exit(0)
+    myRepeats = arguments.repeat or (BASELINEREPEATS if arguments.baseline or arguments.saveBaseline else 1)
+    myResults = {"python": platform.python_version(), "platform": platform.platform(), "scenarios": dict()}
+    for myName in arguments.scenarios or sorted(SCENARIOS):
+        myResult = myResults["scenarios"][myName] = runScenario(myName, myRepeats)
+        sys.stderr.write("%-13s %10.0f steps/s  p95 %7.3f ms\n" % (myName, myResult["stepsPerSecond"],
+                                                                    myResult["p95Ms"]))
+    text = json.dumps(myResults, indent=2, sort_keys=True)
+    if arguments.output:
+        with open(arguments.output, "w") as outputFile:
+            outputFile.write(text + "\n")
+    else:
+        print(text)
+    if arguments.saveBaseline:
+        with open(arguments.saveBaseline, "w") as baselineFile:
+            baselineFile.write(text + "\n")
+    if arguments.baseline:
+        with open(arguments.baseline) as baselineFile:
+            myRegressions = compare(myResults, json.load(baselineFile))
+        for myRegression in myRegressions:
+            sys.stderr.write("REGRESSION %s %s: baseline %.3f, now %.3f\n" % myRegression)
+        sys.exit(1 if myRegressions else 0)
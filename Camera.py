@@ -0,0 +1,65 @@
+__author__ = 'Simon'
+"""View on a world larger than the window
+
+Camera holds the top left corner of the part of the world shown in the game area. Drawing only visits drones and
+platforms overlapping the view, so a frame costs the same on a wide level as on the classic screen.
+"""
+
+
+class Camera(object):
+    def __init__(self, viewSize, worldSize, scrollSpeed=400.0, windowSize=None):
+        """viewSize is the size of the game area, the view never leaves the world of worldSize
+
+        The view only scrolls along axes on which the world is larger than windowSize (default viewSize): a world
+        of the window's size stays put, the game area below the top bar shows all but its bottom rows as before.
+        scrollSpeed in px/s while a scroll direction is set.
+        """
+        if windowSize is None:
+            windowSize = viewSize
+        self.viewSize = viewSize
+        self.worldSize = worldSize
+        self.scrollSpeed = scrollSpeed
+        # largest offset per axis
+        self.limit = tuple(max(world - view, 0) if world > window else 0
+                           for world, view, window in zip(worldSize, viewSize, windowSize))
+        self.xPos = 0.0
+        self.yPos = 0.0
+        # -1, 0 or 1 per axis, set by the scroll keys
+        self.direction = [0, 0]
+
+    @property
+    def offset(self):
+        """Whole pixels to subtract from world coordinates to get game area coordinates"""
+        return int(self.xPos), int(self.yPos)
+
+    def moveTo(self, xPos, yPos):
+        """Move the top left corner of the view to (xPos, yPos), return True if the offset changed"""
+        offset = self.offset
+        self.xPos = min(max(xPos, 0.0), self.limit[0])
+        self.yPos = min(max(yPos, 0.0), self.limit[1])
+        return self.offset != offset
+
+    def centerOn(self, xPos, yPos):
+        return self.moveTo(xPos - self.viewSize[0] / 2.0, yPos - self.viewSize[1] / 2.0)
+
+    def scroll(self, deltaTime):
+        """Move in the scroll direction for deltaTime seconds, return True if the offset changed"""
+        if not any(self.direction):
+            return False
+        distance = self.scrollSpeed * deltaTime
+        return self.moveTo(self.xPos + self.direction[0] * distance, self.yPos + self.direction[1] * distance)
+
+    def toWorld(self, position):
+        """Return world coordinates of a position in the game area, e.g. a click"""
+        offset = self.offset
+        return position[0] + offset[0], position[1] + offset[1]
+
+    def viewBox(self):
+        """Return the visible part of the world as (inclusive) box x1, y1, x2, y2"""
+        offset = self.offset
+        return offset[0], offset[1], offset[0] + self.viewSize[0], offset[1] + self.viewSize[1]
+
+    def visible(self, xPos, yPos, size):
+        """Return a mask of the boxes of size at arrays xPos, yPos that overlap the view"""
+        x1, y1, x2, y2 = self.viewBox()
+        return (xPos + size[0] >= x1) & (xPos <= x2) & (yPos + size[1] >= y1) & (yPos <= y2)
@@ -0,0 +1,46 @@
+__author__ = 'Simon'
+"""Per-frame control state
+
+Game collects all input events of a frame into one ControlState. The simulation applies it once per step to all
+living landers at once, so input cost does not depend on the number of drones and a frame's input can be recorded.
+"""
+
+LEFT = "LEFT"
+RIGHT = "RIGHT"
+RELEASE = "RELEASE"
+
+
+class ControlState(object):
+    """Input of one frame
+
+    thrust is True/False for the last press/release of UP, None if UP did not change.
+    horizontal is LEFT/RIGHT for the last pressed arrow, RELEASE if an arrow was released, None if unchanged.
+    clicks are mouse press positions in world coordinates, release is True if a mouse button was released.
+    spawns counts SPACE presses.
+    started and restarted note that the game started or restarted the round this frame, Replay needs them.
+    """
+
+    def __init__(self):
+        self.thrust = None
+        self.horizontal = None
+        self.clicks = list()
+        self.release = False
+        self.spawns = 0
+        self.started = False
+        self.restarted = False
+
+    def isEmpty(self):
+        return (self.thrust is None and self.horizontal is None and not self.clicks and not self.release
+                and self.spawns == 0 and not self.started and not self.restarted)
+
+    def merge(self, later):
+        """Add the input of a later frame, e.g. when several rendered frames feed one simulation step"""
+        if later.thrust is not None:
+            self.thrust = later.thrust
+        if later.horizontal is not None:
+            self.horizontal = later.horizontal
+        self.clicks.extend(later.clicks)
+        self.release = self.release or later.release
+        self.spawns += later.spawns
+        self.started = self.started or later.started
+        self.restarted = self.restarted or later.restarted
@@ -0,0 +1,266 @@
+__author__ = 'Simon'
+"""Event-driven simulation core for headless runs and fast-forward replays
+
+With the "exact" integrator (see Physics) a drone's motion between inputs is known in closed form, so frames in
+which nothing can happen need not be stepped one by one. EventScheduler keeps the next event of every drone in a
+priority queue:
+
+    contact  lower bound on the time the drone may touch a platform, another drone, the bottom edge or wrap around
+    fuel     the drone's fuel runs out, its acceleration changes
+    timer    the round time runs out
+
+and jumps over all frames before the earliest event in one physics step. Frames close to an event are stepped one
+at a time with the simulation's swept collision, on the same frame grid as fixed-step integration, so landings,
+crashes, spawns and scores equal those of Simulation.step(frameTime) up to rounding.
+
+Contact bounds are conservative: speeds can at most grow by the drone's acceleration and horizontal speeds never
+exceed max(|horizontalSpeed|, 2 * thrustPower), so a gap (in x and y) cannot close faster than that.
+
+    python EventSim.py [drones] [rounds]     benchmark against fixed-step integration
+"""
+
+import heapq
+import numpy
+import Controls
+import enums
+
+CONTACT = "contact"
+FUEL = "fuel"
+TIMER = "timer"
+
+
+def closingTime(gap, speed, acceleration):
+    """Return a lower bound on the time to close gap >= 0 moving at |speed| growing by acceleration at most"""
+    speed = numpy.abs(speed)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        time = 2 * gap / (speed + numpy.sqrt(speed * speed + 2 * acceleration * gap))
+    return numpy.where(gap > 0, time, 0.0)
+
+
+def boxGap(low1, high1, low2, high2):
+    """Distance between the ranges [low1, high1] and [low2, high2] along one axis, 0 if they touch"""
+    return numpy.maximum(numpy.maximum(low2 - high1, low1 - high2), 0)
+
+
+class EventScheduler(object):
+    """Advance a Simulation by inputs and jump between events instead of stepping every frame
+
+    The simulation needs Parameters(integrator="exact", sweptCollision=True).
+    """
+
+    def __init__(self, simulation, frameTime=1 / 60.0):
+        parameters = simulation.parameters
+        if parameters.integrator != "exact" or not parameters.sweptCollision:
+            raise ValueError("EventScheduler needs the exact integrator and swept collision")
+        self.simulation = simulation
+        self.frameTime = frameTime
+        # left, top, right and bottom edges of the platforms, which never move
+        self.platformBoxes = numpy.array([(platform.xPos, platform.yPos, platform.xPos + platform.drawSize[0],
+                                           platform.yPos + platform.drawSize[1])
+                                          for platform in simulation.platformList], dtype=float).reshape(-1, 4).T
+        self.frame = 0
+        self.queue = list()
+        self.versions = dict()
+        self.counter = 0
+        self.steps = 0
+        self.jumps = 0
+
+    def push(self, time, kind, lander=None):
+        self.counter += 1
+        heapq.heappush(self.queue, (time, self.counter, kind, lander, self.versions.get(lander)))
+
+    def schedule(self, landers=None):
+        """(Re-)compute the events of landers (default: all living landers and the timer)"""
+        simulation = self.simulation
+        now = self.frame * self.frameTime
+        if landers is None:
+            self.queue = list()
+            self.versions = dict()
+            landers = simulation.landerList
+            self.push(now + max(simulation.secondsLeft, 0), TIMER)
+        landers = [lander for lander in landers if lander.isAlive]
+        if not landers:
+            return
+        for lander in landers:
+            self.versions[lander] = self.versions.get(lander, 0) + 1
+        bounds = self.contactBounds([lander.slot for lander in landers])
+        physics = simulation.physics
+        for lander, bound in zip(landers, bounds):
+            self.push(now + bound, CONTACT, lander)
+            if physics.isThrustOn[lander.slot]:
+                self.push(now + physics.fuelLeft[lander.slot], FUEL, lander)
+
+    def contactBounds(self, slots):
+        """Return for each slot a lower bound on the time until its drone can touch anything or wrap around"""
+        simulation = self.simulation
+        physics = simulation.physics
+        others = numpy.array([lander.slot for lander in simulation.landerList if lander.isAlive], dtype=int)
+        slots = numpy.array(slots, dtype=int)
+        width, height = 40, 40
+        thrust = physics.thrustPower * physics.isThrustOn
+        acceleration = numpy.abs(physics.gravity - thrust)
+        steering = physics.thrustPower * (physics.horizontalThrustRightOn | physics.horizontalThrustLeftOn)
+        horizontalBound = numpy.maximum(numpy.abs(physics.horizontalSpeed), 2 * steering)
+
+        x = physics.xPos[slots]
+        y = physics.yPos[slots]
+        fallSpeed = physics.fallSpeed[slots]
+        accelerationBound = acceleration[slots]
+        speedBound = horizontalBound[slots]
+        # bottom edge and wrapping around at physics.wrapWidth
+        bounds = closingTime(numpy.maximum(simulation.drawSize[1] - y, 0), fallSpeed, accelerationBound)
+        bounds = numpy.minimum(bounds, closingTime(numpy.minimum(x, physics.wrapWidth - x), speedBound, 0))
+        # platforms do not move, all of them at once
+        if self.platformBoxes.shape[1]:
+            left, top, right, bottom = self.platformBoxes
+            gapY = boxGap(y[:, None], y[:, None] + height, top, bottom)
+            gapX = boxGap(x[:, None], x[:, None] + width, left, right)
+            times = numpy.maximum(closingTime(gapY, fallSpeed[:, None], accelerationBound[:, None]),
+                                  closingTime(gapX, speedBound[:, None], 0))
+            bounds = numpy.minimum(bounds, times.min(axis=1))
+        # other drones, both may move towards each other
+        if len(others):
+            gapY = boxGap(y[:, None], y[:, None] + height, physics.yPos[others], physics.yPos[others] + height)
+            gapX = boxGap(x[:, None], x[:, None] + width, physics.xPos[others], physics.xPos[others] + width)
+            times = numpy.maximum(
+                closingTime(gapY, numpy.abs(fallSpeed[:, None]) + numpy.abs(physics.fallSpeed[others]),
+                            accelerationBound[:, None] + acceleration[others]),
+                closingTime(gapX, speedBound[:, None] + horizontalBound[others], 0))
+            times[slots[:, None] == others] = numpy.inf
+            bounds = numpy.minimum(bounds, times.min(axis=1))
+        return bounds
+
+    def nextEvent(self):
+        """Return time and kind of the earliest valid event, dropping outdated ones"""
+        while self.queue:
+            time, counter, kind, lander, version = self.queue[0]
+            if lander is None or (lander.isAlive and self.versions.get(lander) == version):
+                return time, kind
+            heapq.heappop(self.queue)
+        return numpy.inf, None
+
+    def advance(self, duration, controls=None):
+        """Apply controls (Controls.ControlState) and advance by duration (rounded to whole frames)
+
+        Returns False once the round is over.
+        """
+        simulation = self.simulation
+        frames = int(round(duration / self.frameTime))
+        end = self.frame + frames
+        if frames and controls is not None and not controls.isEmpty():
+            self.stepFrame(controls)
+        self.schedule()
+        while self.frame < end and simulation.GAMESTATE == enums.GAMESTATE.RUNNING:
+            time, kind = self.nextEvent()
+            # whole frames until the event, the frame containing it is stepped on its own
+            count = min(int((time - self.frame * self.frameTime) / self.frameTime + 1e-9), end - self.frame)
+            if count > 1 and simulation.landerCount > 0:
+                self.jump(count)
+            else:
+                landers = set(simulation.landerList)
+                self.stepFrame()
+                if kind != CONTACT or not landers.issuperset(simulation.landerList):
+                    # fuel ran out (acceleration changed), timer or new drones: all bounds change
+                    self.schedule()
+                    continue
+            self.scheduleDue()
+        return simulation.GAMESTATE == enums.GAMESTATE.RUNNING
+
+    def scheduleDue(self):
+        """Recompute the contact bounds that were reached"""
+        now = self.frame * self.frameTime
+        due = list()
+        while self.queue and self.queue[0][0] <= now + 1e-9:
+            time, counter, kind, lander, version = heapq.heappop(self.queue)
+            if kind == FUEL or kind == TIMER:
+                self.schedule()
+                return
+            if lander.isAlive and self.versions.get(lander) == version:
+                due.append(lander)
+        self.schedule(due)
+
+    def stepFrame(self, controls=None):
+        """One frame of fixed-step integration with spawning, swept collision and scoring"""
+        self.simulation.step(self.frameTime, controls)
+        self.frame += 1
+        self.steps += 1
+
+    def jump(self, count):
+        """Advance count frames in one physics step, nothing can touch or spawn in between"""
+        simulation = self.simulation
+        deltaTime = count * self.frameTime
+        simulation.updateTimeLeft(deltaTime)
+        simulation.physics.step(deltaTime)
+        simulation.spawner.invalidate()
+        for lander in simulation.landerList:
+            lander.calcBoundingBox()
+        self.frame += count
+        self.jumps += 1
+
+
+def scriptedInputs(seed, drones, windows, windowLength=1.0):
+    """Return (duration, ControlState) per input window: spawns at first, then random thrust and steering"""
+    import random
+    rng = random.Random(seed)
+    inputs = list()
+    for index in range(windows):
+        controls = Controls.ControlState()
+        if index == 0:
+            controls.spawns = drones
+        controls.thrust = rng.random() < 0.4
+        controls.horizontal = rng.choice((Controls.LEFT, Controls.RIGHT, Controls.RELEASE))
+        inputs.append((windowLength, controls))
+    return inputs
+
+
+def playFixed(simulation, inputs, frameTime=1 / 60.0):
+    """Reference: step every frame, controls apply in the first frame of their window. Return number of steps"""
+    steps = 0
+    for duration, controls in inputs:
+        for frame in range(int(round(duration / frameTime))):
+            if simulation.GAMESTATE != enums.GAMESTATE.RUNNING:
+                return steps
+            simulation.step(frameTime, controls if frame == 0 else None)
+            steps += 1
+    return steps
+
+
+def playEvents(simulation, inputs, frameTime=1 / 60.0):
+    """Same as playFixed with an EventScheduler, return number of physics steps (frames and jumps)"""
+    scheduler = EventScheduler(simulation, frameTime)
+    for duration, controls in inputs:
+        if not scheduler.advance(duration, controls):
+            break
+    return scheduler.steps + scheduler.jumps
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import Simulation
+    drones = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    myParameters = Simulation.Parameters(integrator="exact", sweptCollision=True)
+    seconds = {playFixed: 0.0, playEvents: 0.0}
+    steps = {playFixed: 0, playEvents: 0}
+    mismatches = 0
+    worstTime = 0.0
+    for seed in range(rounds):
+        myInputs = scriptedInputs(seed, drones, 80)
+        results = dict()
+        for play in (playFixed, playEvents):
+            mySimulation = Simulation.Simulation(320, 480, seed, myParameters)
+            mySimulation.GAMESTATE = enums.GAMESTATE.RUNNING
+            start = time.time()
+            steps[play] += play(mySimulation, myInputs)
+            seconds[play] += time.time() - start
+            results[play] = (mySimulation.score, mySimulation.crashed, mySimulation.landed, mySimulation.secondsLeft)
+        if results[playFixed][:3] != results[playEvents][:3]:
+            mismatches += 1
+        worstTime = max(worstTime, abs(results[playFixed][3] - results[playEvents][3]))
+    print("%d rounds, %d drones spawned per round" % (rounds, drones))
+    print("fixed step:   %6d steps in %.3f s" % (steps[playFixed], seconds[playFixed]))
+    print("event driven: %6d steps in %.3f s, %.1fx faster" % (steps[playEvents], seconds[playEvents],
+                                                               seconds[playFixed] / seconds[playEvents]))
+    print("rounds with different score/crashed/landed: %d, largest timer difference %.2g s" % (mismatches,
+                                                                                            worstTime))
@@ -5,36 +5,100 @@ This game is inspired by the classical moonlander and reassesses the topic with
 The goal is to safely land color-coded drones on the corresponding platform/doormat.
 """
 
-import Lander
-import Platform
+import threading
+import Simulation
 import Assets
+import Camera
+import Controls
 import Highscore
+import Lander
+import NetSync
+import Profiler
+import Renderer
+import Replay
+import SaveState
+import SimThread
+import Sprites
+import UI
 import enums
 import pygame
 from pygame.locals import *
 
+LANDERSIZE = (40, 40)
+# key: (axis, direction) of the camera
+SCROLLKEYS = {K_a: (0, -1), K_d: (0, 1), K_w: (1, -1), K_s: (1, 1)}
+
 
 class Game(object):
     """Create Game object to host main loop and highscores"""
 
-    def __init__(self, x, y):
-        self.landerList = list()
-        self.landerCount = 0
-        self.platformList = list()
-        self.score = 0
-        self.lives = 4
-        self.crashed = 0
-        self.GAMESTATE = enums.GAMESTATE.STARTSCREEN
+    def __init__(self, x, y, highscore=None, profiler=None, recordFile=None, simRate=None, fps=60, broadcast=None,
+                 world=None, broadcastHost="127.0.0.1"):
+        """highscore defaults to the local highscore file, pass a Leaderboard.RemoteHighscore to share scores
+
+        profiler is an enabled Profiler.FrameProfiler to record from the start, F3 enables it any time. Recorded frames
+        are dumped on exit, to Profiler.DUMPFILE if the profiler has no dumpFile.
+        recordFile is written by a Replay.Recorder to replay the session later.
+        With simRate the simulation runs simRate steps per second on a SimThread.SimulationThread and frames only
+        draw its snapshots, else every frame steps the simulation. fps limits the frame rate.
+        broadcast is a port to stream the game to spectators on (NetSync.py watch), on broadcastHost only, the stream
+        is unauthenticated: "0.0.0.0" opens it to the network.
+        world is the size of a level larger than the window (see Level.forSize), the view scrolls with W, A, S, D.
+        """
+        if world is None:
+            world = (x, y)
+        self.simulation = Simulation.Simulation(world[0], world[1])
         self.drawSize = (x, y)
+        self.camera = Camera.Camera((x, y - 20), self.simulation.drawSize, windowSize=self.drawSize)
         pygame.init()
         self.screen = pygame.display.set_mode(self.drawSize)
+        self.renderer = Renderer.DirtyRenderer(self.screen)
         self.landingLog = list()
-        self.secondsLeft = 75
-        self.topBar = None
+        self.textCache = UI.TextCache()
+        self.scoreLabel = UI.Label(self.textCache, 17, '%03d', (255, 255, 255), (0, 0, 0))
+        self.timeLabel = UI.Label(self.textCache, 17, '%02d', (255, 255, 255), (0, 0, 0))
+        self.livesShown = None
+        self.lifeIcon = pygame.Surface((5, 5))
+        self.lifeIcon.fill((255, 0, 0))
+        self.topBar = pygame.Surface((x, 20))
+        self.startShade = UI.makeShade((x, y - 20), (0, 0, 0), 200)
+        self.gameOverShade = UI.makeShade((x, y - 20), (50, 50, 50), 64)
         self.assets = Assets.Assets()
+        self.sprites = Sprites.SpriteCache(self.assets)
         self.playerName = ""
-        self.highscore = Highscore.Highscore("highscores.xml")
+        self.textInput = False
+        self.highscore = highscore
+        if highscore is None:
+            self.highscore = Highscore.Highscore("highscores.db", "highscores.xml", background=True)
         self.scored = False
+        self.profiler = profiler
+        if profiler is None:
+            self.profiler = Profiler.FrameProfiler()
+        self.showProfile = False
+        self.profileOverlay = None
+        self.recorder = None
+        if recordFile is not None:
+            self.recorder = Replay.Recorder(recordFile, self.simulation)
+        self.savedState = None
+        self.pacer = SimThread.FramePacer(fps)
+        self.syncServer = None
+        if broadcast is not None:
+            self.syncServer = NetSync.SyncServer(self.simulation.drawSize, broadcast, host=broadcastHost)
+        self.lock = threading.RLock()
+        self.simThread = None
+        if simRate:
+            self.simThread = SimThread.SimulationThread(self.simulation, simRate, self.lock, self.recorder)
+        else:
+            # the simulation phases are only part of the frame when it is stepped by the frame
+            self.simulation.profiler = self.profiler
+
+    @property
+    def GAMESTATE(self):
+        return self.simulation.GAMESTATE
+
+    @GAMESTATE.setter
+    def GAMESTATE(self, state):
+        self.simulation.GAMESTATE = state
 
     def run(self):
         """Initialise and run game loop"""
@@ -43,150 +107,231 @@ class Game(object):
         pygame.mouse.set_visible(True)
         cursor = self.cursor_crosshair()
         pygame.mouse.set_cursor((24, 24), (12, 12), *cursor)
-        self.initPlatforms()
         self.drawTopBar()
         gameArea = pygame.Surface((self.drawSize[0], self.drawSize[1] - 20))
+        # background with the platforms in view, used to restore the areas below moving landers
+        staticLayer = self.assets.background.copy()
+        self.drawPlatforms(staticLayer)
+        layers = ((gameArea, (0, 20)), (self.topBar, (0, 0)))
+        landerRects = list()
+        overlayKey = None
+        publishedTick = None
+        if self.simThread is not None:
+            self.simThread.start()
         while True:
-            deltaTime = clock.tick(60) / 1000.0
-            self.processInput()
+            deltaMs = self.pacer.tick(clock)
+            deltaTime = deltaMs / 1000.0
+            self.profiler.beginFrame()
+            with self.lock:
+                controls = self.processInput()
+                if self.simThread is not None:
+                    self.simThread.post(controls)
             if self.GAMESTATE == enums.GAMESTATE.QUIT:
+                if self.simThread is not None:
+                    self.simThread.stop()
+                if self.syncServer is not None:
+                    self.syncServer.close()
+                if self.recorder is not None:
+                    self.recorder.close(self.simulation)
+                self.highscore.close()
+                if self.profiler.dumpFile is not None or self.profiler.frames:
+                    # frames recorded after F3 are kept as well, without --profile in the default file
+                    self.profiler.dump(self.profiler.dumpFile or Profiler.DUMPFILE)
                 return
-            gameArea.blit(self.assets.background, (0, 0))
-            self.drawPlatforms(gameArea)
-            self.updateTimeLeft(deltaTime)
-            self.drawTopBar()
-            if self.GAMESTATE == enums.GAMESTATE.RUNNING:
-                self.updateLanders(gameArea, deltaTime)
-            if self.GAMESTATE == enums.GAMESTATE.GAMEOVER:
-                self.gameOverScreen(gameArea, "GAME OVER")
-            if self.GAMESTATE == enums.GAMESTATE.TIMEUP:
-                self.gameOverScreen(gameArea, "TIME IS UP")
-            if self.GAMESTATE == enums.GAMESTATE.STARTSCREEN:
-                self.startScreen(gameArea)
-            if self.GAMESTATE == enums.GAMESTATE.HELPSCREEN:
-                self.helpScreen(gameArea)
-            self.screen.blit(gameArea, (0, 20))
-            self.screen.blit(self.topBar, (0, 0))
-            pygame.display.flip()
-            self.checkGameOver()
-
-
-    def updateLanders(self, screen, deltaTime):
-        """Analyse list of lander objects
-
-         Loop through all landers known to the game and do:
-            * call x.update() on landers if x.isAlive
-            * calculate score on landers if x.hasScored
+            if self.simThread is None:
+                if self.recorder is not None:
+                    self.recorder.record(self.simulation, deltaMs, controls)
+                self.profiler.mark("input")
+                self.simulation.step(deltaTime, controls)
+                snapshot = SimThread.takeSnapshot(self.simulation, self.pacer.frames)
+                xPos, yPos = snapshot.xPos, snapshot.yPos
+            else:
+                self.profiler.mark("input")
+                snapshot, xPos, yPos = self.simThread.view()
+            if self.syncServer is not None and snapshot.tick != publishedTick:
+                self.syncServer.publish(snapshot)
+                publishedTick = snapshot.tick
+            if self.drawTopBar(snapshot):
+                self.renderer.addDirty(self.topBar.get_rect())
+            self.profiler.mark("topbar")
+            if snapshot.state == enums.GAMESTATE.RUNNING:
+                if self.camera.scroll(deltaTime):
+                    staticLayer.blit(self.assets.background, (0, 0))
+                    self.drawPlatforms(staticLayer)
+                    landerRects = list()
+                    gameArea.blit(staticLayer, (0, 0))
+                    self.renderer.invalidate()
+                if overlayKey is not None:
+                    overlayKey = None
+                    gameArea.blit(staticLayer, (0, 0))
+                    self.renderer.invalidate()
+                for rect in landerRects:
+                    gameArea.blit(staticLayer, rect, rect)
+                    self.renderer.addDirty(rect.move(0, 20))
+                landerRects = self.drawLanders(gameArea, snapshot, xPos, yPos)
+                if self.showProfile:
+                    landerRects.append(self.drawProfile(gameArea, snapshot))
+                for rect in landerRects:
+                    self.renderer.addDirty(rect.move(0, 20))
+            elif self.overlayKey() != overlayKey:
+                # screens are static, redraw only if their content changed
+                with self.lock:
+                    overlayKey = self.overlayKey()
+                    landerRects = list()
+                    gameArea.blit(staticLayer, (0, 0))
+                    if self.GAMESTATE == enums.GAMESTATE.GAMEOVER:
+                        self.gameOverScreen(gameArea, "GAME OVER")
+                    if self.GAMESTATE == enums.GAMESTATE.TIMEUP:
+                        self.gameOverScreen(gameArea, "TIME IS UP")
+                    if self.GAMESTATE == enums.GAMESTATE.STARTSCREEN:
+                        self.startScreen(gameArea)
+                    if self.GAMESTATE == enums.GAMESTATE.HELPSCREEN:
+                        self.helpScreen(gameArea)
+                self.renderer.invalidate()
+            self.profiler.mark("draw")
+            self.renderer.present(layers)
+            self.profiler.mark("present")
+            self.profiler.endFrame(len(snapshot.serials), snapshot.pairTests)
+
+    def overlayKey(self):
+        """Return everything the start, help and game over screens depend on"""
+        return self.GAMESTATE, self.playerName, self.simulation.score, self.highscore.version
+
+    def drawLanders(self, screen, snapshot=None, xPos=None, yPos=None):
+        """Draw the landers of snapshot (default: the simulation now) in view and return the rectangles drawn to
+
+        xPos and yPos replace the positions of the snapshot, e.g. interpolated ones.
         """
-        newScore = 0
-        newCount = 0
-        noCrashed = 0
-        self.spawnLander()
-        for lander in self.landerList:
-            if lander.isAlive:
-                newCount += 1
-                lander.update(deltaTime, screen, self.assets, self.landingLog)
-            elif lander.hasScored:
-                if lander.color == lander.collisionPartner.color:
-                    newScore += 3
-                else:
-                    newScore += 1
-            elif lander.hasCrashed:
-                noCrashed += 1
-        self.score = newScore
-        self.crashed = noCrashed
-        self.landerCount = newCount
+        if snapshot is None:
+            snapshot = SimThread.takeSnapshot(self.simulation)
+        if xPos is None:
+            xPos, yPos = snapshot.xPos, snapshot.yPos
+        parameters = self.simulation.parameters
+        rects = list()
+        ticks = pygame.time.get_ticks()
+        visible = self.camera.visible(xPos, yPos, LANDERSIZE)
+        offsetX, offsetY = self.camera.offset
+        colors = [color for color, shown in zip(snapshot.colors, visible.tolist()) if shown]
+        for x, y, slot, fallSpeed, fuelLeft, color in zip(xPos[visible].tolist(), yPos[visible].tolist(),
+                                                          snapshot.slots[visible].tolist(),
+                                                          snapshot.fallSpeed[visible].tolist(),
+                                                          snapshot.fuelLeft[visible].tolist(), colors):
+            fuelHeight, fuelBarColor = Lander.fuelBar(fuelLeft / parameters.fuel)
+            sprite = self.sprites.get(color, fallSpeed >= parameters.crashSpeed, self.sprites.rotorFrame(ticks, slot),
+                                      fuelHeight, fuelBarColor)
+            x -= offsetX
+            y -= offsetY
+            screen.blit(sprite, (x, y))
+            rects.append(pygame.Rect(int(x), int(y), sprite.get_width() + 1, sprite.get_height() + 1))
+        return rects
+
+    def drawProfile(self, screen, snapshot):
+        """Draw frame time percentiles of the profiler, the text is refreshed every 30 frames"""
+        if self.profileOverlay is None or self.profiler.frames % 30 == 0:
+            lines = ("frame p50 %.1f p95 %.1f p99 %.1f ms" % tuple(self.profiler.percentiles()),
+                     "drones %d pairs %d" % (len(snapshot.serials), snapshot.pairTests),
+                     "frames late %d dropped %d" % (self.pacer.lateFrames, self.pacer.droppedFrames))
+            if self.simThread is not None:
+                lines += ("steps late %d dropped %d" % (self.simThread.lateTicks, self.simThread.droppedTicks),)
+            font = self.textCache.font(14)
+            self.profileOverlay = UI.makeShade((190, 14 * len(lines) + 4), (0, 0, 0), 160)
+            for index, line in enumerate(lines):
+                self.profileOverlay.blit(font.render(line, True, (255, 255, 255)), (3, 2 + 14 * index))
+        return screen.blit(self.profileOverlay, (self.drawSize[0] - self.profileOverlay.get_width(), 0))
 
     def drawPlatforms(self, surface):
-        """Draw static landing platforms"""
-        for platform in self.platformList:
-            platform.drawPlatform(surface)
+        """Draw the static landing platforms in view"""
+        offset = self.camera.offset
+        for platform in self.simulation.grid.static.query(*self.camera.viewBox()):
+            platform.drawPlatform(surface, offset)
 
     def processInput(self):
-        """Handle event input (key and mouse)
+        """Handle event input (key and mouse) and return the frame's Controls.ControlState
 
         Space spawns a new lander per press.
         Escape quits the game
+        F5 saves the state, F9 goes back to it
+        W, A, S, D scroll the view on levels larger than the window
         Keydown events trigger thrust for either up or left/right
         Keyup events trigger unthrust for either up or left/right
         Click events call lander.clicked to check collision and trigger thrust on a single lander while clicked
+        Lander controls are only collected here, the simulation applies them to all landers at once.
         """
+        controls = Controls.ControlState()
+        if self.GAMESTATE in (enums.GAMESTATE.STARTSCREEN, enums.GAMESTATE.HELPSCREEN) and not self.textInput:
+            pygame.key.set_repeat(500, 30)
+            pygame.key.set_mods(0)
+            self.textInput = True
         for event in pygame.event.get():
             if self.GAMESTATE not in (enums.GAMESTATE.STARTSCREEN, enums.GAMESTATE.HELPSCREEN):
                 if event.type == pygame.QUIT:
                     self.GAMESTATE = enums.GAMESTATE.QUIT
+                if event.type == pygame.VIDEOEXPOSE:
+                    self.renderer.invalidate()
                 # KEYDOWN and KEYUP are handled separately to allow press and hold actions
                 if event.type == pygame.KEYDOWN:
+                    if event.key == K_F3:
+                        self.showProfile = not self.showProfile
+                        self.profiler.enabled = self.profiler.enabled or self.showProfile
+                        self.renderer.invalidate()
+                    if event.key == K_F5:
+                        self.savedState = SaveState.capture(self.simulation)
+                    if event.key == K_F9:
+                        self.loadState()
                     if event.key == K_f:
                         pygame.display.toggle_fullscreen()
+                        self.renderer.invalidate()
                     if event.key == K_ESCAPE:
                         self.GAMESTATE = enums.GAMESTATE.QUIT
                     if event.key == K_r and (self.GAMESTATE == enums.GAMESTATE.GAMEOVER or self.GAMESTATE == enums.GAMESTATE.TIMEUP):
                         self.restart()
+                        controls.restarted = True
                     if event.key == K_UP:
-                        for l in self.landerList:
-                            l.thrust()
+                        controls.thrust = True
                     if event.key == K_SPACE:
-                        self.spawnLander(forced=True)
+                        controls.spawns += 1
                     if event.key == K_LEFT:
-                        for l in self.landerList:
-                            l.horizontalThrust("LEFT")
+                        controls.horizontal = Controls.LEFT
                     if event.key == K_RIGHT:
-                        for l in self.landerList:
-                            l.horizontalThrust("RIGHT")
+                        controls.horizontal = Controls.RIGHT
+                    if event.key in SCROLLKEYS:
+                        axis, direction = SCROLLKEYS[event.key]
+                        self.camera.direction[axis] = direction
                 # KEYDOWN and KEYUP are handled seperately to allow press and hold actions
                 if event.type == pygame.KEYUP:
                     if event.key == K_UP:
-                        for l in self.landerList:
-                            l.unthrust()
+                        controls.thrust = False
                     if event.key == K_LEFT or event.key == K_RIGHT:
-                        for l in self.landerList:
-                            l.horizontalUnthrust()
+                        controls.horizontal = Controls.RELEASE
+                    if event.key in SCROLLKEYS:
+                        axis, direction = SCROLLKEYS[event.key]
+                        if self.camera.direction[axis] == direction:
+                            self.camera.direction[axis] = 0
 
                 if event.type == pygame.MOUSEBUTTONDOWN:
-                    for l in self.landerList:
-                        l.clicked(event.pos)
+                    # the game area is drawn below the top bar, clicks are passed on in world coordinates
+                    position = (event.pos[0], event.pos[1] - self.topBar.get_height())
+                    controls.clicks.append(self.camera.toWorld(position))
                 if event.type == pygame.MOUSEBUTTONUP:
-                    for l in self.landerList:
-                        l.unthrust()
+                    controls.release = True
             else:
-                pygame.key.set_repeat(500, 30)
-                pygame.key.set_mods(0)
                 if event.type == pygame.KEYDOWN:
                     if event.key == K_RETURN:
                         self.GAMESTATE = enums.GAMESTATE.RUNNING
+                        self.textInput = False
+                        controls.started = True
                     elif event.key == K_ESCAPE:
                         self.GAMESTATE = enums.GAMESTATE.QUIT
                     elif event.key == K_BACKSPACE:
                         self.playerName = self.playerName[:-1]
-                    elif event.key in range(97, 123):
-                        self.playerName += chr(event.key)
+                    elif K_a <= event.key <= K_z:
+                        self.playerName += chr(event.key).upper()
                     elif event.key == K_TAB:
                         self.setHelp(True)
                 if event.type == pygame.KEYUP:
                     if event.key == K_TAB:
                         self.setHelp(False)
-                self.playerName = self.playerName.upper()
-
-
-    def spawnLander(self, forced=False):
-        """Create and add a Lander object to landerList
-
-            * Whenever there is no lander left on screen
-            * Or when there is forced spawning (e.g. space bar hit)
-        """
-        if self.landerCount == 0 or forced:
-            myLander = Lander.Lander(self, self.landerList, self.platformList)
-            self.landerList.append(myLander)
-
-    def initPlatforms(self):
-        """Create and add platforms to platformList"""
-        myPlatform = Platform.Platform((255, 0, 0), 10)
-        self.platformList.append(myPlatform)
-        myPlatform = Platform.Platform((255, 255, 0), 115)
-        self.platformList.append(myPlatform)
-        myPlatform = Platform.Platform((0, 0, 255), 220)
-        self.platformList.append(myPlatform)
+        return controls
 
     def cursor_crosshair(self):
         """Return compiled ASCII art mouse cursor"""
@@ -218,14 +363,16 @@ class Game(object):
         )
         return pygame.cursors.compile(strings, black='.',white='X',xor='o')
 
+    def blitText(self, screen, size, text, color=(255, 255, 255, 0), **placement):
+        """Blit cached text, placement is passed to get_rect (e.g. centerx=160, y=2)"""
+        text = self.textCache.render(size, text, color)
+        screen.blit(text, text.get_rect(**placement))
+
     def showScore(self, screen):
         """Display current score in upper-right corner.
 
         'No one will ever need more than 3-digits for a scoreboard' - Simon Schliesky March 5th 2014"""
-        # Create a font
-        font = pygame.font.Font(None, 17)
-        text = font.render('%03d' % self.score, True, (255,
-        255, 255), (0, 0, 0))
+        text = self.scoreLabel.surface
         textRect = text.get_rect()
         textRect.x = self.drawSize[0] - textRect.width - 10
         textRect.y = 2
@@ -233,165 +380,91 @@ class Game(object):
 
     def showTime(self, screen):
         """Display current time in the center of topbar."""
-        # Create a font
-        font = pygame.font.Font(None, 17)
-        text = font.render('%02d' % self.secondsLeft, True, (255, 255, 255), (0, 0, 0))
+        text = self.timeLabel.surface
         textRect = text.get_rect()
         textRect.centerx = (self.drawSize[0] - textRect.width) / 2
         textRect.y = 2
         screen.blit(text, textRect)
 
     def showLives(self, screen):
-        for x in range(0, self.lives - self.crashed):
-            icon = pygame.Surface((5, 5))
-            icon.fill((255, 0, 0))
-            screen.blit(icon, (5 + 10*x, 2))
-
-    def checkGameOver(self):
-        if self.lives <= self.crashed and self.GAMESTATE != enums.GAMESTATE.QUIT:
-            self.GAMESTATE = enums.GAMESTATE.GAMEOVER
+        for x in range(0, self.livesShown):
+            screen.blit(self.lifeIcon, (5 + 10*x, 2))
 
     def gameOverScreen(self, screen, text):
-        shade = pygame.Surface(screen.get_size())
-        shade.fill((50, 50, 50))
-        shade.set_alpha(64)
+        screen.blit(self.gameOverShade, (0, 0))
         # GAMEOVER
-        font = pygame.font.Font(None, 32)
-        text = font.render(text, True, (255, 255, 255))
-        textRect = text.get_rect()
-        textRect.centerx = self.drawSize[0]/2
-        textRect.centery = self.drawSize[1]/2 - 50
-        screen.blit(shade, (0, 0))
-        screen.blit(text, textRect)
-        self.highscore.drawHighscore(screen)
+        self.blitText(screen, 32, text, (255, 255, 255), centerx=self.drawSize[0]/2, centery=self.drawSize[1]/2 - 50)
+        self.highscore.drawHighscore(screen, self.textCache)
         # Score
-        if not self.scored and self.score > 0:
-            self.highscore.insertScore(name=self.playerName, score=self.score)
+        if not self.scored and self.simulation.score > 0:
+            self.highscore.insertScore(name=self.playerName, score=self.simulation.score)
             self.highscore.writeHighscores()
             self.scored = True
-        font = pygame.font.Font(None, 20)
-        text = font.render('%03d' % self.score, True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.centerx = self.drawSize[0]/2
-        textRect.centery = self.drawSize[1]/2 + 50
-        screen.blit(text, textRect)
-        text = font.render('Press R for new round', True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.centerx = self.drawSize[0]/2
-        textRect.centery = 25
-        screen.blit(text, textRect)
+        self.blitText(screen, 20, '%03d' % self.simulation.score,
+                      centerx=self.drawSize[0]/2, centery=self.drawSize[1]/2 + 50)
+        self.blitText(screen, 20, 'Press R for new round', centerx=self.drawSize[0]/2, centery=25)
+
+    def loadState(self):
+        """Go back to the state saved with F5, not while recording (a replay could not follow)"""
+        if self.savedState is not None and self.recorder is None:
+            SaveState.restore(self.simulation, self.savedState)
+            self.renderer.invalidate()
 
     def restart(self):
-        self.landerList = list()
-        self.landerCount = 0
-        self.platformList = list()
-        self.score = 0
-        self.lives = 4
-        self.crashed = 0
-        self.secondsLeft = 90
-        self.GAMESTATE = enums.GAMESTATE.STARTSCREEN
-        self.initPlatforms()
-
-    def drawTopBar(self):
-        topBar = pygame.Surface((self.drawSize[0], 20))
-        topBar.fill((0, 0, 0))
-        self.showScore(topBar)
-        self.showLives(topBar)
-        self.showTime(topBar)
-        self.topBar = topBar
-
-    def updateTimeLeft(self, deltatime):
-        if self.GAMESTATE == enums.GAMESTATE.RUNNING:
-            if self.secondsLeft <= 0:
-                self.GAMESTATE = enums.GAMESTATE.TIMEUP
-            else:
-                self.secondsLeft -= deltatime
+        if self.recorder is not None:
+            self.recorder.roundEnded(self.simulation)
+        self.simulation.restart()
+
+    def drawTopBar(self, snapshot=None):
+        """Redraw top bar only if score, lives or the full seconds of snapshot (default: the simulation now) changed
+
+        Return True if it was redrawn.
+        """
+        if snapshot is None:
+            snapshot = SimThread.takeSnapshot(self.simulation)
+        lives = snapshot.lives
+        changed = self.scoreLabel.update(snapshot.score)
+        changed = self.timeLabel.update(snapshot.secondsLeft) or changed
+        if lives != self.livesShown:
+            self.livesShown = lives
+            changed = True
+        if changed:
+            self.topBar.fill((0, 0, 0))
+            self.showScore(self.topBar)
+            self.showLives(self.topBar)
+            self.showTime(self.topBar)
+        return changed
 
     def startScreen(self, screen):
         """Draw start screen and ask for name
         """
-        shade = pygame.Surface(screen.get_size())
-        shade.fill((0, 0, 0))
-        shade.set_alpha(200)
-        screen.blit(shade, (0, 0))
-        font = pygame.font.Font(None, 20)
-        text = font.render(self.playerName, True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.centerx = self.drawSize[0]/2
-        textRect.centery = self.drawSize[1]/2 + 35
-        screen.blit(text, textRect)
-
-        text = font.render("Input name", True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.centerx = self.drawSize[0]/2
-        textRect.centery = self.drawSize[1]/2 + 50
-        screen.blit(text, textRect)
-        text = font.render("Press Enter", True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.centerx = self.drawSize[0]/2
-        textRect.centery = self.drawSize[1]/2 + 80
-        screen.blit(text, textRect)
-        text = font.render("to start game", True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.centerx = self.drawSize[0]/2
-        textRect.centery = self.drawSize[1]/2 + 96
-        screen.blit(text, textRect)
-
-        text = font.render("Press and hold tab", True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.centerx = self.drawSize[0]/2
-        textRect.centery = self.drawSize[1]/2 - 80
-        screen.blit(text, textRect)
-        text = font.render("for help", True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.centerx = self.drawSize[0]/2
-        textRect.centery = self.drawSize[1]/2 - 62
-        screen.blit(text, textRect)
+        screen.blit(self.startShade, (0, 0))
+        centerx = self.drawSize[0]/2
+        centery = self.drawSize[1]/2
+        self.blitText(screen, 20, self.playerName, centerx=centerx, centery=centery + 35)
+        self.blitText(screen, 20, "Input name", centerx=centerx, centery=centery + 50)
+        self.blitText(screen, 20, "Press Enter", centerx=centerx, centery=centery + 80)
+        self.blitText(screen, 20, "to start game", centerx=centerx, centery=centery + 96)
+        self.blitText(screen, 20, "Press and hold tab", centerx=centerx, centery=centery - 80)
+        self.blitText(screen, 20, "for help", centerx=centerx, centery=centery - 62)
 
     def helpScreen(self, screen):
         """Draw help screen and ask for name
         """
-        shade = pygame.Surface(screen.get_size())
-        shade.fill((0, 0, 0))
-        shade.set_alpha(200)
-        screen.blit(shade, (0, 0))
-        font = pygame.font.Font(None, 20)
-
+        screen.blit(self.startShade, (0, 0))
         screen.blit(self.assets.upArrow, (5, 20))
-        text = font.render("Accelerate drones upwards", True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.x = 60
-        textRect.centery = 30
-        screen.blit(text, textRect)
-
+        self.blitText(screen, 20, "Accelerate drones upwards", x=60, centery=30)
         screen.blit(self.assets.leftArrow, (5, 50))
         screen.blit(self.assets.rightArrow, (30, 50))
-        text = font.render("Steer left/right", True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.x = 60
-        textRect.centery = 60
-        screen.blit(text, textRect)
-
+        self.blitText(screen, 20, "Steer left/right", x=60, centery=60)
         screen.blit(self.assets.space, (5, 80))
-        text = font.render("Spawn another drone", True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.x = 60
-        textRect.centery = 90
-        screen.blit(text, textRect)
-
+        self.blitText(screen, 20, "Spawn another drone", x=60, centery=90)
         screen.blit(self.assets.ESC, (5, 110))
-        text = font.render("Quit game", True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.x = 60
-        textRect.centery = 120
-        screen.blit(text, textRect)
-
+        self.blitText(screen, 20, "Quit game", x=60, centery=120)
         screen.blit(self.assets.mouse, (5, 140))
-        text = font.render("Accelerate single drone", True, (255, 255, 255, 0))
-        textRect = text.get_rect()
-        textRect.x = 60
-        textRect.centery = 150
-        screen.blit(text, textRect)
+        self.blitText(screen, 20, "Accelerate single drone", x=60, centery=150)
+        self.blitText(screen, 20, "W A S D", x=5, centery=180)
+        self.blitText(screen, 20, "Scroll wide worlds", x=60, centery=180)
 
     def setHelp(self, activate):
         if activate:
@@ -401,7 +474,57 @@ class Game(object):
 
 
 if __name__ == "__main__":
+    import sys
     xdim = 320
     ydim = 480
-    myGame = Game(xdim, ydim)
-    myGame.run()
\ No newline at end of file
+    arguments = sys.argv[1:]
+    myProfiler = None
+    myRecordFile = None
+    if "--record" in arguments:
+        # write the session to a replay log, see Replay.py
+        myRecordFile = arguments.pop(arguments.index("--record") + 1)
+        arguments.remove("--record")
+    mySimRate = None
+    myFps = 60
+    if "--sim-rate" in arguments:
+        # step the simulation on its own thread, see SimThread.py
+        mySimRate = int(arguments.pop(arguments.index("--sim-rate") + 1))
+        arguments.remove("--sim-rate")
+    if "--fps" in arguments:
+        myFps = int(arguments.pop(arguments.index("--fps") + 1))
+        arguments.remove("--fps")
+    myWorld = None
+    if "--world" in arguments:
+        # a wider level, e.g. --world 4000x480, see Level.py
+        myWorld = tuple(int(size) for size in arguments.pop(arguments.index("--world") + 1).split("x"))
+        arguments.remove("--world")
+    myBroadcast = None
+    myBroadcastHost = "127.0.0.1"
+    if "--broadcast" in arguments:
+        # stream to spectators, see NetSync.py: --broadcast 47475 on this machine, --broadcast 0.0.0.0:47475 to all
+        myBroadcastHost, separator, myPort = arguments.pop(arguments.index("--broadcast") + 1).rpartition(":")
+        myBroadcastHost = myBroadcastHost or "127.0.0.1"
+        myBroadcast = int(myPort)
+        arguments.remove("--broadcast")
+    if "--profile" in arguments:
+        # record from the start and write profile.csv on exit
+        arguments.remove("--profile")
+        myProfiler = Profiler.FrameProfiler(enabled=True, dumpFile=Profiler.DUMPFILE)
+    myHighscore = None
+    if arguments:
+        # shared leaderboard at host:port
+        import Leaderboard
+        host, port = arguments[0].rsplit(":", 1)
+        myHighscore = Leaderboard.RemoteHighscore((host, int(port)),
+                                                  Highscore.Highscore("highscores.db", "highscores.xml", background=True))
+    myGame = Game(xdim, ydim, myHighscore, myProfiler, myRecordFile, mySimRate, myFps, myBroadcast, myWorld,
+                  myBroadcastHost)
+    # a slow start is easy to tell apart: "png" decoded the images and rebuilt assets/cache, "cache" read the atlas
+    print("assets from %s in %.1f ms" % (myGame.assets.source, myGame.assets.loadTime * 1000))
+    try:
+        myGame.run()
+    except Exception:
+        # keep the state that led to the error, SaveState.load reads it back
+        with open("crash.clstate", "wb") as crashFile:
+            crashFile.write(SaveState.capture(myGame.simulation))
+        raise
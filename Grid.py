@@ -0,0 +1,229 @@
+__author__ = 'Simon'
+"""Uniform grid broad phase for collision detection
+
+Landers are sorted into grid cells once per frame. Platforms never move, they are indexed once in a StaticIndex
+sorted by x, so large levels with many platforms cost no more per frame than the classic screen.
+overlaps and lastOverlap answer for all landers at once from position arrays (fixed-step collision). The cell-sorted
+arrays overlaps builds are kept, queryRect answers clicks and drag selections from them in O(columns log n + k).
+rebuild and candidates hand single objects to the swept collision of Simulation.collideSwept.
+"""
+
+import bisect
+import numpy
+
+# StaticIndex.lastOverlap tests up to this many objects without bisecting
+FEWOBJECTS = 8
+
+
+class StaticIndex(object):
+    """Objects that never move, sorted by their left edge for box queries in O(log n + k)"""
+
+    def __init__(self, objects=()):
+        self.objects = list(objects)
+        self.order = sorted(range(len(self.objects)), key=lambda index: self.objects[index].xPos)
+        self.lefts = [self.objects[index].xPos for index in self.order]
+        self.maxWidth = max([object.drawSize[0] for object in self.objects] or [0])
+        # boxes x1, y1, x2, y2 in the sorted order, living objects only (static objects stay alive)
+        boxes = [self.box(self.objects[index]) for index in self.order]
+        self.boxes = numpy.array(boxes, dtype=float).reshape(-1, 4).T
+        self.sortedOrder = numpy.array(self.order, dtype=int)
+        self.alive = numpy.array([self.objects[index].isAlive for index in self.order], dtype=bool)
+
+    def box(self, object):
+        return object.xPos, object.yPos, object.xPos + object.drawSize[0], object.yPos + object.drawSize[1]
+
+    def query(self, x1, y1, x2, y2):
+        """Return living objects overlapping the (inclusive) box from (x1, y1) to (x2, y2) in their given order"""
+        start = bisect.bisect_left(self.lefts, x1 - self.maxWidth)
+        end = bisect.bisect_right(self.lefts, x2)
+        found = list()
+        for index in self.order[start:end]:
+            object = self.objects[index]
+            if object.xPos + object.drawSize[0] >= x1 and object.yPos <= y2 \
+                    and object.yPos + object.drawSize[1] >= y1 and object.isAlive:
+                found.append(index)
+        found.sort()
+        return [self.objects[index] for index in found]
+
+    def lastOverlap(self, x1, y1, x2, y2):
+        """Return for arrays of (inclusive) boxes the index of the last object overlapping each (-1 for none)
+
+        "Last" is in the order the objects were given, like the last hit of a scan over them.
+        Also returns the number of box tests.
+        """
+        result = numpy.full(len(x1), -1, dtype=int)
+        if not self.objects or not len(x1):
+            return result, 0
+        left, top, right, bottom = self.boxes
+        if len(self.objects) <= FEWOBJECTS:
+            # testing all boxes against one object after the other is faster than bisecting
+            for index, object in enumerate(self.objects):
+                if object.isAlive:
+                    x, y, objectX2, objectY2 = self.box(object)
+                    result[(objectX2 >= x1) & (x <= x2) & (y <= y2) & (objectY2 >= y1)] = index
+            return result, len(x1) * len(self.objects)
+        start = numpy.searchsorted(left, x1 - self.maxWidth, "left")
+        end = numpy.searchsorted(left, x2, "right")
+        counts = end - start
+        for offset in range(int(counts.max())):
+            rows = numpy.flatnonzero(counts > offset)
+            position = start[rows] + offset
+            hit = self.alive[position] & (right[position] >= x1[rows]) & (top[position] <= y2[rows]) \
+                & (bottom[position] >= y1[rows])
+            rows = rows[hit]
+            result[rows] = numpy.maximum(result[rows], self.sortedOrder[position[hit]])
+        return result, int(counts.sum())
+
+    def overlapPairs(self, x1, y1, x2, y2):
+        """Return for arrays of (inclusive) boxes the pairs (box index, object index) of all overlaps as two arrays"""
+        rows = [numpy.zeros(0, dtype=int)]
+        found = [numpy.zeros(0, dtype=int)]
+        if self.objects and len(x1):
+            left, top, right, bottom = self.boxes
+            start = numpy.searchsorted(left, x1 - self.maxWidth, "left")
+            end = numpy.searchsorted(left, x2, "right")
+            counts = end - start
+            for offset in range(int(counts.max())):
+                candidates = numpy.flatnonzero(counts > offset)
+                position = start[candidates] + offset
+                hit = self.alive[position] & (right[position] >= x1[candidates]) \
+                    & (top[position] <= y2[candidates]) & (bottom[position] >= y1[candidates])
+                rows.append(candidates[hit])
+                found.append(self.sortedOrder[position[hit]])
+        return numpy.concatenate(rows), numpy.concatenate(found)
+
+
+class CollisionGrid(object):
+    def __init__(self, cellSize=48):
+        self.cellSize = cellSize
+        self.cells = dict()
+        self.objects = list()
+        self.pairTests = 0
+        self.static = StaticIndex()
+        # boxes sorted by cell (see index), None until indexed
+        self.indexed = None
+
+    def setStatic(self, objects):
+        """Index objects that never move (platforms), candidates returns them after the moving objects"""
+        self.static = StaticIndex(objects)
+
+    def cellRange(self, x1, y1, x2, y2):
+        """Return all cell keys touched by the (inclusive) box from (x1, y1) to (x2, y2)"""
+        size = self.cellSize
+        for cx in range(int(x1 // size), int(x2 // size) + 1):
+            for cy in range(int(y1 // size), int(y2 // size) + 1):
+                yield (cx, cy)
+
+    def rebuild(self, objects, boxes=None):
+        """Insert all living moving objects (landers) and reset the pair test counter
+
+        Candidates are returned in the order of objects followed by the static objects, so results equal a linear
+        scan over objects + static objects.
+        boxes optionally gives (x1, y1, x2, y2) per object instead of its drawn box, e.g. the area swept in a frame.
+        """
+        self.cells.clear()
+        self.objects = objects
+        self.pairTests = 0
+        self.indexed = None
+        for index, object in enumerate(objects):
+            if object.isAlive:
+                box = boxes[index] if boxes is not None else self.box(object)
+                for key in self.cellRange(*box):
+                    cell = self.cells.get(key)
+                    if cell is None:
+                        self.cells[key] = [index]
+                    else:
+                        cell.append(index)
+
+    def box(self, object):
+        return object.xPos, object.yPos, object.xPos + object.drawSize[0], object.yPos + object.drawSize[1]
+
+    def index(self, xPos, yPos, size):
+        """Sort the boxes of size at arrays xPos, yPos by the cell of their top left corner for overlaps and queryRect
+
+        Cell keys are column * height + row, so the cells of one column are consecutive keys.
+        """
+        reach = int(numpy.ceil(float(max(size)) / self.cellSize))
+        cellX = numpy.floor(xPos / self.cellSize).astype(numpy.int64)
+        cellY = numpy.floor(yPos / self.cellSize).astype(numpy.int64)
+        minX = int(cellX.min()) if len(xPos) else 0
+        # rows are padded by reach so neighbours never spill into the next column
+        minY = (int(cellY.min()) if len(yPos) else 0) - reach
+        height = (int(cellY.max()) - minY if len(yPos) else 0) + reach + 1
+        keys = (cellX - minX) * height + cellY - minY
+        order = numpy.argsort(keys, kind="stable")
+        self.indexed = (xPos, yPos, size, reach, minX, minY, height, keys, order, keys[order])
+
+    def overlaps(self, xPos, yPos, size):
+        """Return index arrays first < second of all pairs of (inclusive) boxes of size at xPos, yPos that overlap
+
+        Boxes are indexed by the cell of their top left corner, each box only meets the boxes of the cells in reach.
+        The number of pairs tested becomes pairTests.
+        """
+        self.pairTests = 0
+        self.index(xPos, yPos, size)
+        empty = numpy.zeros(0, dtype=int)
+        if len(xPos) < 2:
+            return empty, empty
+        reach, minX, minY, height, keys, order, sortedKeys = self.indexed[3:]
+        firsts = list()
+        seconds = list()
+        for offsetX in range(-reach, reach + 1):
+            for offsetY in range(-reach, reach + 1):
+                neighbours = keys + offsetX * height + offsetY
+                start = numpy.searchsorted(sortedKeys, neighbours, "left")
+                counts = numpy.searchsorted(sortedKeys, neighbours, "right") - start
+                self.pairTests += int(counts.sum())
+                for offset in range(int(counts.max())):
+                    first = numpy.flatnonzero(counts > offset)
+                    second = order[start[first] + offset]
+                    keep = (first < second) & (numpy.abs(xPos[first] - xPos[second]) <= size[0]) \
+                        & (numpy.abs(yPos[first] - yPos[second]) <= size[1])
+                    firsts.append(first[keep])
+                    seconds.append(second[keep])
+        # every pair was met from both sides, every box met itself
+        self.pairTests = (self.pairTests - len(xPos)) // 2
+        return numpy.concatenate(firsts), numpy.concatenate(seconds)
+
+    def queryRect(self, x1, y1, x2, y2):
+        """Return the sorted indices of the indexed boxes overlapping the (inclusive) rectangle, e.g. a click point
+
+        Only the columns whose top left corners can reach the rectangle are searched.
+        """
+        if self.indexed is None:
+            raise ValueError("nothing indexed, call index or overlaps first")
+        xPos, yPos, size, reach, minX, minY, height, keys, order, sortedKeys = self.indexed
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        if not len(xPos):
+            return numpy.zeros(0, dtype=int)
+        firstColumn = max(int((x1 - size[0]) // self.cellSize) - minX, 0)
+        lastColumn = min(int(x2 // self.cellSize) - minX, int(sortedKeys[-1]) // height)
+        firstRow = max(int((y1 - size[1]) // self.cellSize) - minY, 0)
+        lastRow = min(int(y2 // self.cellSize) - minY, height - 1)
+        if lastColumn < firstColumn or lastRow < firstRow:
+            return numpy.zeros(0, dtype=int)
+        columns = numpy.arange(firstColumn, lastColumn + 1) * height
+        starts = numpy.searchsorted(sortedKeys, columns + firstRow, "left").tolist()
+        ends = numpy.searchsorted(sortedKeys, columns + lastRow, "right").tolist()
+        found = numpy.concatenate([order[start:end] for start, end in zip(starts, ends)])
+        inside = (xPos[found] <= x2) & (xPos[found] + size[0] >= x1) & (yPos[found] <= y2) \
+            & (yPos[found] + size[1] >= y1)
+        return numpy.sort(found[inside])
+
+    def candidates(self, lander, box=None):
+        """Return objects near lander (or near box) and static objects overlapping it, count them as pair tests
+
+        lander itself is excluded.
+        """
+        found = set()
+        if box is None:
+            box = self.box(lander)
+        for key in self.cellRange(*box):
+            cell = self.cells.get(key)
+            if cell is not None:
+                found.update(cell)
+        result = [self.objects[index] for index in sorted(found) if self.objects[index] is not lander]
+        result.extend(self.static.query(*box))
+        self.pairTests += len(result)
+        return result
@@ -1,18 +1,67 @@
-from optparse import _parse_int
-
 __author__ = 'Simon'
+"""Highscore storage
+
+Scores are kept in a SQLite database with an index on the score, so inserts cost O(log n) and the top entries or
+the rank of a score are read without loading the whole table. Every write is one transaction, a crash leaves the
+previous state intact. Old highscores.xml files are imported once.
+With background=True new scores are written by a HighscoreWriter thread, so a slow disk never stalls the game loop.
+"""
 
 import xml.etree.ElementTree as et
 import os.path
-import pygame
+import queue
+import sqlite3
+import threading
+import time
+import UI
+
+TOPCOUNT = 5
+
+
+def insertIntoTop(scores, scorePair):
+    """Insert scorePair into the sorted top list scores (behind equal scores) and cut it to TOPCOUNT entries"""
+    index = 0
+    while index < len(scores) and scores[index][1] >= scorePair[1]:
+        index += 1
+    scores.insert(index, list(scorePair))
+    del scores[TOPCOUNT:]
+
+
+def drawScores(screen, scores, textCache=None):
+    """Draw top 5 scores, pass the game's UI.TextCache to reuse rendered entries between frames"""
+    if textCache is None:
+        textCache = UI.TextCache()
+    for index, score in enumerate(scores[:5]):
+        text = textCache.render(32, "%03d" % score[1])
+        screen.blit(text, (45, 50 + 20 * index))
+        text = textCache.render(32, "%s" % score[0])
+        screen.blit(text, (130, 50 + 20 * index))
+
 
 class Highscore(object):
-    def __init__(self, highscoreFile):
+    def __init__(self, highscoreFile, importFile=None, background=False):
+        """highscoreFile is the database, importFile an optional highscores.xml from older versions"""
         self.file = highscoreFile
+        self.connection = sqlite3.connect(highscoreFile)
         self.scores = list()
-        self.initHighscores()
+        self.version = 0
+        self.initHighscores(importFile)
+        self.writer = None
+        if background:
+            self.writer = HighscoreWriter(highscoreFile)
+            self.writer.start()
 
-    def initHighscores(self):
+    def initHighscores(self, importFile):
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS scores "
+                                    "(id INTEGER PRIMARY KEY, name TEXT, score INTEGER)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS scoreIndex ON scores (score DESC, id)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS imports (file TEXT PRIMARY KEY)")
+        isEmpty = self.connection.execute("SELECT COUNT(*) FROM (SELECT 1 FROM scores LIMIT 1)").fetchone()[0] == 0
+        if importFile is not None and os.path.exists(importFile):
+            self.importXml(importFile)
+        elif isEmpty:
+            self.importEntries(et.fromstring(self.dummyScores()))
         self.readHighscores()
 
     def dummyScores(self):
@@ -33,69 +82,141 @@ class Highscore(object):
         </Highscore>
         """
 
+    def importXml(self, xmlFile):
+        """Import entries of an old highscore XML file, each file is only imported once"""
+        key = os.path.abspath(xmlFile)
+        if self.connection.execute("SELECT 1 FROM imports WHERE file = ?", (key,)).fetchone() is not None:
+            return False
+        self.importEntries(et.parse(xmlFile).getroot(), key)
+        return True
+
+    def importEntries(self, xmlRoot, key=None):
+        entries = ((en.find("Name").text, int(en.find("Score").text)) for en in xmlRoot.iter("Entry"))
+        with self.connection:
+            self.connection.executemany("INSERT INTO scores (name, score) VALUES (?, ?)", entries)
+            if key is not None:
+                self.connection.execute("INSERT INTO imports (file) VALUES (?)", (key,))
+
     def readHighscores(self):
-        if os.path.exists(self.file):
-            xmlRoot = et.parse(self.file)
-        else:
-            xmlRoot = et.fromstring(self.dummyScores())
-        for en in xmlRoot.iter("Entry"):
-            self.scores.append(self.xmlStringToNameScorePair(et.tostring(en)))
+        """Refresh the in-memory top entries used for drawing"""
+        self.scores = self.topScores(TOPCOUNT)
+        self.version += 1
+
+    def topScores(self, count):
+        """Return best count [name, score] pairs, equal scores in order of insertion"""
+        cursor = self.connection.execute("SELECT name, score FROM scores ORDER BY score DESC, id LIMIT ?", (count,))
+        return [[name, score] for name, score in cursor]
 
-    def xmlStringToNameScorePair(self, entry):
-        en = et.fromstring(entry)
-        score = _parse_int(en.find("Score").text)
-        name = en.find("Name").text
-        return [name, score]
+    def rank(self, score):
+        """Return the rank (1 = best) a new entry with score would get"""
+        return self.connection.execute("SELECT COUNT(*) FROM scores WHERE score >= ?", (score,)).fetchone()[0] + 1
 
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
 
     def writeHighscores(self):
-        xmlScores = et.Element("Highscore")
-        count = 1
-        for score in self.scores:
-            entry = et.Element("Entry")
-            entry.set("no", "%d" % count)
-            count += 1
-            xmlScores.append(entry)
-            child = et.Element("Name")
-            child.text = score[0]
-            entry.append(child)
-            child = et.Element("Score")
-            child.text = str(score[1])
-            entry.append(child)
-        f = open(self.file, "w")
-        f.write(et.tostring(xmlScores))
-        f.close()
+        """Commit inserted scores, SQLite writes the transaction atomically
+
+        In background mode this only asks the writer thread to skip its coalescing delay and returns at once.
+        """
+        if self.writer is not None:
+            self.writer.flush()
+        else:
+            self.connection.commit()
 
     def insertScore(self, **kwargs):
         scorePair = kwargs.get("scorePair", None)
-        if scorePair != None:
-            self.scores.append(scorePair)
-        else:
+        if scorePair is None:
             scorePair = [kwargs.get("name", ""), kwargs.get("score", -1)]
-            self.scores.append(scorePair)
-        self.scores = sorted(self.scores, key=lambda x: x[1], reverse=True)
-
-    def drawHighscore(self, screen):
-        for index, score in enumerate(self.scores):
-            if index < 5:
-                font = pygame.font.Font(None, 32)
-                text = font.render("%03d" % score[1], True, (255, 255, 255))
-                textRect = text.get_rect()
-                textRect.x = 45
-                textRect.y = 50 + 20 * index
-                screen.blit(text, textRect)
-                text = font.render("%s" % score[0], True, (255, 255, 255))
-                textRect = text.get_rect()
-                textRect.x = 130
-                textRect.y = 50 + 20 * index
-                screen.blit(text, textRect)
+        if self.writer is not None:
+            self.writer.submit(scorePair)
+            # show the pending entry right away
+            insertIntoTop(self.scores, scorePair)
+            self.version += 1
+        else:
+            self.connection.execute("INSERT INTO scores (name, score) VALUES (?, ?)", tuple(scorePair))
+            self.readHighscores()
+
+    def insertScores(self, scorePairs):
+        """Insert and commit many [name, score] pairs in one transaction"""
+        with self.connection:
+            self.connection.executemany("INSERT INTO scores (name, score) VALUES (?, ?)",
+                                        [tuple(scorePair) for scorePair in scorePairs])
+        self.readHighscores()
+
+    def close(self):
+        """Write all pending scores (waits for the writer thread) and close the database"""
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+        self.connection.commit()
+        self.connection.close()
+
+    def drawHighscore(self, screen, textCache=None):
+        drawScores(screen, self.scores, textCache)
+
+
+class HighscoreWriter(threading.Thread):
+    """Thread writing submitted scores to the database
+
+    Submissions arriving within coalesceTime are written together in one transaction.
+    """
+    FLUSH = "FLUSH"
+    STOP = "STOP"
+
+    def __init__(self, highscoreFile, coalesceTime=0.5):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.file = highscoreFile
+        self.coalesceTime = coalesceTime
+        self.queue = queue.Queue()
+        self.written = 0
+        self.batches = 0
+
+    def submit(self, scorePair):
+        self.queue.put(tuple(scorePair))
+
+    def flush(self):
+        self.queue.put(self.FLUSH)
+
+    def stop(self):
+        """Write everything still queued and end the thread"""
+        self.queue.put(self.STOP)
+        self.join()
+
+    def run(self):
+        connection = sqlite3.connect(self.file)
+        running = True
+        while running:
+            batch = list()
+            item = self.queue.get()
+            deadline = time.time() + self.coalesceTime
+            while True:
+                if item == self.STOP:
+                    running = False
+                    break
+                if item == self.FLUSH:
+                    break
+                batch.append(item)
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+            if batch:
+                with connection:
+                    connection.executemany("INSERT INTO scores (name, score) VALUES (?, ?)", batch)
+                self.written += len(batch)
+                self.batches += 1
+        connection.close()
 
 
 if __name__ == "__main__":
-    myHigh = Highscore("test.xml")
+    import random
+    import time
+    myHigh = Highscore(":memory:")
+    start = time.time()
+    for i in range(100000):
+        myHigh.insertScore(name="ach", score=random.randint(0, 999))
     myHigh.writeHighscores()
-    myHigh.drawHighscore("")
-    myHigh.insertScore(name="ach", score=9)
-    myHigh.drawHighscore("")
-    myHigh.insertScore(scorePair=["ach", 19])
-    myHigh.drawHighscore("")
+    print("%d entries, %.1f us per insert" % (myHigh.count(), (time.time() - start) * 1e6 / 100000))
+    print("top: %s, rank of 500: %d" % (myHigh.scores, myHigh.rank(500)))
@@ -0,0 +1,97 @@
+__author__ = 'Simon'
+"""Swept collision (time of impact)
+
+A discrete overlap test after moving misses a fast drone jumping past a 5 px platform or another drone within one long
+frame. Here each box moves during the frame along x(t) = x + deltaX * t / deltaTime and
+y(t) = y + curveB * t + curveC * t * t (see Physics), and firstContact returns the earliest time at which two boxes
+touch (edges included, like Lander.checkCollision). All functions work on NumPy arrays of pairs.
+"""
+
+import numpy
+
+EPSILON = 1e-9
+
+
+def linearRoots(start, slope, level):
+    """Return t with start + slope * t = level (inf where slope is 0)"""
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return numpy.where(slope != 0, (level - start) / numpy.where(slope != 0, slope, 1), numpy.inf)
+
+
+def quadraticRoots(start, b, c, level):
+    """Return both t with start + b * t + c * t * t = level (inf where there is none)"""
+    constant = start - level
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        discriminant = b * b - 4 * c * constant
+        root = numpy.sqrt(numpy.maximum(discriminant, 0))
+        # numerically stable form, falls back to the linear root when c is 0
+        q = -0.5 * (b + numpy.where(b >= 0, root, -root))
+        first = numpy.where(c != 0, q / numpy.where(c != 0, c, 1), linearRoots(constant, b, 0))
+        second = numpy.where(q != 0, constant / numpy.where(q != 0, q, 1), numpy.inf)
+        second = numpy.where(c != 0, second, numpy.inf)
+    valid = discriminant >= 0
+    return numpy.where(valid, first, numpy.inf), numpy.where(valid, second, numpy.inf)
+
+
+def firstContact(x, deltaX, lowX, highX, y, curveB, curveC, lowY, highY, deltaTime):
+    """Return the earliest t in [0, deltaTime] with lowX <= x(t) <= highX and lowY <= y(t) <= highY, inf if none
+
+    x(t) = x + deltaX * t / deltaTime and y(t) = y + curveB * t + curveC * t * t are relative positions of two boxes.
+    The first contact is either t = 0 or a time where x(t) or y(t) reaches a bound, so only those are tested.
+    """
+    x, deltaX, y, curveB, curveC = numpy.broadcast_arrays(*[numpy.asarray(value, dtype=float)
+                                                           for value in (x, deltaX, y, curveB, curveC)])
+    speedX = deltaX / deltaTime if deltaTime > 0 else numpy.zeros_like(deltaX)
+    candidates = [numpy.zeros_like(x), linearRoots(x, speedX, lowX), linearRoots(x, speedX, highX)]
+    candidates.extend(quadraticRoots(y, curveB, curveC, lowY))
+    candidates.extend(quadraticRoots(y, curveB, curveC, highY))
+    result = numpy.full(x.shape, numpy.inf)
+    for time in candidates:
+        finite = numpy.isfinite(time)
+        time = numpy.where(finite, time, 0)
+        positionX = x + speedX * time
+        positionY = y + (curveB + curveC * time) * time
+        touching = (finite & (time >= -EPSILON) & (time <= deltaTime + EPSILON) &
+                    (positionX >= lowX - EPSILON) & (positionX <= highX + EPSILON) &
+                    (positionY >= lowY - EPSILON) & (positionY <= highY + EPSILON))
+        result = numpy.where(touching, numpy.minimum(result, numpy.clip(time, 0, deltaTime)), result)
+    return result
+
+
+def sweptBox(physics, slot, size):
+    """Return (x1, y1, x2, y2) covering the box of size at slot during the whole last step"""
+    x1 = physics.startX[slot]
+    x2 = x1 + physics.deltaX[slot]
+    y1 = physics.startY[slot]
+    y2 = physics.yPos[slot]
+    top = min(y1, y2)
+    bottom = max(y1, y2)
+    curveC = physics.curveC[slot]
+    if curveC != 0:
+        # turning point of the parabola
+        time = -physics.curveB[slot] / (2 * curveC)
+        if 0 < time < physics.deltaTime:
+            turn = y1 + physics.curveB[slot] * time + curveC * time * time
+            top = min(top, turn)
+            bottom = max(bottom, turn)
+    return min(x1, x2), top, max(x1, x2) + size[0], bottom + size[1]
+
+
+def sweptBoxes(physics, size):
+    """Vectorized sweptBox for the first physics.size slots, returns arrays x1, y1, x2, y2"""
+    n = physics.size
+    x1 = physics.startX[:n]
+    x2 = x1 + physics.deltaX[:n]
+    y1 = physics.startY[:n]
+    y2 = physics.yPos[:n]
+    curveB = physics.curveB[:n]
+    curveC = physics.curveC[:n]
+    top = numpy.minimum(y1, y2)
+    bottom = numpy.maximum(y1, y2)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        time = numpy.where(curveC != 0, -curveB / numpy.where(curveC != 0, 2 * curveC, 1), 0)
+    turning = (time > 0) & (time < physics.deltaTime)
+    turn = y1 + curveB * time + curveC * time * time
+    top = numpy.where(turning, numpy.minimum(top, turn), top)
+    bottom = numpy.where(turning, numpy.maximum(bottom, turn), bottom)
+    return numpy.minimum(x1, x2), top, numpy.maximum(x1, x2) + size[0], bottom + size[1]
@@ -1,48 +1,101 @@
 __author__ = 'Simon'
 
-import random
-import pygame
-GRAVITY = 15  # 9.98 # Earth value
-CRASHSPEED = 40.0
+import itertools
+
+COLORS = ((255, 0, 0), (0, 0, 255), (255, 255, 0))
+SIZE = (40, 40)
+# every spawn gets a new serial, slots and their Lander views are reused
+SERIALS = itertools.count(1)
+
+
+def fuelBar(relativeFuel):
+    """Return height and color of the fuel bar for the fraction of fuel left"""
+    fuelBarColor = (0, 255, 0)
+    if relativeFuel < 0.9:
+        fuelBarColor = (255, 255, 0)
+    if relativeFuel < 0.4:
+        fuelBarColor = (255, 0, 0)
+    return int(20 * relativeFuel), fuelBarColor
+
+
+def advanceSerials(serial):
+    """Make sure new spawns get serials above serial, e.g. after landers were restored"""
+    global SERIALS
+    SERIALS = itertools.count(max(next(SERIALS), serial + 1))
+
+
+def slotProperty(name, cast):
+    """Expose one array of the physics engine as attribute of the lander owning the slot"""
+    def get(self):
+        return cast(getattr(self.physics, name)[self.slot])
+
+    def set(self, value):
+        getattr(self.physics, name)[self.slot] = value
+    return property(get, set)
 
 
 class Lander(object):
-    def __init__(self, parent, landerList, platformList, thrustPower=25.0):
+    """View on one slot of the parent's Physics engine
+
+    Movement is stepped for all landers at once by Physics.step, the scalar update methods are kept for single landers.
+    Gravity, crash speed, thrust power and fuel come from the parent's Simulation.Parameters.
+    """
+    xPos = slotProperty("xPos", float)
+    yPos = slotProperty("yPos", float)
+    fallSpeed = slotProperty("fallSpeed", float)
+    horizontalSpeed = slotProperty("horizontalSpeed", float)
+    thrustPower = slotProperty("thrustPower", float)
+    fuelLeft = slotProperty("fuelLeft", float)
+    isThrustOn = slotProperty("isThrustOn", bool)
+    horizontalThrustLeftOn = slotProperty("horizontalThrustLeftOn", bool)
+    horizontalThrustRightOn = slotProperty("horizontalThrustRightOn", bool)
+    isAlive = slotProperty("isAlive", bool)
+    serial = slotProperty("serial", int)
+
+    def __init__(self, parent, landerList, platformList, xPos=None, color=None, slot=None):
+        """Spawn at xPos in a fresh slot, or with slot given become the view on a slot the caller fills
+
+        The Simulation keeps one view per slot (see Simulation.landerView).
+        """
         self.parent = parent
-        self.fallSpeed = 0
-        self.thrustPower = thrustPower
-        self.yPos = None
-        self.xPos = None
-        self.color = None
-        self.isThrustOn = False
-        self.horizontalSpeed = 0.0
-        self.drawSize = (40, 40)
-        self.isAlive = True
+        self.parameters = parent.parameters
+        self.physics = parent.physics
+        self.drawSize = SIZE
         self.type = "LANDER"
+        self.landerList = landerList
+        self.platformList = platformList
         self.hasScored = False
         self.hasCrashed = False
         self.collisionPartner = None
-        self.boundingBox = {"x1": 0, "x2": 0, "y1": 0, "y2": 0}
-        self.horizontalThrustLeftOn = False
-        self.horizontalThrustRightOn = False
-        self.landerList = landerList
-        self.platformList = platformList
-        self.fuelLeft = 10
-        # call spawn to set position and color with collision check before spawning lander
-        self.spawn(0)
-
-    def spawn(self, tries):
-        if tries > 5:
-            self.isAlive = False
+        if slot is None:
+            self.reset(xPos, color)
         else:
-            self.yPos = 0
-            self.color = ((255, 0, 0), (0, 0, 255), (255, 255, 0))[random.randint(0, 2)]
-            self.xPos = random.randrange(10, 280)
-            self.calcBoundingBox()
-            for lander in self.landerList:
-                if self.checkCollision(lander) != "CLEAR":
-                    self.spawn(tries+1)
-
+            self.slot = slot
+
+    @property
+    def color(self):
+        return COLORS[self.physics.colorIndex[self.slot]]
+
+    @color.setter
+    def color(self, value):
+        self.physics.colorIndex[self.slot] = COLORS.index(value)
+
+    def reset(self, xPos, color, slot=None):
+        """Spawn at xPos in slot, default a fresh physics slot
+
+        The spawn position comes from the parent's Spawn.SpawnAllocator and is free of other landers.
+        """
+        if slot is None:
+            slot = self.physics.addSlot(self.parameters.thrustPower, self.parameters.fuel)
+        self.slot = slot
+        self.serial = next(SERIALS)
+        self.xPos = xPos
+        self.yPos = 0
+        self.color = color
+        self.hasScored = False
+        self.hasCrashed = False
+        self.collisionPartner = None
+        self.calcBoundingBox()
 
     def thrust(self):
         if self.fuelLeft > 0:
@@ -61,8 +114,7 @@ class Lander(object):
         self.horizontalThrustRightOn = False
 
     def updateFallspeed(self, deltaTime):
-        global GRAVITY
-        self.fallSpeed += ((GRAVITY - (self.thrustPower * self.isThrustOn)) * deltaTime)
+        self.fallSpeed += ((self.parameters.gravity - (self.thrustPower * self.isThrustOn)) * deltaTime)
         if self.yPos <= 0.5:
             self.fallSpeed = max(0, self.fallSpeed)
         self.horizontalSpeed += ((self.thrustPower * -self.horizontalThrustLeftOn) + (self.thrustPower * self.horizontalThrustRightOn)) * deltaTime
@@ -70,7 +122,7 @@ class Lander(object):
 
     def updateCoordinates(self, deltaTime):
         self.xPos += (self.horizontalSpeed * deltaTime)
-        self.xPos %= 310
+        self.xPos %= self.physics.wrapWidth
         self.yPos = max(self.yPos + (self.fallSpeed * deltaTime), 0)
 
 
@@ -85,9 +137,8 @@ class Lander(object):
             if not((object.xPos + object.drawSize[0]) < self.boundingBox["x1"]
                     or object.xPos > self.boundingBox["x2"]):
                 if object.type == "PLATFORM":
-                    global CRASHSPEED
                     self.collisionPartner = object
-                    if self.fallSpeed <= CRASHSPEED:
+                    if self.fallSpeed <= self.parameters.crashSpeed:
                         return "LANDED"
                     else:
                         return "CRASHED"
@@ -103,30 +154,13 @@ class Lander(object):
         print("y-Position:\t%.2f" % self.yPos)
         print("x-Position:\t%.2f" % self.xPos)
 
-    def drawLander(self, screen, assets):
+    def drawLander(self, screen, sprites, rotorFrame=0):
+        """Blit the pre-composited sprite (Sprites.SpriteCache) matching color, speed light, rotor and fuel"""
         if self.isAlive:
-            global CRASHSPEED
-            fallSpeedLight = (assets.landerLightRed if self.fallSpeed >= CRASHSPEED else assets.landerLightGreen)
-            box = None
-            if self.color == (255, 0, 0):
-                box = assets.redBox
-            elif self.color == (255, 255, 0):
-                box = assets.yellowBox
-            elif self.color == (0, 0, 255):
-                box = assets.blueBox
-            screen.blit(box, (self.xPos, self.yPos))
-            screen.blit(assets.boxOverlay, (self.xPos, self.yPos))
-            screen.blit(assets.landerBody, (self.xPos, self.yPos))
-            screen.blit(assets.rotorA, (self.xPos, self.yPos))
-            screen.blit(fallSpeedLight, (self.xPos, self.yPos))
-            fuelBarColor = (0, 255, 0)
-            relativeFuel = (self.fuelLeft / 10)
-            if relativeFuel < 0.9:
-                fuelBarColor = (255, 255, 0)
-            if relativeFuel < 0.4:
-                fuelBarColor = (255, 0, 0)
-            pygame.draw.rect(screen, (0, 0, 0), ((self.xPos, self.yPos), (4, 20)), 0)
-            pygame.draw.rect(screen, fuelBarColor, ((self.xPos+1, self.yPos), (2, 20 * relativeFuel)), 0)
+            fuelHeight, fuelBarColor = fuelBar(self.fuelLeft / self.parameters.fuel)
+            sprite = sprites.get(self.color, self.fallSpeed >= self.parameters.crashSpeed, rotorFrame, fuelHeight,
+                                 fuelBarColor)
+            screen.blit(sprite, (self.xPos, self.yPos))
 
     def clicked(self, mousePosition):
         if mousePosition[0] < self.xPos or mousePosition[0] > (self.xPos + self.drawSize[0]):
@@ -144,12 +178,26 @@ class Lander(object):
         if self.fuelLeft <= 0:
             self.unthrust()
 
-    def update(self, deltaTime, screen, assets, log):
+    def update(self, deltaTime, screen, sprites, log):
         self.updateFallspeed(deltaTime)
         self.updateCoordinates(deltaTime)
-        self.calcBoundingBox()
         self.useFuel(deltaTime)
-        objectList = (self.landerList + self.platformList)
+        self.collide()
+        self.drawLander(screen, sprites)
+
+    def collide(self, objectList=None):
+        """Check for collisions after movement was stepped (by update or Physics.step)
+
+        objectList defaults to all landers and platforms, the game passes the nearby candidates of its CollisionGrid.
+        """
+        self.calcBoundingBox()
+        if self.yPos > self.parent.drawSize[1]:
+            self.collisionPartner = "EDGE"
+            self.isAlive = False
+            self.hasCrashed = True
+            return
+        if objectList is None:
+            objectList = (self.landerList + self.platformList)
         for object in objectList:
             result = self.checkCollision(object)
             if result != "CLEAR":
@@ -158,15 +206,16 @@ class Lander(object):
                     self.hasScored = True
                 if result == "CRASHED":
                     self.hasCrashed = True
-        self.drawLander(screen, assets)
 
 if __name__ == "__main__":
+    import Simulation
     DEBUGLEVEL = 2
 
     print("Start")
     time = 0.0
     deltaTime = 0.01
-    myLander = Lander()
+    mySimulation = Simulation.Simulation(320, 480)
+    myLander = Lander(mySimulation, mySimulation.landerList, mySimulation.platformList, 140, COLORS[0])
     while time < 2.0:
         myLander.updateFallspeed(deltaTime)
         myLander.updateCoordinates(deltaTime)
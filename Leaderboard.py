@@ -0,0 +1,298 @@
+__author__ = 'Simon'
+"""Shared leaderboard for many game clients
+
+LeaderboardServer is a small asyncio server in front of one highscore database. Clients send newline separated
+JSON requests: {"op": "submit", "scores": [[name, score], ...]} and {"op": "top"}. Submissions are merged into a
+cached top 5 snapshot at once and written to the database in batches.
+
+RemoteHighscore offers the Highscore interface to Game. Networking runs on its own thread, the game loop only reads
+the last snapshot. While the server is unreachable scores go to the local Highscore file, always written by the
+thread that owns it (the game loop).
+
+    python Leaderboard.py serve [port] [database]
+    python Leaderboard.py stress [port] [clients] [requests]
+"""
+
+import asyncio
+import json
+import queue
+import socket
+import sys
+import threading
+import time
+import Highscore
+
+PORT = 47474
+# scores are stored as SQLite integers
+SCORERANGE = (-2 ** 63, 2 ** 63 - 1)
+
+
+def parseScores(scores):
+    """Return the [name, score] pairs of a submit request, raise ValueError if any entry is malformed
+
+    The whole batch is checked before anything is stored, a bad entry rejects all of it.
+    """
+    if not isinstance(scores, list):
+        raise ValueError("scores must be a list of [name, score]")
+    scorePairs = list()
+    for entry in scores:
+        if not isinstance(entry, list) or len(entry) != 2:
+            raise ValueError("scores must be a list of [name, score]")
+        name, score = entry
+        try:
+            score = int(score)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError("score of %s is no integer" % str(name)[:32])
+        if not SCORERANGE[0] <= score <= SCORERANGE[1]:
+            raise ValueError("score of %s is out of range" % str(name)[:32])
+        scorePairs.append([str(name)[:32], score])
+    return scorePairs
+
+
+class LeaderboardServer(object):
+    def __init__(self, highscore, batchInterval=0.25):
+        """highscore is a Highscore.Highscore without background writer, owned by the server"""
+        self.highscore = highscore
+        self.batchInterval = batchInterval
+        self.pending = list()
+        self.scores = list(highscore.scores)
+        self.snapshot = self.encodeSnapshot()
+        self.connections = 0
+        self.requests = 0
+        self.batches = 0
+        self.server = None
+
+    def encodeSnapshot(self):
+        return (json.dumps({"top": self.scores}) + "\n").encode("utf-8")
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # longer than the stream limit, the rest of the line cannot be told from the next request
+                    writer.write(b'{"error": "request too long"}\n')
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                self.requests += 1
+                try:
+                    request = json.loads(line.decode("utf-8"))
+                    op = request["op"]
+                except (ValueError, KeyError, TypeError, RecursionError):
+                    op = None
+                if op is None:
+                    writer.write(b'{"error": "bad request"}\n')
+                elif op == "submit":
+                    try:
+                        scorePairs = parseScores(request.get("scores"))
+                    except ValueError as error:
+                        writer.write((json.dumps({"error": str(error)}) + "\n").encode("utf-8"))
+                    else:
+                        for scorePair in scorePairs:
+                            self.pending.append(scorePair)
+                            Highscore.insertIntoTop(self.scores, scorePair)
+                        self.snapshot = self.encodeSnapshot()
+                        writer.write(b'{"ok": true}\n')
+                elif op == "top":
+                    writer.write(self.snapshot)
+                else:
+                    writer.write(b'{"error": "unknown op"}\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def flush(self):
+        """Write all pending submissions in one transaction"""
+        if self.pending:
+            pending, self.pending = self.pending, list()
+            self.highscore.insertScores(pending)
+            self.batches += 1
+
+    async def flushLoop(self):
+        while True:
+            await asyncio.sleep(self.batchInterval)
+            self.flush()
+
+    async def serve(self, host="127.0.0.1", port=PORT):
+        self.server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        flushTask = asyncio.ensure_future(self.flushLoop())
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            flushTask.cancel()
+            self.flush()
+
+
+class RemoteHighscore(object):
+    """Highscore interface (insertScore, writeHighscores, drawHighscore, scores, version) backed by a server"""
+    STOP = "STOP"
+
+    def __init__(self, address, local, refreshInterval=2.0, timeout=1.0, retryInterval=5.0):
+        """address is (host, port), local the Highscore.Highscore used while offline
+
+        local belongs to the thread creating the RemoteHighscore, only that thread's calls touch it (see settle).
+        """
+        self.address = address
+        self.local = local
+        self.refreshInterval = refreshInterval
+        self.timeout = timeout
+        self.retryInterval = retryInterval
+        self.scores = list(local.scores)
+        self.version = 0
+        self.online = False
+        self.outbox = queue.Queue()
+        # scores the network thread could not send, settle moves them into local
+        self.fallback = queue.Queue()
+        self.wentOffline = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def insertScore(self, **kwargs):
+        scorePair = kwargs.get("scorePair", None)
+        if scorePair is None:
+            scorePair = [kwargs.get("name", ""), kwargs.get("score", -1)]
+        self.settle()
+        if self.online:
+            self.outbox.put(list(scorePair))
+            Highscore.insertIntoTop(self.scores, scorePair)
+        else:
+            self.local.insertScore(scorePair=scorePair)
+            self.scores = list(self.local.scores)
+        self.version += 1
+
+    def writeHighscores(self):
+        """Never blocks, submissions are sent by the network thread"""
+        self.settle()
+        self.local.writeHighscores()
+
+    def drawHighscore(self, screen, textCache=None):
+        self.settle()
+        Highscore.drawScores(screen, self.scores, textCache)
+
+    def close(self):
+        self.stopping.set()
+        self.outbox.put(self.STOP)
+        self.thread.join(self.timeout * 2)
+        self.goOffline()
+        self.settle()
+        self.local.close()
+
+    def goOffline(self):
+        """Hand everything not yet sent to the owning thread, the next settle writes it to the local file"""
+        self.online = False
+        while True:
+            try:
+                scorePair = self.outbox.get_nowait()
+            except queue.Empty:
+                break
+            if scorePair != self.STOP:
+                self.fallback.put(scorePair)
+        self.wentOffline.set()
+        # Game redraws the highscores on a new version, which settles
+        self.version += 1
+
+    def settle(self):
+        """On the owning thread: store the scores left by goOffline locally and show the local top scores"""
+        if not self.wentOffline.is_set():
+            return
+        self.wentOffline.clear()
+        while True:
+            try:
+                self.local.insertScore(scorePair=self.fallback.get_nowait())
+            except queue.Empty:
+                break
+        self.local.writeHighscores()
+        self.scores = list(self.local.scores)
+        self.version += 1
+
+    def request(self, stream, message):
+        stream.write((json.dumps(message) + "\n").encode("utf-8"))
+        stream.flush()
+        line = stream.readline()
+        if not line:
+            raise socket.error("connection closed")
+        return json.loads(line.decode("utf-8"))
+
+    def run(self):
+        while not self.stopping.is_set():
+            unsent = list()
+            try:
+                connection = socket.create_connection(self.address, self.timeout)
+                stream = connection.makefile("rwb")
+                self.online = True
+                while not self.stopping.is_set():
+                    reply = self.request(stream, {"op": "top"})
+                    if reply["top"] != self.scores:
+                        self.scores = reply["top"]
+                        self.version += 1
+                    try:
+                        scorePair = self.outbox.get(timeout=self.refreshInterval)
+                    except queue.Empty:
+                        continue
+                    unsent = [scorePair]
+                    while True:
+                        try:
+                            unsent.append(self.outbox.get_nowait())
+                        except queue.Empty:
+                            break
+                    unsent = [scorePair for scorePair in unsent if scorePair != self.STOP]
+                    if unsent:
+                        self.request(stream, {"op": "submit", "scores": unsent})
+                        unsent = list()
+                connection.close()
+            except (socket.error, ValueError, KeyError):
+                for scorePair in unsent:
+                    self.outbox.put(scorePair)
+                self.goOffline()
+                self.stopping.wait(self.retryInterval)
+
+
+async def stressClient(port, requests, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for i in range(requests):
+        start = time.time()
+        if i % 10 == 0:
+            writer.write(b'{"op": "submit", "scores": [["STRESS", %d]]}\n' % (i % 1000))
+        else:
+            writer.write(b'{"op": "top"}\n')
+        await writer.drain()
+        await reader.readline()
+        latencies.append(time.time() - start)
+    writer.close()
+
+
+async def stress(port, clients, requests):
+    latencies = list()
+    start = time.time()
+    await asyncio.gather(*[stressClient(port, requests, latencies) for i in range(clients)])
+    duration = time.time() - start
+    latencies.sort()
+    print("%d clients, %d requests in %.2f s (%.0f/s), p50 %.2f ms, p99 %.2f ms" % (
+        clients, len(latencies), duration, len(latencies) / duration,
+        latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000))
+
+
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+    if mode == "serve":
+        database = sys.argv[3] if len(sys.argv) > 3 else "leaderboard.db"
+        myServer = LeaderboardServer(Highscore.Highscore(database))
+        try:
+            asyncio.run(myServer.serve(port=port))
+        except KeyboardInterrupt:
+            pass
+    elif mode == "stress":
+        clientCount = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+        requestCount = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+        asyncio.run(stress(port, clientCount, requestCount))
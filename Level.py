@@ -0,0 +1,75 @@
+__author__ = 'Simon'
+"""World layouts
+
+A Level gives the size of the world, the x at which drones wrap around, the spawn band at the top and the platforms
+(color, x, y). Level(320, 480) is the classic screen with the three platforms of Platform.LAYOUT. Worlds wider than
+the classic screen default to a generated layout with many platforms at varying heights. The default layout only
+depends on the world size, so replays and save states, which store the size, rebuild the same world.
+
+    python Level.py [width] [height]     print the generated layout
+"""
+
+import random
+import Lander
+import Platform
+
+CLASSICWIDTH = 320
+# lowest platforms of generated levels keep the distance to the bottom edge of the classic screen (y = 427 at 480)
+BOTTOMMARGIN = 53
+
+
+class Level(object):
+    def __init__(self, width, height, platforms=None, wrapWidth=None, spawnBand=None):
+        """platforms is a sequence of (color, xPos, yPos), default the classic platforms at y = Platform.YPOS
+
+        Drones wrap around at wrapWidth (default width - 10) and spawn at integer x in spawnBand (xMin, xMax),
+        default (10, min(width, CLASSICWIDTH) - 41): the top of the classic screen, which the camera shows at the start.
+        """
+        self.width = width
+        self.height = height
+        if platforms is None:
+            platforms = [(color, xPos, Platform.YPOS) for color, xPos in Platform.LAYOUT]
+        self.platforms = list(platforms)
+        self.wrapWidth = wrapWidth if wrapWidth is not None else width - 10
+        self.spawnBand = spawnBand if spawnBand is not None else (10, min(width, CLASSICWIDTH) - 41)
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def createPlatforms(self):
+        """Return new Platform objects of the layout"""
+        return [Platform.Platform(color, xPos, yPos) for color, xPos, yPos in self.platforms]
+
+
+def generate(width, height, seed=0, minGap=20, maxGap=170):
+    """Return a Level with platforms every 110 to 260 px over the whole width, at heights from mid-screen down"""
+    rng = random.Random(seed)
+    platforms = list()
+    wrapWidth = width - 10
+    platformWidth = Platform.SIZE[0]
+    xPos = 10
+    while xPos + platformWidth <= wrapWidth:
+        yPos = rng.randint(height // 2, height - BOTTOMMARGIN)
+        platforms.append((rng.choice(Lander.COLORS), xPos, yPos))
+        xPos += platformWidth + rng.randint(minGap, maxGap)
+    return Level(width, height, platforms, wrapWidth)
+
+
+def forSize(width, height):
+    """Return the default layout of a world: classic up to CLASSICWIDTH, else generated from the size"""
+    if width <= CLASSICWIDTH:
+        return Level(width, height)
+    return generate(width, height, seed=width * 65536 + height)
+
+
+if __name__ == "__main__":
+    import sys
+    myWidth = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    myHeight = int(sys.argv[2]) if len(sys.argv) > 2 else 480
+    myLevel = forSize(myWidth, myHeight)
+    print("%dx%d, wrap at %d, spawn band %d..%d, %d platforms" % (myLevel.width, myLevel.height, myLevel.wrapWidth,
+                                                                 myLevel.spawnBand[0], myLevel.spawnBand[1],
+                                                                 len(myLevel.platforms)))
+    for myColor, myX, myY in myLevel.platforms:
+        print("%-16s x %5d y %4d" % (myColor, myX, myY))
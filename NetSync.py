@@ -0,0 +1,497 @@
+__author__ = 'Simon'
+"""State sync for spectator screens and linked cabinets
+
+SyncServer streams the game to any number of SyncClients over TCP. Every tick it encodes one SimThread.Snapshot:
+new clients (and all clients every keyframeInterval ticks) get a keyframe with every drone, the others a delta
+against the state sent before. Deltas only carry drones that changed, as quantized differences:
+
+    position 1/16 px, speeds 1/64 px/s, fuel 1 ms, flags (thrust, left, right) as they are
+
+Both ends keep the quantized state, so deltas never accumulate rounding errors. A client mirrors the stream and
+returns Snapshots the game's drawing code can draw. For tests it can hold every message back by a simulated latency.
+Two cabinets would each run a server and a client of the other one.
+
+Messages: length (uint32), type (uint8), payload. Keyframe: HUD, world width, height, wrap width, count (uint32),
+RECORD per drone. Delta: HUD, removed, added, changed count (uint32 each), wide fields (uint8, bit per field), removed serials (uint32), added RECORDs (new
+drones and drones whose difference did not fit), bitmap of changed drones over the kept drones (in serial order),
+field mask (uint8) per changed drone, then per field the differences of the drones with that bit (int8, int16 if
+the field's bit is set in wide fields), flags (uint8) as they are.
+
+    python NetSync.py loopback [drones] [ticks] [latency]    stream a headless game to a local client
+    python NetSync.py watch host:port                        spectator window for Game.py --broadcast [host:]port
+"""
+
+import collections
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import numpy
+import Lander
+import SimThread
+import enums
+
+PORT = 47475
+KEYFRAME = 1
+DELTA = 2
+FRAMING = struct.Struct("<IB")
+HUD = struct.Struct("<Iiifb")
+SIZE = struct.Struct("<IIII")
+COUNTS = struct.Struct("<IIIB")
+STATES = (enums.GAMESTATE.RUNNING, enums.GAMESTATE.GAMEOVER, enums.GAMESTATE.TIMEUP, enums.GAMESTATE.STARTSCREEN,
+          enums.GAMESTATE.HELPSCREEN, enums.GAMESTATE.QUIT)
+# quantization steps per unit of the delta fields, the last field (flags) is sent as it is
+FIELDS = (("xPos", 16), ("yPos", 16), ("fallSpeed", 64), ("horizontalSpeed", 64), ("fuelLeft", 1000), ("flags", 1))
+RECORD = numpy.dtype([("serial", "<u4"), ("xPos", "<i4"), ("yPos", "<i4"), ("fallSpeed", "<i4"),
+                      ("horizontalSpeed", "<i4"), ("fuelLeft", "<u2"), ("flags", "u1"), ("color", "u1")])
+COLORINDEX = dict((color, index) for index, color in enumerate(Lander.COLORS))
+
+
+def quantize(snapshot):
+    """Return RECORDs of the drones of snapshot, sorted by serial"""
+    records = numpy.empty(len(snapshot.serials), dtype=RECORD)
+    records["serial"] = snapshot.serials
+    for name, scale in FIELDS[:-2]:
+        records[name] = numpy.round(getattr(snapshot, name) * scale)
+    records["fuelLeft"] = numpy.clip(numpy.round(snapshot.fuelLeft * 1000), 0, 0xFFFF)
+    records["flags"] = snapshot.flags
+    records["color"] = [COLORINDEX[color] for color in snapshot.colors]
+    return numpy.sort(records, order="serial")
+
+
+def encodeHud(snapshot):
+    return HUD.pack(snapshot.tick, snapshot.score, snapshot.lives, snapshot.secondsLeft, STATES.index(snapshot.state))
+
+
+def frame(kind, payload):
+    return FRAMING.pack(len(payload), kind) + payload
+
+
+class DeltaEncoder(object):
+    """Turn snapshots into keyframes and deltas, baseline is the state the receivers have"""
+
+    def __init__(self, drawSize):
+        self.drawSize = drawSize
+        self.baseline = numpy.empty(0, dtype=RECORD)
+
+    def keyframe(self, snapshot, records=None):
+        if records is None:
+            records = quantize(snapshot)
+        self.baseline = records
+        return frame(KEYFRAME, encodeHud(snapshot) + SIZE.pack(self.drawSize[0], self.drawSize[1],
+                                                               int(snapshot.wrapWidth), len(records)) + records.tobytes())
+
+    def delta(self, snapshot, records=None):
+        if records is None:
+            records = quantize(snapshot)
+        old = self.baseline
+        kept = numpy.isin(old["serial"], records["serial"], assume_unique=True)
+        removed = old["serial"][~kept]
+        old = old[kept]
+        present = numpy.isin(records["serial"], old["serial"], assume_unique=True)
+        current = records[present]
+        # kept drones are the present ones, both sorted by serial
+        masks = numpy.zeros(len(old), dtype=numpy.uint8)
+        differences = list()
+        fits = numpy.ones(len(old), dtype=bool)
+        for bit, (name, scale) in enumerate(FIELDS):
+            difference = current[name].astype(numpy.int64) - old[name]
+            masks |= (difference != 0).astype(numpy.uint8) << bit
+            fits &= numpy.abs(difference) <= 0x7FFF
+            differences.append(difference)
+        # drones with a too large difference are sent again in full
+        added = numpy.concatenate((records[~present], current[~fits]))
+        masks[~fits] = 0
+        changed = masks != 0
+        # fields whose differences all fit into int8 are sent as int8
+        values = [differences[bit][masks & (1 << bit) != 0] for bit in range(len(FIELDS) - 1)]
+        wide = 0
+        for bit, value in enumerate(values):
+            if len(value) and numpy.abs(value).max() > 0x7F:
+                wide |= 1 << bit
+        payload = [encodeHud(snapshot), COUNTS.pack(len(removed), len(added), int(changed.sum()), wide),
+                   removed.astype("<u4").tobytes(), added.tobytes(), numpy.packbits(changed).tobytes(),
+                   masks[changed].tobytes()]
+        for bit, value in enumerate(values):
+            payload.append(value.astype("<i2" if wide & (1 << bit) else "i1").tobytes())
+        payload.append(current["flags"][masks & (1 << (len(FIELDS) - 1)) != 0].tobytes())
+        self.baseline = records
+        return frame(DELTA, b"".join(payload))
+
+
+class Mirror(object):
+    """Receiving end of a DeltaEncoder"""
+
+    def __init__(self):
+        self.records = None
+        self.hud = None
+        self.drawSize = None
+        self.wrapWidth = None
+
+    def apply(self, kind, payload):
+        tick, score, lives, secondsLeft, state = HUD.unpack_from(payload)
+        self.hud = (tick, score, lives, secondsLeft, STATES[state])
+        offset = HUD.size
+        if kind == KEYFRAME:
+            width, height, self.wrapWidth, count = SIZE.unpack_from(payload, offset)
+            self.drawSize = (width, height)
+            self.records = numpy.frombuffer(payload, dtype=RECORD, count=count, offset=offset + SIZE.size).copy()
+            return
+        if self.records is None:
+            # joined in the middle of a delta stream, wait for the keyframe
+            return
+        removedCount, addedCount, changedCount, wide = COUNTS.unpack_from(payload, offset)
+        offset += COUNTS.size
+        removed = numpy.frombuffer(payload, dtype="<u4", count=removedCount, offset=offset)
+        offset += removed.nbytes
+        added = numpy.frombuffer(payload, dtype=RECORD, count=addedCount, offset=offset)
+        offset += added.nbytes
+        records = self.records[~numpy.isin(self.records["serial"], removed, assume_unique=True)]
+        bitmapSize = (len(records) + 7) // 8
+        changed = numpy.unpackbits(numpy.frombuffer(payload, dtype=numpy.uint8, count=bitmapSize, offset=offset),
+                                   count=len(records)).astype(bool)
+        offset += bitmapSize
+        masks = numpy.frombuffer(payload, dtype=numpy.uint8, count=changedCount, offset=offset)
+        offset += changedCount
+        changedRows = numpy.flatnonzero(changed)
+        for bit, (name, scale) in enumerate(FIELDS):
+            selected = masks & (1 << bit) != 0
+            flags = name == "flags"
+            dtype = "u1" if flags else "<i2" if wide & (1 << bit) else "i1"
+            values = numpy.frombuffer(payload, dtype=dtype, count=int(selected.sum()), offset=offset)
+            offset += values.nbytes
+            rows = changedRows[selected]
+            records[name][rows] = values if flags else records[name][rows] + values.astype(numpy.int64)
+        if addedCount:
+            records = records[~numpy.isin(records["serial"], added["serial"], assume_unique=True)]
+            records = numpy.sort(numpy.concatenate((records, added)), order="serial")
+        self.records = records
+
+    def snapshot(self):
+        """Return the mirrored state as SimThread.Snapshot, None before the first keyframe"""
+        if self.records is None:
+            return None
+        records = self.records
+        tick, score, lives, secondsLeft, state = self.hud
+        arrays = dict((name, records[name] / float(scale)) for name, scale in FIELDS[:-1])
+        serials = records["serial"].astype(numpy.int64)
+        return SimThread.Snapshot(tick, time.perf_counter(), serials, serials, flags=records["flags"].copy(),
+                                  colors=tuple(Lander.COLORS[index] for index in records["color"].tolist()),
+                                  state=state, score=score, lives=lives, secondsLeft=secondsLeft, pairTests=0,
+                                  wrapWidth=self.wrapWidth, **arrays)
+
+
+class Spectator(object):
+    """One client of a SyncServer: a queue of at most backlog messages and a thread sending them"""
+
+    def __init__(self, server, connection, backlog):
+        self.server = server
+        self.connection = connection
+        self.backlog = backlog
+        self.queue = collections.deque()
+        self.ready = threading.Condition()
+        self.bytesSent = 0
+        self.closed = False
+        # new spectators and spectators that fell behind get a keyframe next
+        self.needsKeyframe = True
+        self.thread = threading.Thread(target=self.sendLoop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def push(self, kind, message):
+        """Queue message, a keyframe replaces the whole queue (the receiver resyncs from it)
+
+        Called by SyncServer.publish with the server's lock held.
+        """
+        with self.ready:
+            if kind == KEYFRAME:
+                self.queue.clear()
+                self.needsKeyframe = False
+            self.queue.append(message)
+            if len(self.queue) >= self.backlog:
+                # one more message would exceed the backlog, the next tick replaces the queue by a keyframe
+                self.needsKeyframe = True
+                self.server.resyncs += 1
+            self.ready.notify()
+
+    def sendLoop(self):
+        while True:
+            with self.ready:
+                while not self.queue and not self.closed:
+                    self.ready.wait()
+                if self.closed:
+                    return
+                message = self.queue.popleft()
+            try:
+                self.connection.sendall(message)
+                self.bytesSent += len(message)
+            except socket.error:
+                # also a timeout: the client took no data for the server's sendTimeout
+                self.server.drop(self)
+                return
+
+    def close(self):
+        with self.ready:
+            self.closed = True
+            self.ready.notify()
+        self.connection.close()
+
+
+class SyncServer(object):
+    """Accept clients on port and send them every published tick
+
+    Messages are encoded once on the publishing thread, every client has its own sender thread and a queue of at most
+    backlog messages, so neither the game nor the other clients wait for a slow one. A client that falls behind by
+    backlog messages gets its queue replaced by a keyframe, one that takes no data for sendTimeout seconds is dropped.
+    host is the interface to listen on, "0.0.0.0" opens the (unauthenticated) stream to the whole network.
+    """
+
+    def __init__(self, drawSize, port=PORT, host="127.0.0.1", keyframeInterval=120, historyLength=600, backlog=60,
+                 sendTimeout=5.0):
+        self.encoder = DeltaEncoder(drawSize)
+        self.keyframeInterval = keyframeInterval
+        self.backlog = backlog
+        self.sendTimeout = sendTimeout
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(8)
+        self.address = self.listener.getsockname()
+        self.clients = list()
+        self.lock = threading.Lock()
+        self.ticks = 0
+        self.keyframes = 0
+        self.resyncs = 0
+        self.dropped = 0
+        self.bytesSentByGone = 0
+        # (kind, bytes) of the message of each of the last ticks
+        self.history = collections.deque(maxlen=historyLength)
+        self.stopping = False
+        thread = threading.Thread(target=self.acceptLoop)
+        thread.daemon = True
+        thread.start()
+
+    def acceptLoop(self):
+        while not self.stopping:
+            try:
+                connection, address = self.listener.accept()
+            except socket.error:
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection.settimeout(self.sendTimeout)
+            with self.lock:
+                if self.stopping:
+                    connection.close()
+                    return
+                self.clients.append(Spectator(self, connection, self.backlog))
+
+    def publish(self, snapshot):
+        """Encode one tick and queue it for all clients, clients without a baseline get a keyframe"""
+        records = quantize(snapshot)
+        with self.lock:
+            if self.keyframeInterval and self.ticks % self.keyframeInterval == 0:
+                message = self.encoder.keyframe(snapshot, records)
+                self.keyframes += 1
+                kind = KEYFRAME
+            else:
+                message = self.encoder.delta(snapshot, records)
+                kind = DELTA
+            self.ticks += 1
+            self.history.append((kind, len(message)))
+            keyframe = message if kind == KEYFRAME else None
+            for client in self.clients:
+                if client.needsKeyframe:
+                    if keyframe is None:
+                        # same records as the delta, so the baseline of the other clients stays the same
+                        keyframe = self.encoder.keyframe(snapshot, records)
+                        self.keyframes += 1
+                    client.push(KEYFRAME, keyframe)
+                else:
+                    client.push(kind, message)
+
+    def drop(self, client):
+        """Forget a client whose connection failed or stalled"""
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+                self.dropped += 1
+                self.bytesSentByGone += client.bytesSent
+        client.close()
+
+    def stats(self):
+        """Return mean bytes per tick of all messages, of keyframes and of deltas in the history"""
+        sizes = dict((kind, [size for messageKind, size in self.history if messageKind == kind])
+                     for kind in (KEYFRAME, DELTA))
+        mean = lambda values: sum(values) / float(len(values)) if values else 0.0
+        with self.lock:
+            bytesSent = self.bytesSentByGone + sum(client.bytesSent for client in self.clients)
+            clients = len(self.clients)
+        return {"ticks": self.ticks, "bytesPerTick": mean([size for kind, size in self.history]),
+                "keyframeBytes": mean(sizes[KEYFRAME]), "deltaBytes": mean(sizes[DELTA]),
+                "bytesSent": bytesSent, "clients": clients, "resyncs": self.resyncs, "dropped": self.dropped}
+
+    def close(self):
+        with self.lock:
+            self.stopping = True
+            clients, self.clients = self.clients, list()
+        self.listener.close()
+        for client in clients:
+            client.close()
+
+
+class SyncClient(object):
+    """Mirror the stream of a SyncServer, latency (plus up to jitter) seconds late if given"""
+
+    def __init__(self, address, latency=0.0, jitter=0.0, seed=None):
+        self.connection = socket.create_connection(address)
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.mirror = Mirror()
+        self.inbox = collections.deque()
+        self.bytesReceived = 0
+        self.messages = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.receiveLoop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def receiveAll(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.connection.recv(size - len(data))
+            if not chunk:
+                raise socket.error("connection closed")
+            data += chunk
+        return data
+
+    def receiveLoop(self):
+        due = 0.0
+        try:
+            while True:
+                size, kind = FRAMING.unpack(self.receiveAll(FRAMING.size))
+                payload = self.receiveAll(size)
+                self.bytesReceived += FRAMING.size + size
+                # TCP keeps the order, so does the simulated delay
+                due = max(due, time.perf_counter() + self.latency + self.random.uniform(0, self.jitter))
+                self.inbox.append((due, kind, payload))
+        except (socket.error, struct.error):
+            self.closed = True
+
+    def poll(self, now=None):
+        """Apply all messages that arrived (after the simulated latency), return the latest Snapshot or None"""
+        if now is None:
+            now = time.perf_counter()
+        while self.inbox and self.inbox[0][0] <= now:
+            due, kind, payload = self.inbox.popleft()
+            self.mirror.apply(kind, payload)
+            self.messages += 1
+        return self.mirror.snapshot()
+
+    def close(self):
+        self.connection.close()
+
+
+def loopback(drones=300, ticks=600, latency=0.1):
+    """Stream a headless game to a local client with simulated latency and check the mirrored state"""
+    import Benchmark
+    simulation = Benchmark.runningSimulation(500 + 50 * (drones // 6 + 1) + 5000)
+    Benchmark.populate(simulation, drones, 500)
+    server = SyncServer(simulation.drawSize, port=0)
+    client = SyncClient(server.address, latency, jitter=latency / 4, seed=0)
+    time.sleep(0.05)
+    start = time.perf_counter()
+    for tick in range(ticks):
+        if tick % 30 == 0:
+            # whole columns (see Benchmark.populate) thrust alike and all steer the same way, nothing collides
+            for index, lander in enumerate(simulation.landerList):
+                if (index % 6 + tick // 30) % 4 == 0:
+                    lander.thrust()
+                else:
+                    lander.unthrust()
+                lander.horizontalThrust("LEFT" if tick // 30 % 2 else "RIGHT")
+        simulation.step(1 / 60.0)
+        server.publish(SimThread.takeSnapshot(simulation, tick + 1, time.perf_counter()))
+        client.poll()
+        time.sleep(max(start + (tick + 1) / 60.0 - time.perf_counter(), 0))
+    time.sleep(latency * 1.5 + 0.1)
+    mirrored = client.poll()
+    stats = server.stats()
+    expected = quantize(SimThread.takeSnapshot(simulation, ticks))
+    matches = numpy.array_equal(client.mirror.records, expected) and mirrored.tick == ticks
+    fullBytes = FRAMING.size + HUD.size + SIZE.size + RECORD.itemsize * len(expected)
+    print("%d drones, %d ticks, %.0f ms latency: %d messages, %d bytes received" % (
+        len(expected), ticks, latency * 1000, client.messages, client.bytesReceived))
+    print("bytes per tick: %.0f mean, keyframe %.0f, delta %.0f (%.1f per drone), full state %d" % (
+        stats["bytesPerTick"], stats["keyframeBytes"], stats["deltaBytes"],
+        stats["deltaBytes"] / max(len(expected), 1), fullBytes))
+    print("largest position error %.4f px, mirror %s" % (
+        numpy.abs(mirrored.yPos - SimThread.takeSnapshot(simulation).yPos).max() if len(expected) else 0,
+        "matches" if matches else "DIFFERS"))
+    client.close()
+    server.close()
+    return matches
+
+
+def watch(address):
+    """Spectator window drawing the mirrored game"""
+    import pygame
+    import Game
+    import Highscore
+    import Level
+    client = SyncClient(address)
+    snapshot = None
+    while snapshot is None:
+        time.sleep(0.05)
+        snapshot = client.poll()
+    width, height = client.mirror.drawSize
+    # wider levels are shown in a window of the classic width, W, A, S, D scroll
+    game = Game.Game(min(width, Level.CLASSICWIDTH), height, Highscore.Highscore(":memory:"), world=(width, height))
+    pygame.display.set_caption("Cargo Lander spectator")
+    gameArea = pygame.Surface((game.drawSize[0], game.drawSize[1] - 20))
+    staticLayer = game.assets.background.copy()
+    game.drawPlatforms(staticLayer)
+    gameArea.blit(staticLayer, (0, 0))
+    layers = ((gameArea, (0, 20)), (game.topBar, (0, 0)))
+    landerRects = list()
+    clock = pygame.time.Clock()
+    while not client.closed:
+        events = pygame.event.get()
+        if any(event.type == pygame.QUIT for event in events):
+            break
+        for event in events:
+            if event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key in Game.SCROLLKEYS:
+                axis, direction = Game.SCROLLKEYS[event.key]
+                game.camera.direction[axis] = direction if event.type == pygame.KEYDOWN else 0
+        deltaMs = clock.tick(60)
+        snapshot = client.poll()
+        if game.camera.scroll(deltaMs / 1000.0):
+            staticLayer.blit(game.assets.background, (0, 0))
+            game.drawPlatforms(staticLayer)
+            landerRects = list()
+            gameArea.blit(staticLayer, (0, 0))
+            game.renderer.invalidate()
+        if game.drawTopBar(snapshot):
+            game.renderer.addDirty(game.topBar.get_rect())
+        for rect in landerRects:
+            gameArea.blit(staticLayer, rect, rect)
+            game.renderer.addDirty(rect.move(0, 20))
+        landerRects = game.drawLanders(gameArea, snapshot)
+        for rect in landerRects:
+            game.renderer.addDirty(rect.move(0, 20))
+        game.renderer.present(layers)
+    game.highscore.close()
+    client.close()
+
+
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 1 else "loopback"
+    if mode == "loopback":
+        myArguments = [int(sys.argv[2]) if len(sys.argv) > 2 else 300, int(sys.argv[3]) if len(sys.argv) > 3 else 600,
+                       float(sys.argv[4]) if len(sys.argv) > 4 else 0.1]
+        sys.exit(0 if loopback(*myArguments) else 1)
+    elif mode == "watch":
+        myHost, myPort = sys.argv[2].rsplit(":", 1)
+        watch((myHost, int(myPort)))
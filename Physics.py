@@ -0,0 +1,227 @@
+__author__ = 'Simon'
+"""Batched lander physics
+
+All drones share one struct-of-arrays engine, so a frame steps every drone with a handful of NumPy operations
+instead of calling updateFallspeed/updateCoordinates/useFuel on each Lander object.
+
+Every step also stores how each drone moved during the frame (start position, x displacement and the curve
+y(t) = startY + curveB * t + curveC * t * t), which Impact uses for swept collisions.
+The "exact" integrator solves the motion in closed form, so the path no longer depends on the step length.
+"""
+
+import numpy
+
+# x at which drones wrap around on the classic screen
+WRAPWIDTH = 310
+
+
+def fall(yPos, fallSpeed, acceleration, time):
+    """Return position and speed after time seconds of constant acceleration below the ceiling at y = 0
+
+    A drone reaching the ceiling stops there and stays until the acceleration points down again.
+    """
+    newY = yPos + fallSpeed * time + 0.5 * acceleration * time ** 2
+    newFallSpeed = fallSpeed + acceleration * time
+    # first time with y = 0, the smaller root of yPos + fallSpeed * t + acceleration / 2 * t * t
+    discriminant = fallSpeed ** 2 - 2 * acceleration * yPos
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        contact = numpy.where(acceleration != 0,
+                              (-fallSpeed - numpy.sqrt(numpy.maximum(discriminant, 0))) / acceleration,
+                              numpy.where(fallSpeed < 0, -yPos / fallSpeed, numpy.inf))
+    hits = (discriminant >= 0) & (contact >= 0) & (contact <= time)
+    rest = numpy.where(hits, time - contact, 0)
+    restSpeed = numpy.maximum(acceleration, 0) * rest
+    newY = numpy.where(hits, 0.5 * restSpeed * rest, newY)
+    newFallSpeed = numpy.where(hits, restSpeed, newFallSpeed)
+    return numpy.maximum(newY, 0), newFallSpeed
+
+
+class Physics(object):
+    """Hold position, speed, thrust, fuel and alive state of all landers in NumPy arrays
+
+    Every lander owns one slot (an index into the arrays). Lander objects are thin views on their slot.
+    """
+
+    def __init__(self, gravity, capacity=64, integrator="euler", wrapWidth=WRAPWIDTH):
+        """integrator is "euler" (rules of Lander.updateFallspeed and updateCoordinates) or "exact" (closed form)
+
+        Drones leaving the world at x = wrapWidth enter it at x = 0 and vice versa.
+        """
+        self.gravity = gravity
+        self.integrator = integrator
+        self.wrapWidth = wrapWidth
+        self.deltaTime = 0.0
+        self.size = 0
+        self.freeSlots = list()
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        """(Re-)allocate all arrays with given capacity and keep the first self.size entries"""
+        old = self.__dict__.copy()
+        self.capacity = capacity
+        self.xPos = numpy.zeros(capacity)
+        self.yPos = numpy.zeros(capacity)
+        self.fallSpeed = numpy.zeros(capacity)
+        self.horizontalSpeed = numpy.zeros(capacity)
+        self.thrustPower = numpy.zeros(capacity)
+        self.fuelLeft = numpy.zeros(capacity)
+        self.isThrustOn = numpy.zeros(capacity, dtype=bool)
+        self.horizontalThrustLeftOn = numpy.zeros(capacity, dtype=bool)
+        self.horizontalThrustRightOn = numpy.zeros(capacity, dtype=bool)
+        self.isAlive = numpy.zeros(capacity, dtype=bool)
+        # index into Lander.COLORS and spawn serial, kept here so snapshots copy them with the other arrays
+        self.colorIndex = numpy.zeros(capacity, dtype=numpy.uint8)
+        self.serial = numpy.zeros(capacity, dtype=numpy.int64)
+        self.startX = numpy.zeros(capacity)
+        self.startY = numpy.zeros(capacity)
+        self.startFallSpeed = numpy.zeros(capacity)
+        self.deltaX = numpy.zeros(capacity)
+        self.curveB = numpy.zeros(capacity)
+        self.curveC = numpy.zeros(capacity)
+        for name in self.arrayNames():
+            if name in old:
+                getattr(self, name)[:self.size] = old[name][:self.size]
+
+    def arrayNames(self):
+        return ("xPos", "yPos", "fallSpeed", "horizontalSpeed", "thrustPower", "fuelLeft",
+                "isThrustOn", "horizontalThrustLeftOn", "horizontalThrustRightOn", "isAlive",
+                "colorIndex", "serial", "startX", "startY", "startFallSpeed", "deltaX", "curveB", "curveC")
+
+    def addSlot(self, thrustPower, fuel):
+        """Return index of a fresh slot for a new lander, released slots are reused first"""
+        if self.freeSlots:
+            slot = self.freeSlots.pop()
+        else:
+            if self.size == self.capacity:
+                self.allocate(self.capacity * 2)
+            slot = self.size
+            self.size += 1
+        self.xPos[slot] = 0
+        self.yPos[slot] = 0
+        self.fallSpeed[slot] = 0
+        self.horizontalSpeed[slot] = 0
+        self.thrustPower[slot] = thrustPower
+        self.fuelLeft[slot] = fuel
+        self.isThrustOn[slot] = False
+        self.horizontalThrustLeftOn[slot] = False
+        self.horizontalThrustRightOn[slot] = False
+        self.isAlive[slot] = True
+        self.deltaX[slot] = 0
+        self.curveB[slot] = 0
+        self.curveC[slot] = 0
+        return slot
+
+    def setThrust(self, on):
+        """Switch thrust of all living landers, same as Lander.thrust (needs fuel) and Lander.unthrust"""
+        n = self.size
+        if on:
+            self.isThrustOn[:n] |= self.isAlive[:n] & (self.fuelLeft[:n] > 0)
+        else:
+            self.isThrustOn[:n] &= ~self.isAlive[:n]
+
+    def setHorizontalThrust(self, direction):
+        """Steer all living landers "LEFT" or "RIGHT", None switches horizontal thrust off"""
+        n = self.size
+        alive = self.isAlive[:n]
+        numpy.copyto(self.horizontalThrustLeftOn[:n], direction == "LEFT", where=alive)
+        numpy.copyto(self.horizontalThrustRightOn[:n], direction == "RIGHT", where=alive)
+
+    def releaseSlot(self, slot):
+        """Hand slot of a retired lander back for reuse"""
+        self.isAlive[slot] = False
+        self.freeSlots.append(slot)
+
+    def reset(self):
+        self.size = 0
+        del self.freeSlots[:]
+
+    def step(self, deltaTime):
+        """Advance all living landers by deltaTime
+
+        Same rules as the scalar Lander.updateFallspeed, Lander.updateCoordinates and Lander.useFuel.
+        """
+        n = self.size
+        alive = self.isAlive[:n]
+        self.deltaTime = deltaTime
+        numpy.copyto(self.startX[:n], self.xPos[:n], where=alive)
+        numpy.copyto(self.startY[:n], self.yPos[:n], where=alive)
+        numpy.copyto(self.startFallSpeed[:n], self.fallSpeed[:n], where=alive)
+        if self.integrator == "exact":
+            self.stepExact(deltaTime)
+        else:
+            self.stepEuler(deltaTime)
+
+    def stepEuler(self, deltaTime):
+        n = self.size
+        alive = self.isAlive[:n]
+        thrustOn = self.isThrustOn[:n]
+        power = self.thrustPower[:n]
+        fallSpeed = self.fallSpeed[:n]
+        horizontalSpeed = self.horizontalSpeed[:n]
+        yPos = self.yPos[:n]
+        xPos = self.xPos[:n]
+        fuelLeft = self.fuelLeft[:n]
+
+        # updateFallspeed
+        newFallSpeed = fallSpeed + (self.gravity - power * thrustOn) * deltaTime
+        newFallSpeed = numpy.where(yPos <= 0.5, numpy.maximum(newFallSpeed, 0), newFallSpeed)
+        steering = power * self.horizontalThrustRightOn[:n] - power * self.horizontalThrustLeftOn[:n]
+        newHorizontalSpeed = horizontalSpeed + steering * deltaTime
+        newHorizontalSpeed -= (0.5 * newHorizontalSpeed) * deltaTime
+        numpy.copyto(fallSpeed, newFallSpeed, where=alive)
+        numpy.copyto(horizontalSpeed, newHorizontalSpeed, where=alive)
+
+        # updateCoordinates, positions move along a straight line during the frame
+        numpy.copyto(self.deltaX[:n], horizontalSpeed * deltaTime, where=alive)
+        numpy.copyto(xPos, numpy.mod(xPos + horizontalSpeed * deltaTime, self.wrapWidth), where=alive)
+        numpy.copyto(yPos, numpy.maximum(yPos + fallSpeed * deltaTime, 0), where=alive)
+        if deltaTime > 0:
+            numpy.copyto(self.curveB[:n], (yPos - self.startY[:n]) / deltaTime, where=alive)
+        numpy.copyto(self.curveC[:n], 0.0, where=alive)
+
+        # useFuel
+        fuelLeft -= deltaTime * (thrustOn & alive)
+        thrustOn &= ~((fuelLeft <= 0) & alive)
+
+    def stepExact(self, deltaTime):
+        """Closed form motion: constant acceleration while thrusting (until the fuel runs out) and exponential drag"""
+        n = self.size
+        alive = self.isAlive[:n]
+        thrustOn = self.isThrustOn[:n]
+        power = self.thrustPower[:n]
+        fallSpeed = self.fallSpeed[:n]
+        horizontalSpeed = self.horizontalSpeed[:n]
+        yPos = self.yPos[:n]
+        fuelLeft = self.fuelLeft[:n]
+
+        # vertical: thrust for thrustTime, then free fall for the rest of the frame
+        thrustTime = numpy.where(thrustOn, numpy.clip(fuelLeft, 0, deltaTime), 0)
+        middleY, middleSpeed = fall(yPos, fallSpeed, self.gravity - power, thrustTime)
+        newY, newFallSpeed = fall(middleY, middleSpeed, self.gravity, deltaTime - thrustTime)
+
+        # horizontal: dv/dt = steering - 0.5 v
+        steering = power * self.horizontalThrustRightOn[:n] - power * self.horizontalThrustLeftOn[:n]
+        decay = numpy.exp(-0.5 * deltaTime)
+        newHorizontalSpeed = 2 * steering + (horizontalSpeed - 2 * steering) * decay
+        deltaX = 2 * steering * deltaTime + 2 * (horizontalSpeed - 2 * steering) * (1 - decay)
+
+        numpy.copyto(self.curveB[:n], fallSpeed, where=alive)
+        if deltaTime > 0:
+            numpy.copyto(self.curveC[:n], (newY - yPos - fallSpeed * deltaTime) / deltaTime ** 2, where=alive)
+        numpy.copyto(self.deltaX[:n], deltaX, where=alive)
+        numpy.copyto(self.xPos[:n], numpy.mod(self.xPos[:n] + deltaX, self.wrapWidth), where=alive)
+        numpy.copyto(yPos, newY, where=alive)
+        numpy.copyto(fallSpeed, newFallSpeed, where=alive)
+        numpy.copyto(horizontalSpeed, newHorizontalSpeed, where=alive)
+
+        fuelLeft -= thrustTime * alive
+        thrustOn &= ~((fuelLeft <= 0) & alive)
+
+    def speedAt(self, slot, time):
+        """Return fall speed of slot time seconds into the last step"""
+        if self.integrator == "exact":
+            return self.curveB[slot] + 2 * self.curveC[slot] * time
+        if self.deltaTime == 0:
+            return self.fallSpeed[slot]
+        fraction = time / self.deltaTime
+        return self.startFallSpeed[slot] + (self.fallSpeed[slot] - self.startFallSpeed[slot]) * fraction
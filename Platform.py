@@ -1,16 +1,20 @@
 __author__ = 'Simon'
-import pygame
+
+# color and x position of the platforms of a round
+LAYOUT = (((255, 0, 0), 10), ((255, 255, 0), 115), ((0, 0, 255), 220))
+SIZE = (90, 5)
+YPOS = 427
 
 class Platform(object):
-    def __init__(self, color, xPos):
+    def __init__(self, color, xPos, yPos=YPOS):
         self.color = color
         #alt. random color ((255, 0, 0), (0, 0, 255), (255, 255, 0))[random.randint(0, 2)]
         self.xPos = xPos
-        self.yPos = 427
-        self.drawSize = (90, 5)
+        self.yPos = yPos
+        self.drawSize = SIZE
         self.type = "PLATFORM"
         self.isAlive = True  # isAlive is added(never used) for compatibility with checkCollision of Lander class
 
-    def drawPlatform(self, surface):
-        pygame.draw.rect(surface, self.color, ((self.xPos, self.yPos), self.drawSize), 0)
-
+    def drawPlatform(self, surface, offset=(0, 0)):
+        """Fill the platform's rectangle, offset is subtracted (the top left corner of a camera view)"""
+        surface.fill(self.color, ((self.xPos - offset[0], self.yPos - offset[1]), self.drawSize))
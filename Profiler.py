@@ -0,0 +1,111 @@
+__author__ = 'Simon'
+"""Frame profiler
+
+FrameProfiler records how long each phase of a frame took, plus drone and collision pair counts, into a fixed size
+ring buffer. Phases are closed by mark(phase), the time since the previous mark is added to that phase.
+While disabled every call returns after one attribute check. Game shows percentiles in an overlay (F3) and dumps the
+buffer as CSV on exit when started with --profile.
+
+    python Profiler.py run.csv [other.csv]    print percentiles of a dump, or compare two dumps
+"""
+
+import csv
+import sys
+import time
+import numpy
+
+PHASES = ("input", "controls", "spawn", "physics", "collision", "scoring", "topbar", "draw", "present")
+# Game.py writes recorded frames here on exit unless --profile named another file
+DUMPFILE = "profile.csv"
+
+
+class FrameProfiler(object):
+    def __init__(self, capacity=600, enabled=False, dumpFile=None):
+        self.capacity = capacity
+        self.enabled = enabled
+        self.dumpFile = dumpFile
+        self.columns = dict((name, index) for index, name in enumerate(PHASES))
+        self.times = numpy.zeros((capacity, len(PHASES)))
+        self.drones = numpy.zeros(capacity, dtype=numpy.int32)
+        self.pairTests = numpy.zeros(capacity, dtype=numpy.int32)
+        self.frames = 0
+        self.row = 0
+        self.recording = False
+        self.last = 0.0
+
+    def beginFrame(self):
+        """Start a new row, enabling or disabling only takes effect here"""
+        self.recording = self.enabled
+        if self.recording:
+            self.row = self.frames % self.capacity
+            self.times[self.row] = 0
+            self.last = time.perf_counter()
+
+    def mark(self, phase):
+        """Add the time since the last mark to phase"""
+        if self.recording:
+            now = time.perf_counter()
+            self.times[self.row, self.columns[phase]] += now - self.last
+            self.last = now
+
+    def endFrame(self, drones, pairTests):
+        if self.recording:
+            self.drones[self.row] = drones
+            self.pairTests[self.row] = pairTests
+            self.frames += 1
+            self.recording = False
+
+    def recorded(self):
+        """Return (times, drones, pairTests) of the buffered frames, oldest first"""
+        if self.frames <= self.capacity:
+            count = self.frames
+            return self.times[:count], self.drones[:count], self.pairTests[:count]
+        shift = -(self.frames % self.capacity)
+        return numpy.roll(self.times, shift, 0), numpy.roll(self.drones, shift), numpy.roll(self.pairTests, shift)
+
+    def percentiles(self, points=(50, 95, 99)):
+        """Return percentiles of the frame time (sum of all phases) in ms"""
+        times = self.recorded()[0]
+        if len(times) == 0:
+            return [0.0] * len(points)
+        return list(numpy.percentile(times.sum(axis=1), points) * 1000)
+
+    def dump(self, fileName=None):
+        """Write the buffered frames as CSV (times in ms), return the file name"""
+        if fileName is None:
+            fileName = self.dumpFile
+        times, drones, pairTests = self.recorded()
+        first = self.frames - len(times)
+        with open(fileName, "w") as dumpFile:
+            writer = csv.writer(dumpFile, lineterminator="\n")
+            writer.writerow(("frame",) + PHASES + ("total", "drones", "pairTests"))
+            for index in range(len(times)):
+                row = times[index] * 1000
+                writer.writerow([first + index] + ["%.3f" % value for value in row] +
+                                ["%.3f" % row.sum(), drones[index], pairTests[index]])
+        return fileName
+
+
+def loadDump(fileName):
+    """Return {column: array} of a CSV written by FrameProfiler.dump"""
+    with open(fileName) as dumpFile:
+        rows = list(csv.reader(dumpFile))
+    values = numpy.array(rows[1:], dtype=float).reshape(-1, len(rows[0]))
+    return dict((name, values[:, index]) for index, name in enumerate(rows[0]))
+
+
+def summary(columns, points=(50, 95, 99)):
+    return dict((name, numpy.percentile(columns[name], points)) for name in PHASES + ("total", "drones", "pairTests"))
+
+
+if __name__ == "__main__":
+    summaries = [summary(loadDump(fileName)) for fileName in sys.argv[1:3]]
+    print("%-10s" % "" + "".join("%27s" % fileName for fileName in sys.argv[1:3]) +
+          ("   p95 diff" if len(summaries) == 2 else ""))
+    for name in PHASES + ("total", "drones", "pairTests"):
+        line = "%-10s" % name
+        for result in summaries:
+            line += " %8.3f %8.3f %8.3f" % tuple(result[name])
+        if len(summaries) == 2:
+            line += "   %+8.3f" % (summaries[1][name][1] - summaries[0][name][1])
+        print(line)
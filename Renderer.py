@@ -0,0 +1,59 @@
+__author__ = 'Simon'
+"""Dirty rectangle rendering
+
+Instead of blitting and flipping the whole window every frame, only the rectangles that changed are copied to the
+screen and pushed with pygame.display.update. If too much of the window changed a full flip is cheaper.
+"""
+
+import pygame
+
+
+class DirtyRenderer(object):
+    def __init__(self, screen, threshold=0.4):
+        """threshold is the fraction of the screen area above which a full flip is done"""
+        self.screen = screen
+        self.threshold = threshold
+        self.dirtyRects = list()
+        self.fullRedraw = True
+        self.fullFrames = 0
+        self.partialFrames = 0
+        self.skippedFrames = 0
+        self.updatedArea = 0
+
+    def invalidate(self):
+        """Redraw the whole screen on next present (state change, fullscreen toggle, expose)"""
+        self.fullRedraw = True
+
+    def addDirty(self, rect):
+        """Mark rect (in screen coordinates) as changed"""
+        self.dirtyRects.append(pygame.Rect(rect))
+
+    def present(self, layers):
+        """Copy dirty parts of layers to the screen and update the display
+
+        layers is a sequence of (surface, position) pairs in drawing order.
+        """
+        screenRect = self.screen.get_rect()
+        rects = [rect.clip(screenRect) for rect in self.dirtyRects]
+        rects = [rect for rect in rects if rect.width and rect.height]
+        area = sum(rect.width * rect.height for rect in rects)
+        if self.fullRedraw or area > self.threshold * screenRect.width * screenRect.height:
+            for surface, position in layers:
+                self.screen.blit(surface, position)
+            pygame.display.flip()
+            self.fullFrames += 1
+            self.updatedArea = screenRect.width * screenRect.height
+        elif rects:
+            for rect in rects:
+                for surface, position in layers:
+                    source = rect.move(-position[0], -position[1]).clip(surface.get_rect())
+                    if source.width and source.height:
+                        self.screen.blit(surface, (source.x + position[0], source.y + position[1]), source)
+            pygame.display.update(rects)
+            self.partialFrames += 1
+            self.updatedArea = area
+        else:
+            self.skippedFrames += 1
+            self.updatedArea = 0
+        self.dirtyRects = list()
+        self.fullRedraw = False
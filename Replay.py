@@ -0,0 +1,181 @@
+__author__ = 'Simon'
+"""Session recording and replay
+
+Recorder writes the simulation seed and, for every frame that touches the simulation, the frame time in ms and the
+Controls.ControlState into a compact binary log. Frames outside of a round without input are skipped, the timer and
+landers do not move then. When the game quits the results of every round are appended.
+
+Replayer re-runs a log headlessly as fast as possible and checks score, crashes and timer of every round against
+the recording, so recorded sessions double as regression and performance workloads:
+
+    python Replay.py session.clr [repeat]
+
+Format (little endian): header "CLREPLY2", world width, height (uint32), seed (uint64); per frame delta ms and flags
+(uint16 each), followed by spawns (uint8) and clicks (uint8 count, int32 world x and y each) if flagged; delta
+0xFFFF ends the frames, then frame count (uint32), round count (uint16) and score, crashed (int32), secondsLeft
+(double) per round. Other headers, like "CLREPLAY" of the first format, are rejected.
+"""
+
+import struct
+import sys
+import time
+import Controls
+import Simulation
+import enums
+
+MAGIC = b"CLREPLY2"
+HEADER = struct.Struct("<8sIIQ")
+FRAME = struct.Struct("<HH")
+CLICK = struct.Struct("<ii")
+COUNT = struct.Struct("<B")
+TRAILER = struct.Struct("<IH")
+ROUND = struct.Struct("<iid")
+ENDMARKER = 0xFFFF
+MAXDELTA = 0xFFFE
+
+THRUSTSET = 1
+THRUSTON = 2
+RELEASE = 4
+SPAWNS = 8
+CLICKS = 16
+STARTED = 32
+RESTARTED = 64
+HORIZONTALSHIFT = 8
+HORIZONTAL = (None, Controls.LEFT, Controls.RIGHT, Controls.RELEASE)
+
+
+def encodeFrame(deltaMs, controls):
+    flags = HORIZONTAL.index(controls.horizontal) << HORIZONTALSHIFT
+    if controls.thrust is not None:
+        flags |= THRUSTSET | (THRUSTON if controls.thrust else 0)
+    if controls.release:
+        flags |= RELEASE
+    if controls.spawns:
+        flags |= SPAWNS
+    if controls.clicks:
+        flags |= CLICKS
+    if controls.started:
+        flags |= STARTED
+    if controls.restarted:
+        flags |= RESTARTED
+    data = FRAME.pack(deltaMs, flags)
+    if controls.spawns:
+        data += COUNT.pack(min(controls.spawns, 255))
+    if controls.clicks:
+        clicks = controls.clicks[:255]
+        data += COUNT.pack(len(clicks)) + b"".join(CLICK.pack(int(x), int(y)) for x, y in clicks)
+    return data
+
+
+def readFrames(data, offset):
+    """Yield (deltaMs, ControlState) from offset up to the end marker, the last item is the offset after it"""
+    while offset + FRAME.size <= len(data):
+        deltaMs, flags = FRAME.unpack_from(data, offset)
+        offset += FRAME.size
+        if deltaMs == ENDMARKER:
+            break
+        controls = Controls.ControlState()
+        if flags & THRUSTSET:
+            controls.thrust = bool(flags & THRUSTON)
+        controls.horizontal = HORIZONTAL[flags >> HORIZONTALSHIFT & 3]
+        controls.release = bool(flags & RELEASE)
+        controls.started = bool(flags & STARTED)
+        controls.restarted = bool(flags & RESTARTED)
+        if flags & SPAWNS:
+            controls.spawns = COUNT.unpack_from(data, offset)[0]
+            offset += COUNT.size
+        if flags & CLICKS:
+            count = COUNT.unpack_from(data, offset)[0]
+            offset += COUNT.size
+            for i in range(count):
+                controls.clicks.append(CLICK.unpack_from(data, offset))
+                offset += CLICK.size
+        yield deltaMs, controls
+    yield offset
+
+
+def roundResult(simulation):
+    return simulation.score, simulation.crashed, simulation.secondsLeft
+
+
+class Recorder(object):
+    def __init__(self, fileName, simulation):
+        self.file = open(fileName, "wb")
+        self.file.write(HEADER.pack(MAGIC, simulation.drawSize[0], simulation.drawSize[1], simulation.seed))
+        self.frames = 0
+        self.rounds = list()
+
+    def record(self, simulation, deltaMs, controls):
+        """Call before simulation.step with the frame's controls, after started or restarted was applied"""
+        if controls.started or controls.restarted or simulation.GAMESTATE == enums.GAMESTATE.RUNNING:
+            self.file.write(encodeFrame(min(deltaMs, MAXDELTA), controls))
+            self.frames += 1
+
+    def roundEnded(self, simulation):
+        """Call before simulation.restart"""
+        self.rounds.append(roundResult(simulation))
+
+    def close(self, simulation):
+        """Write end marker and results of all rounds"""
+        rounds = self.rounds + [roundResult(simulation)]
+        self.file.write(FRAME.pack(ENDMARKER, 0) + TRAILER.pack(self.frames, len(rounds)))
+        for result in rounds:
+            self.file.write(ROUND.pack(*result))
+        self.file.close()
+
+
+class Replayer(object):
+    def __init__(self, fileName):
+        with open(fileName, "rb") as replayFile:
+            self.data = replayFile.read()
+        magic = self.data[:len(MAGIC)]
+        if magic != MAGIC or len(self.data) < HEADER.size:
+            raise ValueError("%s is no CargoLander replay of format %r (header %r)" % (fileName, MAGIC, magic))
+        magic, self.width, self.height, self.seed = HEADER.unpack_from(self.data)
+        frames = list(readFrames(self.data, HEADER.size))
+        self.frames = frames[:-1]
+        offset = frames[-1]
+        self.recordedRounds = None
+        if offset + TRAILER.size <= len(self.data):
+            frameCount, roundCount = TRAILER.unpack_from(self.data, offset)
+            offset += TRAILER.size
+            self.recordedRounds = [ROUND.unpack_from(self.data, offset + index * ROUND.size)
+                                   for index in range(roundCount)]
+
+    def run(self):
+        """Replay all frames on a new Simulation, return the results of all rounds"""
+        simulation = Simulation.Simulation(self.width, self.height, self.seed)
+        rounds = list()
+        for deltaMs, controls in self.frames:
+            if controls.restarted:
+                rounds.append(roundResult(simulation))
+                simulation.restart()
+            if controls.started:
+                simulation.GAMESTATE = enums.GAMESTATE.RUNNING
+            simulation.step(deltaMs / 1000.0, controls)
+        rounds.append(roundResult(simulation))
+        return rounds
+
+    def verify(self, rounds):
+        """Return True if rounds equal the recorded results, None if the log has none (game did not quit)"""
+        if self.recordedRounds is None:
+            return None
+        return [tuple(result) for result in rounds] == self.recordedRounds
+
+
+if __name__ == "__main__":
+    myReplayer = Replayer(sys.argv[1])
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    start = time.time()
+    for i in range(repeat):
+        myRounds = myReplayer.run()
+    duration = time.time() - start
+    recordedTime = sum(deltaMs for deltaMs, controls in myReplayer.frames) / 1000.0
+    print("%d frames (%.1f s of play) in %.3f s, %.0f frames/s, %.0fx real time" % (
+        len(myReplayer.frames), recordedTime, duration / repeat, len(myReplayer.frames) * repeat / duration,
+        recordedTime * repeat / duration))
+    for myRound in myRounds:
+        print("score %d, crashed %d, %.3f s left" % myRound)
+    myResult = myReplayer.verify(myRounds)
+    print({True: "matches recording", False: "DIFFERS from recording", None: "no recorded results"}[myResult])
+    sys.exit(1 if myResult is False else 0)
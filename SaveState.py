@@ -0,0 +1,165 @@
+__author__ = 'Simon'
+"""Binary snapshots of a running simulation
+
+capture returns the complete state of a Simulation (round fields, random generator and every lander) as bytes,
+restore puts it back into a simulation with the same size and parameters, load creates a new one. Both directions
+copy whole NumPy arrays, restored landers are the Simulation's per-slot Lander views, so checkpoints are cheap enough
+for rollback, "retry from here" (F5/F9 in the game), crash dumps and seeding benchmark scenarios.
+
+The spawn allocator reads the restored landers again, the collision grid is rebuilt by the next step. Landers are
+stored in the order of landerList and get the physics slots 0..n-1.
+
+Format (little endian): header "CLSTATE", version (uint8), world width, height (uint32), seed (uint64), lander
+count (uint32); parameters (6 doubles, integrator index, sweptCollision); score, lives, crashed, landed,
+landerCount (int32), secondsLeft (double), state index (uint8); random generator state (625 uint32, has gauss
+(bool), gauss (double)); one LANDER record per lander. Only states of this VERSION are read, like Replay only reads
+its current format.
+
+    python SaveState.py [drones]     time capture and restore
+"""
+
+import struct
+import numpy
+import Lander
+import Simulation
+import enums
+
+MAGIC = b"CLSTATE"
+VERSION = 2
+HEADER = struct.Struct("<7sBIIQI")
+PARAMETERS = struct.Struct("<6dB?")
+GAME = struct.Struct("<5idB")
+GAUSS = struct.Struct("<?d")
+RANDOMWORDS = 625
+INTEGRATORS = ("euler", "exact")
+STATES = (enums.GAMESTATE.RUNNING, enums.GAMESTATE.GAMEOVER, enums.GAMESTATE.TIMEUP, enums.GAMESTATE.STARTSCREEN,
+          enums.GAMESTATE.HELPSCREEN, enums.GAMESTATE.QUIT)
+FLOATS = ("xPos", "yPos", "fallSpeed", "horizontalSpeed", "thrustPower", "fuelLeft")
+LANDER = numpy.dtype([(name, "<f8") for name in FLOATS] + [("flags", "u1"), ("color", "u1"), ("serial", "<i8")])
+# bits of LANDER flags
+FLAGS = (("isThrustOn", 1), ("horizontalThrustLeftOn", 2), ("horizontalThrustRightOn", 4), ("isAlive", 8))
+GRABBED = 16
+
+
+def capture(simulation):
+    """Return the state of simulation as bytes, lander records are gathered straight into the result"""
+    count = len(simulation.landerList)
+    physics = simulation.physics
+    parameters = simulation.parameters
+    version, words, gauss = simulation.random.getstate()
+    head = b"".join((
+        HEADER.pack(MAGIC, VERSION, simulation.drawSize[0], simulation.drawSize[1], simulation.seed, count),
+        PARAMETERS.pack(parameters.gravity, parameters.crashSpeed, parameters.thrustPower, parameters.fuel,
+                        parameters.roundLength, parameters.nextRoundLength,
+                        INTEGRATORS.index(parameters.integrator), parameters.sweptCollision),
+        GAME.pack(simulation.score, simulation.lives, simulation.crashed, simulation.landed, simulation.landerCount,
+                  simulation.secondsLeft, STATES.index(simulation.GAMESTATE)),
+        numpy.array(words, dtype="<u4").tobytes(),
+        GAUSS.pack(gauss is not None, gauss or 0.0)))
+    data = bytearray(len(head) + count * LANDER.itemsize)
+    data[:len(head)] = head
+    records = numpy.frombuffer(data, dtype=LANDER, count=count, offset=len(head))
+
+    slots = simulation.landerSlots()
+    for name in FLOATS:
+        records[name] = getattr(physics, name)[slots]
+    flags = numpy.zeros(count, dtype=numpy.uint8)
+    for name, bit in FLAGS:
+        flags |= getattr(physics, name)[slots].astype(numpy.uint8) * bit
+    if simulation.grabbed:
+        grabbed = numpy.zeros(physics.size, dtype=numpy.uint8)
+        grabbed[[lander.slot for lander in simulation.grabbed]] = GRABBED
+        flags |= grabbed[slots]
+    records["flags"] = flags
+    records["color"] = physics.colorIndex[slots]
+    records["serial"] = physics.serial[slots]
+    return bytes(data)
+
+
+def readHeader(data):
+    """Return (width, height, seed, lander count, Simulation.Parameters) of a snapshot"""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("no CargoLander state")
+    magic, version, width, height, seed, count = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError("CargoLander state version %d, only version %d can be read" % (version, VERSION))
+    values = PARAMETERS.unpack_from(data, HEADER.size)
+    parameters = Simulation.Parameters(*values[:6], integrator=INTEGRATORS[values[6]], sweptCollision=values[7])
+    return width, height, seed, count, parameters
+
+
+def restore(simulation, data):
+    """Put the state captured in data back into simulation, which needs the same size and parameters"""
+    width, height, seed, count, parameters = readHeader(data)
+    if (width, height) != simulation.drawSize or parameters.asDict() != simulation.parameters.asDict():
+        raise ValueError("state of a %dx%d simulation with other parameters, use load" % (width, height))
+    offset = HEADER.size + PARAMETERS.size
+    (simulation.score, simulation.lives, simulation.crashed, simulation.landed, simulation.landerCount,
+     simulation.secondsLeft, state) = GAME.unpack_from(data, offset)
+    simulation.GAMESTATE = STATES[state]
+    simulation.seed = seed
+    offset += GAME.size
+    words = numpy.frombuffer(data, dtype="<u4", count=RANDOMWORDS, offset=offset)
+    offset += RANDOMWORDS * 4
+    hasGauss, gauss = GAUSS.unpack_from(data, offset)
+    offset += GAUSS.size
+    simulation.random.setstate((3, tuple(words.tolist()), gauss if hasGauss else None))
+    records = numpy.frombuffer(data, dtype=LANDER, count=count, offset=offset)
+
+    # landers take slots 0..count-1, their Lander views are created on first use
+    physics = simulation.physics
+    physics.reset()
+    if physics.capacity < count:
+        physics.allocate(max(count, 2 * physics.capacity))
+    physics.size = count
+    for name in FLOATS:
+        getattr(physics, name)[:count] = records[name]
+    flags = records["flags"]
+    for name, bit in FLAGS:
+        getattr(physics, name)[:count] = flags & bit != 0
+    physics.colorIndex[:count] = records["color"]
+    physics.serial[:count] = records["serial"]
+    for name in ("deltaX", "curveB", "curveC"):
+        getattr(physics, name)[:count] = 0
+    # views of living landers and of free slots have no collision flags set (see Simulation.retireLander)
+    if count:
+        simulation.landerView(count - 1)
+    simulation.landerList[:] = simulation.views[:count]
+    simulation.slots = numpy.arange(count)
+    simulation.indexedSlots = None
+    simulation.grabbed = set(simulation.views[slot] for slot in numpy.flatnonzero(flags & GRABBED).tolist())
+    # like Simulation.restart, the next step fills the grid with the restored landers
+    simulation.grid.rebuild(list())
+    simulation.spawner.invalidate()
+    Lander.advanceSerials(int(records["serial"].max()) if count else 0)
+
+
+def load(data):
+    """Return a new Simulation in the state captured in data"""
+    width, height, seed, count, parameters = readHeader(data)
+    simulation = Simulation.Simulation(width, height, seed, parameters)
+    restore(simulation, data)
+    return simulation
+
+
+if __name__ == "__main__":
+    import sys
+    import timeit
+    import Benchmark
+    drones = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    # landers falling below the platforms like Benchmark.droneScenario
+    mySimulation = Benchmark.runningSimulation(500 + 50 * (drones // 6 + 1) + 5000)
+    Benchmark.populate(mySimulation, drones, 500)
+    for i in range(10):
+        mySimulation.step(1 / 60.0)
+    myData = capture(mySimulation)
+    repeat = 200
+    captureTime = timeit.timeit(lambda: capture(mySimulation), number=repeat) / repeat
+    restoreTime = timeit.timeit(lambda: restore(mySimulation, myData), number=repeat) / repeat
+    print("%d drones, %d bytes: capture %.3f ms, restore %.3f ms" % (drones, len(myData), captureTime * 1000,
+                                                                     restoreTime * 1000))
+    myCopy = load(myData)
+    for i in range(120):
+        mySimulation.step(1 / 60.0)
+        myCopy.step(1 / 60.0)
+    print("continued copy %s" % ("matches" if capture(myCopy) == capture(mySimulation) else "DIFFERS"))
@@ -0,0 +1,170 @@
+__author__ = 'Simon'
+"""Simulation on its own thread
+
+SimulationThread steps the Simulation at a fixed rate, independent of drawing and display.flip. After every step it
+publishes an immutable Snapshot of drone and HUD state. The last two snapshots are kept as a pair (double buffer)
+that is replaced as a whole, so the render loop always reads a consistent pair without locking and interpolates
+drone positions between them, one simulation step behind.
+
+Input is handed over with post(controls), all input of one step is merged. Code on the main thread that changes the
+simulation directly (start, restart, highscores) holds lock, the simulation thread holds it while stepping.
+Step lengths are whole milliseconds (16, 17, 17, 16, ... at 60 Hz), so a Replay.Recorder records replayable logs.
+"""
+
+import collections
+import threading
+import time
+import numpy
+import Controls
+import Lander
+
+Snapshot = collections.namedtuple("Snapshot", (
+    "tick", "time", "serials", "slots", "xPos", "yPos", "fallSpeed", "horizontalSpeed", "fuelLeft", "flags",
+    "colors", "state", "score", "lives", "secondsLeft", "pairTests", "wrapWidth"))
+# bits of Snapshot.flags
+THRUST = 1
+LEFT = 2
+RIGHT = 4
+
+
+def takeSnapshot(simulation, tick=0, publishTime=0.0):
+    """Return a Snapshot of the living landers and HUD values of simulation
+
+    Arrays are copies and read-only, so snapshots are safe to read from any thread.
+    """
+    physics = simulation.physics
+    slots = simulation.landerSlots()
+    slots = slots[physics.isAlive[slots]]
+    colors = tuple(Lander.COLORS[index] for index in physics.colorIndex[slots].tolist())
+    arrays = [physics.serial[slots], slots]
+    arrays.extend(getattr(physics, name)[slots]
+                  for name in ("xPos", "yPos", "fallSpeed", "horizontalSpeed", "fuelLeft"))
+    flags = numpy.zeros(len(slots), dtype=numpy.uint8)
+    for name, bit in (("isThrustOn", THRUST), ("horizontalThrustLeftOn", LEFT), ("horizontalThrustRightOn", RIGHT)):
+        flags[getattr(physics, name)[slots]] |= bit
+    arrays.append(flags)
+    for array in arrays:
+        array.flags.writeable = False
+    return Snapshot(tick, publishTime, *arrays, colors=colors,
+                    state=simulation.GAMESTATE, score=simulation.score, lives=simulation.lives - simulation.crashed,
+                    secondsLeft=simulation.secondsLeft, pairTests=simulation.grid.pairTests,
+                    wrapWidth=physics.wrapWidth)
+
+
+def interpolate(previous, current, alpha):
+    """Return x and y of the drones of current, moved back towards previous by 1 - alpha
+
+    Drones are matched by serial, new drones and drones wrapping around the world (at current.wrapWidth) are drawn at
+    their current place.
+    """
+    xPos = current.xPos
+    yPos = current.yPos
+    if previous is None or alpha >= 1 or not len(previous.serials) or not len(current.serials):
+        return xPos, yPos
+    order = numpy.argsort(previous.serials)
+    index = numpy.searchsorted(previous.serials, current.serials, sorter=order)
+    index = order[numpy.minimum(index, len(order) - 1)]
+    known = previous.serials[index] == current.serials
+    startX = previous.xPos[index]
+    known &= numpy.abs(xPos - startX) < current.wrapWidth / 2.0
+    xPos = numpy.where(known, startX + (xPos - startX) * alpha, xPos)
+    yPos = numpy.where(known, previous.yPos[index] + (yPos - previous.yPos[index]) * alpha, yPos)
+    return xPos, yPos
+
+
+class SimulationThread(threading.Thread):
+    def __init__(self, simulation, rate=60, lock=None, recorder=None, maxCatchUp=5):
+        """Step simulation rate times per second
+
+        recorder (Replay.Recorder) records every step. A step starting more than one step late counts as late,
+        if the thread falls more than maxCatchUp steps behind the missed steps are dropped (the game slows down).
+        """
+        threading.Thread.__init__(self, name="simulation")
+        self.daemon = True
+        self.simulation = simulation
+        self.rate = rate
+        self.stepTime = 1.0 / rate
+        self.lock = lock if lock is not None else threading.RLock()
+        self.recorder = recorder
+        self.maxCatchUp = maxCatchUp
+        self.pending = Controls.ControlState()
+        self.ticks = 0
+        self.lateTicks = 0
+        self.droppedTicks = 0
+        self.stopped = threading.Event()
+        self.snapshots = (None, takeSnapshot(simulation, 0, time.perf_counter()))
+
+    def post(self, controls):
+        """Hand over one frame of input, it is applied with the next step"""
+        with self.lock:
+            self.pending.merge(controls)
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        start = time.perf_counter()
+        step = 0
+        while not self.stopped.is_set():
+            deadline = start + step * self.stepTime
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                self.stopped.wait(delay)
+                continue
+            if -delay > self.stepTime:
+                self.lateTicks += 1
+                behind = int(-delay / self.stepTime)
+                if behind > self.maxCatchUp:
+                    # give up on the missed steps instead of stepping in a burst
+                    self.droppedTicks += behind
+                    start = time.perf_counter() - step * self.stepTime
+            deltaMs = int(round((step + 1) * 1000.0 / self.rate)) - int(round(step * 1000.0 / self.rate))
+            self.tick(deltaMs)
+            step += 1
+
+    def tick(self, deltaMs):
+        """Step once with all input posted since the last step and publish a new snapshot"""
+        simulation = self.simulation
+        with self.lock:
+            controls = self.pending
+            self.pending = Controls.ControlState()
+            if self.recorder is not None:
+                self.recorder.record(simulation, deltaMs, controls)
+            simulation.step(deltaMs / 1000.0, controls)
+            self.ticks += 1
+            snapshot = takeSnapshot(simulation, self.ticks, time.perf_counter())
+        self.snapshots = (self.snapshots[1], snapshot)
+
+    def view(self, now=None):
+        """Return the latest snapshot and drone positions interpolated for the render time now (one step behind)"""
+        previous, current = self.snapshots
+        if now is None:
+            now = time.perf_counter()
+        alpha = min(max((now - current.time) / self.stepTime, 0.0), 1.0)
+        xPos, yPos = interpolate(previous, current, alpha)
+        return current, xPos, yPos
+
+
+class FramePacer(object):
+    """Limit the render loop to fps and count late and dropped frames
+
+    A frame is late if it took 1.5 frame times or more, every whole frame time it missed counts as a dropped frame.
+    """
+
+    def __init__(self, fps=60):
+        self.fps = fps
+        self.frameMs = 1000.0 / fps
+        self.frames = 0
+        self.lateFrames = 0
+        self.droppedFrames = 0
+
+    def tick(self, clock):
+        """Wait for the next frame with pygame.time.Clock clock, return ms since the last frame"""
+        deltaMs = clock.tick(self.fps)
+        self.frames += 1
+        if self.frames > 1 and deltaMs >= 1.5 * self.frameMs:
+            self.lateFrames += 1
+            self.droppedFrames += int(round(deltaMs / self.frameMs)) - 1
+        return deltaMs
@@ -0,0 +1,388 @@
+__author__ = 'Simon'
+"""Headless simulation core of CargoLander
+
+Simulation steps landers, platforms, scoring, lives and the timer without any surface or pygame import,
+so it runs on machines without a display. Game wraps it and only adds input, drawing and screens.
+"""
+
+import random
+import numpy
+import Controls
+import Lander
+import Level
+import Physics
+import Profiler
+import Grid
+import Impact
+import Spawn
+import enums
+
+
+class Parameters(object):
+    """Physics and round constants of a simulation, Sweep varies them to balance the game"""
+
+    def __init__(self, gravity=15, crashSpeed=40.0, thrustPower=25.0, fuel=10, roundLength=75, nextRoundLength=90,
+                 integrator="euler", sweptCollision=False):
+        """gravity, thrustPower in px/s^2, crashSpeed in px/s, fuel in seconds of thrust, round lengths in seconds
+
+        The first round lasts roundLength, rounds after a restart nextRoundLength.
+        integrator "exact" with sweptCollision gives the same results at 10 Hz as at 60 Hz (see Physics, Impact),
+        the defaults keep the original per-frame rules.
+        """
+        self.gravity = gravity
+        self.crashSpeed = crashSpeed
+        self.thrustPower = thrustPower
+        self.fuel = fuel
+        self.roundLength = roundLength
+        self.nextRoundLength = nextRoundLength
+        self.integrator = integrator
+        self.sweptCollision = sweptCollision
+
+    def asDict(self):
+        return dict(self.__dict__)
+
+
+class Simulation(object):
+    """Game logic and state of one round"""
+
+    def __init__(self, x, y, seed=None, parameters=None, level=None):
+        """seed initialises random, the generator for spawn positions and colors (drawn at random if None)
+
+        parameters defaults to Parameters(), level (Level.Level) to the default layout of a world of x * y.
+        A given level replaces x and y by its size.
+        """
+        if parameters is None:
+            parameters = Parameters()
+        if level is None:
+            level = Level.forSize(x, y)
+        self.parameters = parameters
+        self.level = level
+        self.drawSize = level.size
+        self.landerList = list()
+        # Lander objects by physics slot, created on first use and reused by every lander taking the slot
+        self.views = list()
+        # physics slots of landerList, None until landerSlots() is called after a lander was added
+        self.slots = None
+        # slots of the landers in the grid's index (see pickRect), None if the index is out of date
+        self.indexedSlots = None
+        self.grabbed = set()
+        self.landerCount = 0
+        self.platformList = list()
+        self.platformOrder = dict()
+        self.physics = Physics.Physics(parameters.gravity, integrator=parameters.integrator, wrapWidth=level.wrapWidth)
+        self.grid = Grid.CollisionGrid()
+        self.spawner = Spawn.SpawnAllocator(self.physics, *level.spawnBand)
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.random = random.Random(seed)
+        # Game replaces the disabled profiler by its own
+        self.profiler = Profiler.FrameProfiler(capacity=1)
+        self.score = 0
+        self.lives = 4
+        self.crashed = 0
+        self.landed = 0
+        self.secondsLeft = parameters.roundLength
+        self.GAMESTATE = enums.GAMESTATE.STARTSCREEN
+        self.initPlatforms()
+
+    def step(self, deltaTime, controls=None):
+        """Apply controls (Controls.ControlState), advance timer and landers by deltaTime and check for game over"""
+        if controls is not None and self.GAMESTATE == enums.GAMESTATE.RUNNING:
+            self.applyControls(controls)
+        self.updateTimeLeft(deltaTime)
+        self.profiler.mark("controls")
+        if self.GAMESTATE == enums.GAMESTATE.RUNNING:
+            self.updateLanders(deltaTime)
+        self.checkGameOver()
+
+    def run(self, deltaTime, maxSteps=None, controller=None):
+        """Step as fast as possible until the round ends (or maxSteps), return number of steps
+
+        controller is called with the simulation before every step, e.g. to spawn landers or thrust.
+        """
+        self.GAMESTATE = enums.GAMESTATE.RUNNING
+        steps = 0
+        while self.GAMESTATE == enums.GAMESTATE.RUNNING and (maxSteps is None or steps < maxSteps):
+            if controller is not None:
+                controller(self)
+            self.step(deltaTime)
+            steps += 1
+        return steps
+
+    def applyControls(self, controls):
+        """Apply one frame of input to all living landers at once
+
+        Order: clicks, mouse release, spawns, thrust, steering.
+        Clicks are picked at the positions of the last step, i.e. where the landers were drawn.
+        A click grabs the landers under the mouse, releasing the button only stops those.
+        """
+        for position in controls.clicks:
+            for lander in self.pick(position):
+                lander.thrust()
+                self.grabbed.add(lander)
+        if controls.release:
+            for lander in self.grabbed:
+                lander.unthrust()
+            self.grabbed.clear()
+        for i in range(controls.spawns):
+            self.spawnLander(forced=True)
+        if controls.thrust is not None:
+            self.physics.setThrust(controls.thrust)
+        if controls.horizontal == Controls.RELEASE:
+            self.physics.setHorizontalThrust(None)
+        elif controls.horizontal is not None:
+            self.physics.setHorizontalThrust(controls.horizontal)
+
+    def pick(self, position):
+        """Return landers drawn at position (world coordinates)"""
+        return self.pickRect(position, position)
+
+    def pickRect(self, corner1, corner2):
+        """Return living landers overlapping the (inclusive) rectangle spanned by two corners, e.g. a drag selection
+
+        Answered from the grid index of the last collide, landers are indexed again if it is out of date.
+        """
+        if self.indexedSlots is None or self.grid.indexed is None:
+            slots = self.landerSlots()
+            self.grid.index(self.physics.xPos[slots], self.physics.yPos[slots], Lander.SIZE)
+            self.indexedSlots = slots
+        slots = self.indexedSlots[self.grid.queryRect(corner1[0], corner1[1], corner2[0], corner2[1])]
+        return [self.views[slot] for slot in slots[self.physics.isAlive[slots]].tolist()]
+
+    def landerSlots(self):
+        """Return the physics slots of landerList as array, kept until landerList changes"""
+        if self.slots is None:
+            self.slots = numpy.fromiter((lander.slot for lander in self.landerList), dtype=int,
+                                        count=len(self.landerList))
+        return self.slots
+
+    def updateLanders(self, deltaTime):
+        """Analyse list of lander objects
+
+         landerList only holds living landers. Step physics of all landers at once and rebuild the collision grid,
+         then loop through all landers and check collisions against nearby objects.
+         Landers that landed or crashed this frame add to score and crashed and are retired.
+        """
+        self.spawnLander()
+        self.profiler.mark("spawn")
+        self.physics.step(deltaTime)
+        self.spawner.invalidate()
+        self.profiler.mark("physics")
+        if self.parameters.sweptCollision:
+            self.collideSwept()
+        else:
+            self.collide()
+        self.profiler.mark("collision")
+        slots = self.landerSlots()
+        aliveMask = self.physics.isAlive[slots]
+        alive = aliveMask.tolist()
+        for lander, living in zip(self.landerList, alive):
+            if not living:
+                if lander.hasScored:
+                    self.landed += 1
+                    if lander.color == lander.collisionPartner.color:
+                        self.score += 3
+                    else:
+                        self.score += 1
+                elif lander.hasCrashed:
+                    self.crashed += 1
+                self.retireLander(lander)
+        self.landerList[:] = [lander for lander, living in zip(self.landerList, alive) if living]
+        self.slots = slots[aliveMask]
+        self.landerCount = len(self.landerList)
+        self.profiler.mark("scoring")
+
+    def collide(self):
+        """Lander.collide for all landers at once, positions are read once per step from the physics arrays
+
+        Same result as calling collide on every lander in the order of landerList: leaving the screen crashes,
+        touching a platform lands if fallSpeed is at most crashSpeed (the last platform touched is the partner) and
+        touching another lander crashes the one first in landerList (the later one no longer sees it alive).
+        All landers have moved (Physics.step) before the first one collides, the original Lander.update moved and
+        collided one lander after the other.
+        """
+        landers = self.landerList
+        if not landers:
+            self.grid.pairTests = 0
+            self.indexedSlots = None
+            return
+        physics = self.physics
+        slots = self.landerSlots()
+        xPos = physics.xPos[slots]
+        yPos = physics.yPos[slots]
+        edge = yPos > self.drawSize[1]
+        first, second = self.grid.overlaps(xPos, yPos, Lander.SIZE)
+        self.indexedSlots = slots
+        landerHit = numpy.zeros(len(landers), dtype=bool)
+        landerHit[first] = True
+        platforms, tests = self.grid.static.lastOverlap(xPos, yPos, xPos + Lander.SIZE[0], yPos + Lander.SIZE[1])
+        self.grid.pairTests += tests
+        platformHit = (platforms >= 0) & ~edge
+        landed = platformHit & (physics.fallSpeed[slots] <= self.parameters.crashSpeed)
+        crashed = (landerHit & ~edge) | (platformHit & ~landed)
+        for index in numpy.flatnonzero(edge | platformHit | landerHit).tolist():
+            lander = landers[index]
+            lander.isAlive = False
+            if edge[index]:
+                lander.collisionPartner = "EDGE"
+                lander.hasCrashed = True
+                continue
+            if platformHit[index]:
+                lander.collisionPartner = self.platformList[platforms[index]]
+            # a lander on a platform that also touches another lander counts as landed (see updateLanders)
+            lander.hasScored = bool(landed[index])
+            lander.hasCrashed = bool(crashed[index])
+
+    def collideSwept(self):
+        """Find the first contact of every lander during the last physics step and resolve them in time order
+
+        Same rules as Lander.collide: leaving the screen crashes, touching a platform lands if the fall speed at the
+        moment of impact is at most crashSpeed, touching another living lander crashes the one first in landerList.
+        Landers that hit something get impactTime (seconds into the step) and impactSpeed.
+        """
+        physics = self.physics
+        landers = self.landerList
+        boxes = [Impact.sweptBox(physics, lander.slot, lander.drawSize) for lander in landers]
+        self.grid.rebuild(list(landers), boxes)
+        self.indexedSlots = None
+        candidates = [self.grid.candidates(lander, boxes[index]) for index, lander in enumerate(landers)]
+        # only platforms near a lander take part, in the order of platformList like a scan over all of them
+        platforms = dict((id(object), object) for nearby in candidates for object in nearby
+                         if object.type == "PLATFORM")
+        objects = landers + sorted(platforms.values(), key=lambda platform: self.platformOrder[id(platform)])
+        indices = dict((id(object), index) for index, object in enumerate(objects))
+        pairs = list()
+        for index, nearby in enumerate(candidates):
+            for object in nearby:
+                if indices[id(object)] > index:
+                    pairs.append((index, indices[id(object)]))
+        motion = numpy.zeros((len(objects), 5))
+        for index, object in enumerate(objects):
+            if object.type == "LANDER":
+                slot = object.slot
+                motion[index] = (physics.startX[slot], physics.deltaX[slot], physics.startY[slot],
+                                 physics.curveB[slot], physics.curveC[slot])
+            else:
+                motion[index] = (object.xPos, 0, object.yPos, 0, 0)
+        sizes = numpy.array([object.drawSize for object in objects], dtype=float).reshape(-1, 2)
+        events = list()
+        if landers:
+            edgeTimes = Impact.firstContact(motion[:len(landers), 0], 0, -numpy.inf, numpy.inf,
+                                            motion[:len(landers), 2], motion[:len(landers), 3],
+                                            motion[:len(landers), 4], self.drawSize[1], numpy.inf, physics.deltaTime)
+            events.extend((time, index, -1) for index, time in enumerate(edgeTimes) if numpy.isfinite(time))
+        if pairs:
+            first, second = numpy.array(pairs).T
+            relative = motion[first] - motion[second]
+            times = Impact.firstContact(relative[:, 0], relative[:, 1], -sizes[first, 0], sizes[second, 0],
+                                        relative[:, 2], relative[:, 3], relative[:, 4],
+                                        -sizes[first, 1], sizes[second, 1], physics.deltaTime)
+            events.extend((time, index, other) for time, (index, other) in zip(times, pairs) if numpy.isfinite(time))
+        for time, index, other in sorted(events):
+            lander = landers[index]
+            if not lander.isAlive or (other >= 0 and not objects[other].isAlive):
+                continue
+            speed = physics.speedAt(lander.slot, time)
+            if other < 0:
+                lander.collisionPartner = "EDGE"
+                lander.hasCrashed = True
+            else:
+                lander.collisionPartner = objects[other]
+                if objects[other].type == "PLATFORM" and speed <= self.parameters.crashSpeed:
+                    lander.hasScored = True
+                else:
+                    lander.hasCrashed = True
+            lander.isAlive = False
+            lander.impactTime = time
+            lander.impactSpeed = speed
+
+    def retireLander(self, lander):
+        """Free the physics slot of a dead lander, its view is clean again for the next lander in the slot"""
+        self.physics.releaseSlot(lander.slot)
+        self.grabbed.discard(lander)
+        lander.hasScored = False
+        lander.hasCrashed = False
+        lander.collisionPartner = None
+
+    def landerView(self, slot):
+        """Return the Lander object viewing slot, views up to slot are created on first use"""
+        views = self.views
+        while len(views) <= slot:
+            views.append(Lander.Lander(self, self.landerList, self.platformList, slot=len(views)))
+        return views[slot]
+
+    def addLander(self, xPos, color):
+        """Spawn a lander at xPos in a fresh slot, append it to landerList and return it"""
+        slot = self.physics.addSlot(self.parameters.thrustPower, self.parameters.fuel)
+        lander = self.landerView(slot)
+        lander.reset(xPos, color, slot)
+        self.landerList.append(lander)
+        self.slots = None
+        self.indexedSlots = None
+        return lander
+
+    def spawnLander(self, forced=False):
+        """Create and add a Lander object to landerList, return False if the spawn band is full
+
+            * Whenever there is no lander left on screen
+            * Or when there is forced spawning (e.g. space bar hit)
+        """
+        if self.landerCount == 0 or forced:
+            xPos = self.spawner.allocate(self.random)
+            if xPos is None:
+                return False
+            self.addLander(xPos, Lander.COLORS[self.random.randint(0, 2)])
+        return True
+
+    def initPlatforms(self):
+        """Create and add the platforms of the level to platformList and index them for collisions"""
+        self.platformList.extend(self.level.createPlatforms())
+        self.platformOrder = dict((id(platform), index) for index, platform in enumerate(self.platformList))
+        self.grid.setStatic(self.platformList)
+
+    def checkGameOver(self):
+        if self.lives <= self.crashed and self.GAMESTATE != enums.GAMESTATE.QUIT:
+            self.GAMESTATE = enums.GAMESTATE.GAMEOVER
+
+    def updateTimeLeft(self, deltatime):
+        if self.GAMESTATE == enums.GAMESTATE.RUNNING:
+            if self.secondsLeft <= 0:
+                self.GAMESTATE = enums.GAMESTATE.TIMEUP
+            else:
+                self.secondsLeft -= deltatime
+
+    def restart(self):
+        """Reset round, all landers are removed and platforms are kept"""
+        del self.landerList[:]
+        self.slots = None
+        self.indexedSlots = None
+        self.grabbed.clear()
+        self.grid.rebuild(list())
+        self.landerCount = 0
+        self.physics.reset()
+        self.spawner.invalidate()
+        self.score = 0
+        self.lives = 4
+        self.crashed = 0
+        self.landed = 0
+        self.secondsLeft = self.parameters.nextRoundLength
+        self.GAMESTATE = enums.GAMESTATE.STARTSCREEN
+
+
+if __name__ == "__main__":
+    import time
+
+    def spaceSpam(simulation):
+        if random.random() < 0.05:
+            simulation.spawnLander(forced=True)
+
+    mySimulation = Simulation(320, 480)
+    start = time.time()
+    steps = mySimulation.run(1 / 60.0, controller=spaceSpam)
+    duration = time.time() - start
+    print("%s after %d steps: score %d, crashed %d" % (mySimulation.GAMESTATE, steps, mySimulation.score,
+                                                       mySimulation.crashed))
+    print("%.0f steps/s, %.0fx real time" % (steps / duration, steps / 60.0 / duration))
+    print("spawn success rate %.2f, %.1f us per spawn" % (mySimulation.spawner.successRate(),
+                                                         mySimulation.spawner.meanLatency() * 1e6))
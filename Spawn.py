@@ -0,0 +1,141 @@
+__author__ = 'Simon'
+"""Spawn position allocation
+
+A new lander appears at the top of the screen. SpawnAllocator keeps the free integer x positions of that spawn band
+as sorted intervals with prefix sums, so a position is sampled uniformly from all free space with one bisect and a
+full band is reported at once instead of retrying random positions.
+
+The blocked intervals are kept per slot and updated incrementally: after landers moved (invalidate, once per step)
+the first allocation only inserts or removes the intervals of landers that entered, left or moved sideways in the
+band, one bisect each. The free intervals are derived again only when the blocked ones changed, O(k) for k landers
+in the band. Spawned landers are at least landerWidth apart, so k stays at most (xMax - xMin) / landerWidth + 1
+(see maxInBand) and sampling is O(log k). Steps without spawns cost nothing.
+"""
+
+import bisect
+import math
+import time
+import numpy
+
+
+class SpawnAllocator(object):
+    def __init__(self, physics, xMin=10, xMax=279, bandHeight=40, landerWidth=40):
+        """Landers spawn at integer x in [xMin, xMax] and y = 0
+
+        A lander blocks the spawn band while its y is at most bandHeight (the height of a new lander).
+        """
+        self.physics = physics
+        self.xMin = xMin
+        self.xMax = xMax
+        self.bandHeight = bandHeight
+        self.landerWidth = landerWidth
+        self.blocked = list()
+        self.ranges = dict()
+        self.pending = list()
+        self.freeIntervals = list()
+        self.prefix = list()
+        self.dirty = True
+        self.changes = 0
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.totalLatency = 0.0
+        self.updateFree()
+
+    def invalidate(self):
+        """Landers moved, entered or left the band, read their positions again on the next allocation"""
+        self.dirty = True
+
+    def maxInBand(self):
+        """Most landers spawned by allocate that fit into the band at once"""
+        return (self.xMax - self.xMin) // self.landerWidth + 1
+
+    def update(self):
+        """Bring the blocked intervals up to date with the landers in the band
+
+        Only slots that entered, left or moved to another blocked range touch the sorted list.
+        """
+        n = self.physics.size
+        slots = numpy.flatnonzero(self.physics.isAlive[:n] & (self.physics.yPos[:n] <= self.bandHeight))
+        xPos = self.physics.xPos[slots]
+        starts = numpy.ceil(xPos - self.landerWidth).astype(int).tolist()
+        ends = numpy.floor(xPos + self.landerWidth).astype(int).tolist()
+        current = dict(zip(slots.tolist(), zip(starts, ends)))
+        changed = bool(self.pending)
+        # ranges of landers spawned since the last update, the landers themselves are in current now
+        for blockedRange in self.pending:
+            self.unblock(blockedRange)
+        del self.pending[:]
+        for slot, blockedRange in self.ranges.items():
+            if current.get(slot) != blockedRange:
+                self.unblock(blockedRange)
+                changed = True
+        for slot, blockedRange in current.items():
+            if self.ranges.get(slot) != blockedRange:
+                bisect.insort(self.blocked, blockedRange)
+                changed = True
+        self.ranges = current
+        if changed:
+            self.changes += 1
+            self.updateFree()
+        self.dirty = False
+
+    def unblock(self, blockedRange):
+        del self.blocked[bisect.bisect_left(self.blocked, blockedRange)]
+
+    def blockedRange(self, x):
+        """Return the integer spawn positions overlapping (edges included) a lander at x"""
+        return int(math.ceil(x - self.landerWidth)), int(math.floor(x + self.landerWidth))
+
+    def block(self, x):
+        """Insert a lander that was just spawned at x, its slot is picked up by the next update"""
+        blockedRange = self.blockedRange(x)
+        bisect.insort(self.blocked, blockedRange)
+        self.pending.append(blockedRange)
+        self.updateFree()
+
+    def updateFree(self):
+        """Derive free intervals and their prefix sums from the sorted blocked intervals"""
+        self.freeIntervals = list()
+        self.prefix = list()
+        position = self.xMin
+        total = 0
+        for start, end in self.blocked + [(self.xMax + 1, self.xMax + 1)]:
+            start = min(start, self.xMax + 1)
+            if start > position:
+                self.freeIntervals.append((position, start - 1))
+                total += start - position
+                self.prefix.append(total)
+            position = max(position, end + 1)
+            if position > self.xMax:
+                break
+
+    def freeSpace(self):
+        if self.dirty:
+            self.update()
+        return self.prefix[-1] if self.prefix else 0
+
+    def allocate(self, rng):
+        """Return a uniformly sampled free x position or None if the spawn band is full"""
+        start = time.perf_counter()
+        self.attempts += 1
+        total = self.freeSpace()
+        if total == 0:
+            self.failures += 1
+            self.totalLatency += time.perf_counter() - start
+            return None
+        sample = rng.randrange(total)
+        index = bisect.bisect_right(self.prefix, sample)
+        offset = sample - (self.prefix[index - 1] if index > 0 else 0)
+        x = self.freeIntervals[index][0] + offset
+        self.block(x)
+        self.successes += 1
+        self.totalLatency += time.perf_counter() - start
+        return x
+
+    def successRate(self):
+        return float(self.successes) / self.attempts if self.attempts else 1.0
+
+    def meanLatency(self):
+        """Mean time per allocation in seconds"""
+        return self.totalLatency / self.attempts if self.attempts else 0.0
@@ -0,0 +1,57 @@
+__author__ = 'Simon'
+"""Pre-composited lander sprites
+
+Box, box overlay, body, rotor and speed light are blitted into one surface per (cargo color, light, rotor frame),
+so drawing a lander is a single blit. Fuel bars are added lazily per bar height and color.
+"""
+
+import pygame
+
+ROTORFRAMETIME = 80  # ms per rotor frame
+
+
+class SpriteCache(object):
+    def __init__(self, assets):
+        self.boxes = {(255, 0, 0): assets.redBox, (255, 255, 0): assets.yellowBox, (0, 0, 255): assets.blueBox}
+        self.lights = {False: assets.landerLightGreen, True: assets.landerLightRed}
+        self.rotors = (assets.rotorA, assets.rotorB)
+        self.bases = dict()
+        self.sprites = dict()
+        for color, box in self.boxes.items():
+            for tooFast, light in self.lights.items():
+                for frame, rotor in enumerate(self.rotors):
+                    base = pygame.Surface(box.get_size()).convert()
+                    # the PNGs are keyed (white is transparent), keep the composite transparent where all layers are
+                    colorkey = box.get_colorkey()
+                    if colorkey is not None:
+                        base.fill(colorkey)
+                    for layer in (box, assets.boxOverlay, assets.landerBody, rotor, light):
+                        base.blit(layer, (0, 0))
+                    if colorkey is not None:
+                        base.set_colorkey(colorkey, pygame.RLEACCEL)
+                    self.bases[(color, tooFast, frame)] = base
+
+    def rotorFrame(self, ticks, offset=0):
+        """Return rotor frame for pygame ticks (ms), offset lets landers spin out of phase"""
+        return (ticks // ROTORFRAMETIME + offset) % len(self.rotors)
+
+    def get(self, color, tooFast, frame, fuelHeight, fuelBarColor):
+        """Return sprite including fuel bar, fuelHeight is the bar height in pixels"""
+        key = (color, tooFast, frame, fuelHeight, fuelBarColor)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = self.bases[(color, tooFast, frame)].copy()
+            sprite.fill((0, 0, 0), ((0, 0), (4, 20)))
+            if fuelHeight > 0:
+                sprite.fill(fuelBarColor, ((1, 0), (2, fuelHeight)))
+            self.sprites[key] = sprite
+        return sprite
+
+    def frameCount(self):
+        """Return number of cached surfaces (base frames and sprites with fuel bars)"""
+        return len(self.bases) + len(self.sprites)
+
+    def memoryFootprint(self):
+        """Return approximate pixel memory of all cached surfaces in bytes"""
+        return sum(surface.get_width() * surface.get_height() * surface.get_bytesize()
+                   for surface in list(self.bases.values()) + list(self.sprites.values()))
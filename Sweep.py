@@ -0,0 +1,179 @@
+__author__ = 'Simon'
+"""Parameter sweep for balancing the physics constants
+
+Every parameter set (Simulation.Parameters) of a grid or a random sample is played by an autopilot for a number of
+headless games. Parameter sets are spread over a process pool using all cores, each finished set is appended as one
+JSON line to a checkpoint file. A restarted sweep skips the sets already in the checkpoint.
+
+    python Sweep.py [--samples N] [--games G] [--processes P] [--checkpoint sweep.jsonl]
+"""
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+import Simulation
+import enums
+
+DELTATIME = 1 / 60.0
+# values of the grid, random samples are drawn uniformly between the smallest and largest value
+SPACE = {"gravity": (10.0, 15.0, 20.0), "crashSpeed": (30.0, 40.0, 50.0), "thrustPower": (20.0, 25.0, 30.0),
+         "fuel": (5.0, 10.0, 15.0), "roundLength": (60.0, 75.0, 90.0)}
+
+
+def grid(space):
+    names = sorted(space)
+    for values in itertools.product(*[space[name] for name in names]):
+        yield dict(zip(names, values))
+
+
+def sample(space, count, seed):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield dict((name, rng.uniform(min(values), max(values))) for name, values in sorted(space.items()))
+
+
+class Autopilot(object):
+    """Scripted player: spawns at random, steers landers above their platform and brakes before touching down"""
+
+    def __init__(self, seed, spawnRate=0.003):
+        self.random = random.Random(seed)
+        self.spawnRate = spawnRate
+
+    def __call__(self, simulation):
+        if self.random.random() < self.spawnRate:
+            simulation.spawnLander(forced=True)
+        parameters = simulation.parameters
+        platforms = dict((platform.color, platform) for platform in simulation.platformList)
+        for lander in simulation.landerList:
+            platform = platforms[lander.color]
+            offset = platform.xPos + (platform.drawSize[0] - lander.drawSize[0]) / 2.0 - lander.xPos
+            if offset > 5 and lander.horizontalSpeed < 20:
+                lander.horizontalThrust("RIGHT")
+            elif offset < -5 and lander.horizontalSpeed > -20:
+                lander.horizontalThrust("LEFT")
+            else:
+                lander.horizontalUnthrust()
+            height = max(platform.yPos - lander.yPos - lander.drawSize[1], 0)
+            braking = max(parameters.thrustPower - parameters.gravity, 1.0)
+            # fastest speed that can still be braked to a safe touch down speed within height
+            safeSpeed = math.sqrt((0.7 * parameters.crashSpeed) ** 2 + 1.6 * braking * height)
+            if lander.fallSpeed > safeSpeed:
+                lander.thrust()
+            else:
+                lander.unthrust()
+
+
+def playGames(task):
+    """Worker: play task["games"] rounds with task["parameters"], return aggregated statistics"""
+    parameters = Simulation.Parameters(**task["parameters"])
+    start = time.time()
+    scores = list()
+    result = {"index": task["index"], "parameters": task["parameters"], "games": task["games"],
+              "landed": 0, "crashed": 0, "gameOver": 0, "steps": 0}
+    for game in range(task["games"]):
+        seed = task["seed"] + game
+        simulation = Simulation.Simulation(320, 480, seed, parameters)
+        result["steps"] += simulation.run(DELTATIME, controller=Autopilot(seed))
+        scores.append(simulation.score)
+        result["landed"] += simulation.landed
+        result["crashed"] += simulation.crashed
+        result["gameOver"] += simulation.GAMESTATE == enums.GAMESTATE.GAMEOVER
+    attempts = result["landed"] + result["crashed"]
+    result.update(meanScore=sum(scores) / float(len(scores)), minScore=min(scores), maxScore=max(scores),
+                  landingRate=result["landed"] / float(attempts) if attempts else 0.0,
+                  seconds=time.time() - start)
+    return result
+
+
+def readCheckpoint(fileName):
+    """Return results of a previous run by task index"""
+    done = dict()
+    if fileName is not None and os.path.exists(fileName):
+        with open(fileName) as checkpoint:
+            for line in checkpoint:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # last line of an interrupted run
+                    continue
+                done[result["index"]] = result
+    return done
+
+
+def sweep(parameterSets, games=4, processes=None, checkpointFile=None, seed=0, report=None):
+    """Play all parameter sets on a process pool, return their results
+
+    Finished results are appended to checkpointFile, sets found there (same index and values) are not played again.
+    report is called with every new result, the number of finished sets and the total number.
+    """
+    tasks = [{"index": index, "parameters": parameters, "games": games, "seed": seed + index * games}
+             for index, parameters in enumerate(parameterSets)]
+    done = readCheckpoint(checkpointFile)
+    results = dict((index, result) for index, result in done.items()
+                   if index < len(tasks) and result["parameters"] == tasks[index]["parameters"]
+                   and result["games"] == games)
+    pending = [task for task in tasks if task["index"] not in results]
+    if pending:
+        pool = multiprocessing.Pool(processes)
+        checkpoint = open(checkpointFile, "a") if checkpointFile is not None else None
+        try:
+            for result in pool.imap_unordered(playGames, pending):
+                results[result["index"]] = result
+                if checkpoint is not None:
+                    checkpoint.write(json.dumps(result, sort_keys=True) + "\n")
+                    checkpoint.flush()
+                if report is not None:
+                    report(result, len(results), len(tasks))
+            pool.close()
+        finally:
+            pool.terminate()
+            if checkpoint is not None:
+                checkpoint.close()
+    return [results[index] for index in range(len(tasks))]
+
+
+class Aggregate(object):
+    """Running totals over all finished parameter sets"""
+
+    def __init__(self):
+        self.games = 0
+        self.landed = 0
+        self.crashed = 0
+        self.scoreSum = 0.0
+        self.start = time.time()
+
+    def __call__(self, result, finished, total):
+        self.games += result["games"]
+        self.landed += result["landed"]
+        self.crashed += result["crashed"]
+        self.scoreSum += result["meanScore"] * result["games"]
+        sys.stderr.write("%d/%d sets, %d games in %.0f s: %d landed, %d crashed, mean score %.2f\n" % (
+            finished, total, self.games, time.time() - self.start, self.landed, self.crashed,
+            self.scoreSum / self.games))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CargoLander parameter sweep")
+    parser.add_argument("--samples", type=int, help="random parameter sets instead of the full grid")
+    parser.add_argument("--games", type=int, default=4, help="games per parameter set")
+    parser.add_argument("--processes", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--checkpoint", default="sweep.jsonl", help="JSON lines file with finished sets")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    if arguments.samples:
+        mySets = list(sample(SPACE, arguments.samples, arguments.seed))
+    else:
+        mySets = list(grid(SPACE))
+    myResults = sweep(mySets, arguments.games, arguments.processes, arguments.checkpoint, arguments.seed,
+                      Aggregate())
+    myResults.sort(key=lambda result: (-result["landingRate"], -result["meanScore"]))
+    print("landing rate  mean score  parameters")
+    for myResult in myResults[:10]:
+        print("%12.2f  %10.2f  %s" % (myResult["landingRate"], myResult["meanScore"],
+                                      " ".join("%s=%.1f" % item for item in sorted(myResult["parameters"].items()))))
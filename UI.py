@@ -0,0 +1,73 @@
+__author__ = 'Simon'
+"""Retained UI helpers
+
+Fonts are created once per size, rendered strings are kept in a LRU cache and labels only re-render when their
+text changes. Shades for overlay screens are built once and reused every frame.
+"""
+
+from collections import OrderedDict
+import pygame
+
+
+class TextCache(object):
+    """Cache fonts and rendered strings, the least recently used string is evicted when maxEntries is reached"""
+
+    def __init__(self, maxEntries=128):
+        self.maxEntries = maxEntries
+        self.fonts = dict()
+        self.texts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(None, size)
+            self.fonts[size] = font
+        return font
+
+    def render(self, size, text, color=(255, 255, 255), background=None):
+        key = (size, text, color, background)
+        surface = self.texts.pop(key, None)
+        if surface is None:
+            self.misses += 1
+            if background is None:
+                surface = self.font(size).render(text, True, color)
+            else:
+                surface = self.font(size).render(text, True, color, background)
+            if len(self.texts) >= self.maxEntries:
+                self.texts.popitem(last=False)
+        else:
+            self.hits += 1
+        self.texts[key] = surface
+        return surface
+
+
+class Label(object):
+    """Text widget that renders its value with textFormat and only re-renders when the text changes"""
+
+    def __init__(self, textCache, size, textFormat, color=(255, 255, 255), background=None):
+        self.textCache = textCache
+        self.size = size
+        self.textFormat = textFormat
+        self.color = color
+        self.background = background
+        self.text = None
+        self.surface = None
+
+    def update(self, value):
+        """Set value, return True if the label changed"""
+        text = self.textFormat % value
+        if text == self.text:
+            return False
+        self.text = text
+        self.surface = self.textCache.render(self.size, text, self.color, self.background)
+        return True
+
+
+def makeShade(size, color, alpha):
+    """Return a static overlay layer of given size, color and transparency"""
+    shade = pygame.Surface(size)
+    shade.fill(color)
+    shade.set_alpha(alpha)
+    return shade
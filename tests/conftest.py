@@ -0,0 +1,8 @@
+__author__ = 'Simon'
+"""The game modules live in the top directory, tests run without a display"""
+
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
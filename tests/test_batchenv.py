@@ -0,0 +1,90 @@
+__author__ = 'Simon'
+"""BatchEnv plays the same single drone game as Simulation"""
+
+import unittest
+import numpy
+import BatchEnv
+import Controls
+import Lander
+import Simulation
+import enums
+
+
+def hover(observations, env):
+    """Thrust whenever the drone sinks below y 100, it stays in the air until the round ends"""
+    xPos, yPos, fallSpeed = observations.T[:3]
+    return numpy.stack(((yPos > 100) & (fallSpeed > 0), numpy.zeros(len(yPos))), axis=1).astype(int)
+
+
+def playBoth(width, height, seed, parameters, pilot=BatchEnv.autopilot):
+    """Fly one drone with pilot in a Simulation and a BatchEnv game, return both trajectories and results"""
+    simulation = Simulation.Simulation(width, height, seed, parameters)
+    simulation.GAMESTATE = enums.GAMESTATE.RUNNING
+    simulation.spawnLander()
+    simulation.landerCount = 1
+    lander = simulation.landerList[0]
+    env = BatchEnv.BatchEnv(width, height, parameters, seed=seed)
+    env.reset(1)
+    env.physics.xPos[0] = lander.xPos
+    env.colors[0] = Lander.COLORS.index(lander.color)
+    env.aim(numpy.ones(1, dtype=bool))
+    observations = env.observe()
+    paths = (list(), list())
+    while simulation.landerCount:
+        actions = pilot(observations, env)
+        controls = Controls.ControlState()
+        controls.thrust = bool(actions[0, 0])
+        controls.horizontal = {-1: Controls.LEFT, 0: Controls.RELEASE, 1: Controls.RIGHT}[int(actions[0, 1])]
+        paths[0].append((lander.xPos, lander.yPos, lander.fallSpeed))
+        simulation.step(env.deltaTime, controls)
+        observations, rewards, dones, info = env.step(actions)
+        paths[1].append(tuple(env.physics.xPos[:1].tolist() + env.physics.yPos[:1].tolist() +
+                              env.physics.fallSpeed[:1].tolist()))
+        if dones[0]:
+            break
+    return paths, (simulation.score, simulation.landed, simulation.crashed,
+                   simulation.GAMESTATE == enums.GAMESTATE.TIMEUP), \
+        (int(rewards[0]), int(info["landed"][0]), int(info["crashed"][0]), bool(info["timeUp"][0]))
+
+
+class BatchEnvParityTest(unittest.TestCase):
+    def testWorldFromLevel(self):
+        env = BatchEnv.BatchEnv(2000, 480)
+        simulation = Simulation.Simulation(2000, 480)
+        self.assertEqual(env.physics.wrapWidth, simulation.physics.wrapWidth)
+        self.assertEqual(env.level.spawnBand, simulation.level.spawnBand)
+        self.assertEqual(len(env.platformRects), len(simulation.platformList))
+
+    def testSameGameAsSimulation(self):
+        for integrator in ("euler", "exact"):
+            for swept in (False, True):
+                for seed in range(4):
+                    parameters = Simulation.Parameters(integrator=integrator, sweptCollision=swept)
+                    paths, simulated, batched = playBoth(2000, 480, seed, parameters)
+                    self.assertEqual(paths[0][1:], paths[1][:-1], (integrator, swept, seed))
+                    self.assertEqual(simulated, batched, (integrator, swept, seed))
+
+    def testFullRoundEndsOnTheSameFrame(self):
+        for integrator in ("euler", "exact"):
+            parameters = Simulation.Parameters(fuel=100, integrator=integrator)
+            paths, simulated, batched = playBoth(320, 480, 1, parameters, hover)
+            self.assertEqual(paths[0][1:], paths[1][:-1], integrator)
+            self.assertEqual(simulated, batched, integrator)
+            self.assertEqual(simulated, (0, 0, 0, True))
+            self.assertGreater(len(paths[0]), parameters.roundLength * 60)
+
+    def testSweptCatchesFastDrones(self):
+        for swept in (False, True):
+            parameters = Simulation.Parameters(integrator="exact", sweptCollision=swept)
+            env = BatchEnv.BatchEnv(parameters=parameters, deltaTime=0.2, seed=0)
+            env.reset(256)
+            # a step carries the drones from just above their platform to below it
+            env.physics.fallSpeed[:256] = 300
+            env.physics.yPos[:256] = env.targetY - 45
+            observations, rewards, dones, info = env.step(numpy.zeros((256, 2), dtype=int))
+            self.assertTrue((observations[:, 1] > env.targetY + 5).all())
+            self.assertEqual(info["crashed"].all(), swept)
+            self.assertEqual(info["crashed"].any(), swept)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+__author__ = 'Simon'
+"""The camera scrolls wide worlds and keeps the classic screen still"""
+
+import unittest
+import Benchmark
+import Camera
+import Controls
+import Level
+
+
+class CameraTest(unittest.TestCase):
+    def testClassicWorldDoesNotScroll(self):
+        camera = Camera.Camera((320, 460), (320, 480), windowSize=(320, 480))
+        camera.direction = [1, 1]
+        self.assertFalse(camera.scroll(1.0))
+        self.assertEqual(camera.offset, (0, 0))
+
+    def testWideWorldScrollsToItsEdge(self):
+        camera = Camera.Camera((320, 460), (4000, 480), windowSize=(320, 480))
+        camera.direction = [1, 1]
+        self.assertTrue(camera.scroll(100.0))
+        self.assertEqual(camera.offset, (3680, 0))
+        camera.centerOn(0, 0)
+        self.assertEqual(camera.offset, (0, 0))
+
+    def testTallWorldScrollsDown(self):
+        camera = Camera.Camera((320, 460), (320, 2000), windowSize=(320, 480))
+        camera.moveTo(0, 10 ** 6)
+        self.assertEqual(camera.offset, (0, 1540))
+
+    def testWideWorldSpawnsInOpeningView(self):
+        simulation = Benchmark.runningSimulation(480, level=Level.forSize(4000, 480))
+        camera = Camera.Camera((320, 460), simulation.drawSize, windowSize=(320, 480))
+        controls = Controls.ControlState()
+        controls.spawns = 3
+        for step in range(60):
+            simulation.step(1 / 60.0, controls)
+        self.assertGreater(len(simulation.landerList), 3)
+        for lander in simulation.landerList:
+            self.assertTrue(camera.visible(lander.xPos, lander.yPos, lander.drawSize))
+            self.assertLessEqual(lander.xPos + lander.drawSize[0], camera.viewSize[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
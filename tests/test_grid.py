@@ -0,0 +1,74 @@
+__author__ = 'Simon'
+"""The collision grid answers like a scan over all boxes"""
+
+import random
+import unittest
+import numpy
+import Benchmark
+import Grid
+import Lander
+import Simulation
+import enums
+
+SIZE = (40, 40)
+
+
+def scan(xPos, yPos, x1, y1, x2, y2):
+    """Indices of the boxes of SIZE overlapping the (inclusive) rectangle, by testing every box"""
+    return [index for index in range(len(xPos)) if xPos[index] <= x2 and xPos[index] + SIZE[0] >= x1
+            and yPos[index] <= y2 and yPos[index] + SIZE[1] >= y1]
+
+
+class GridTest(unittest.TestCase):
+    def testQueryRectMatchesScan(self):
+        rng = numpy.random.default_rng(3)
+        xPos = rng.uniform(-100, 4000, 2000)
+        yPos = rng.uniform(-50, 480, 2000)
+        grid = Grid.CollisionGrid()
+        grid.overlaps(xPos, yPos, SIZE)
+        for i in range(300):
+            x1, x2 = sorted(rng.uniform(-200, 4100, 2))
+            y1, y2 = sorted(rng.uniform(-100, 600, 2))
+            if i % 2:
+                x2, y2 = x1, y1
+            self.assertEqual(grid.queryRect(x1, y1, x2, y2).tolist(), scan(xPos, yPos, x1, y1, x2, y2))
+
+    def testPickMatchesScan(self):
+        simulation = Benchmark.runningSimulation(6000)
+        Benchmark.populate(simulation, 300, 0)
+        rng = random.Random(1)
+        for step in range(40):
+            simulation.step(1 / 60.0)
+            slots = simulation.landerSlots()
+            xPos = simulation.physics.xPos[slots]
+            yPos = simulation.physics.yPos[slots]
+            for i in range(5):
+                corner1 = (rng.uniform(0, 320), rng.uniform(0, 3000))
+                corner2 = (corner1[0] + rng.uniform(-60, 60), corner1[1] + rng.uniform(-200, 200))
+                expected = [simulation.landerList[index] for index in
+                            scan(xPos, yPos, min(corner1[0], corner2[0]), min(corner1[1], corner2[1]),
+                                 max(corner1[0], corner2[0]), max(corner1[1], corner2[1]))]
+                self.assertEqual(simulation.pickRect(corner1, corner2), expected)
+
+    def testPickAfterSpawnWithoutStep(self):
+        simulation = Simulation.Simulation(320, 480, seed=2)
+        simulation.GAMESTATE = enums.GAMESTATE.RUNNING
+        simulation.spawnLander(forced=True)
+        lander = simulation.landerList[0]
+        self.assertEqual(simulation.pick((lander.xPos + 5, 5)), [lander])
+        self.assertEqual(simulation.pick((lander.xPos + 5, 100)), [])
+
+    def testSweptCandidatesAreNearby(self):
+        simulation = Simulation.Simulation(320, 480, 0, Simulation.Parameters(sweptCollision=True))
+        simulation.GAMESTATE = enums.GAMESTATE.RUNNING
+        for xPos in (10, 60, 250):
+            simulation.addLander(xPos, Lander.COLORS[0])
+        simulation.landerCount = 3
+        simulation.step(1 / 60.0)
+        near, close, far = simulation.landerList
+        self.assertEqual(simulation.grid.candidates(near), [close])
+        self.assertEqual(simulation.grid.candidates(far), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+__author__ = 'Simon'
+"""RemoteHighscore against a LeaderboardServer stand-in on localhost"""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+import unittest
+import Highscore
+import Leaderboard
+
+
+class StandIn(object):
+    """LeaderboardServer on a free localhost port, served by an event loop on its own thread"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        # the database belongs to the loop's thread like in Leaderboard.py serve
+        self.server = self.call(lambda: Leaderboard.LeaderboardServer(Highscore.Highscore(":memory:"),
+                                                                      batchInterval=0.05))
+        self.task = asyncio.run_coroutine_threadsafe(self.server.serve(port=0), self.loop)
+        waitFor(lambda: self.server.server is not None and self.server.server.sockets)
+        self.address = ("127.0.0.1", self.server.server.sockets[0].getsockname()[1])
+
+    def call(self, function):
+        """Return function() called on the loop's thread"""
+        async def run():
+            return function()
+        return asyncio.run_coroutine_threadsafe(run(), self.loop).result(5.0)
+
+    def stop(self):
+        async def cancelAll():
+            # the server and the handlers of connections still open
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        asyncio.run_coroutine_threadsafe(cancelAll(), self.loop).result(5.0)
+        self.call(self.server.highscore.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(1.0)
+        self.loop.close()
+
+
+def waitFor(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def freePort():
+    """A localhost port nothing listens on"""
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+class LeaderboardTest(unittest.TestCase):
+    def setUp(self):
+        self.standIn = StandIn()
+
+    def tearDown(self):
+        self.standIn.stop()
+
+    def remote(self, address=None):
+        return Leaderboard.RemoteHighscore(address or self.standIn.address, Highscore.Highscore(":memory:"),
+                                           refreshInterval=0.05, timeout=0.5, retryInterval=0.1)
+
+    def testSubmitAndRank(self):
+        first = self.remote()
+        second = self.remote()
+        try:
+            waitFor(lambda: first.online and second.online)
+            top = max(score for name, score in second.scores)
+            first.insertScore(name="BEST", score=top + 10)
+            first.insertScore(name="SECOND", score=top + 5)
+            waitFor(lambda: second.scores[:2] == [["BEST", top + 10], ["SECOND", top + 5]])
+            waitFor(lambda: self.standIn.server.batches > 0)
+            self.assertEqual(self.standIn.call(lambda: self.standIn.server.highscore.rank(top + 7)), 2)
+        finally:
+            first.close()
+            second.close()
+
+    def testOfflineFallbackOnOwningThread(self):
+        remote = self.remote(("127.0.0.1", freePort()))
+        try:
+            waitFor(lambda: remote.wentOffline.is_set())
+            # a plain Highscore raises if the network thread touches its SQLite connection
+            remote.insertScore(name="LOCAL", score=10 ** 6)
+            remote.writeHighscores()
+            self.assertEqual(remote.scores[0], ["LOCAL", 10 ** 6])
+            self.assertEqual(remote.local.scores[0], ["LOCAL", 10 ** 6])
+        finally:
+            remote.close()
+
+    def testScoresQueuedWhenServerGoesAway(self):
+        remote = self.remote()
+        waitFor(lambda: remote.online)
+        self.standIn.stop()
+        remote.outbox.put(["QUEUED", 10 ** 6])
+        try:
+            # settle runs on this thread, which owns the local Highscore
+            waitFor(lambda: remote.settle() or remote.scores[0] == ["QUEUED", 10 ** 6])
+            self.assertEqual(remote.local.scores[0], ["QUEUED", 10 ** 6])
+        finally:
+            remote.close()
+            self.standIn = StandIn()
+
+    def testBadRequestsGetErrors(self):
+        connection = socket.create_connection(self.standIn.address)
+        stream = connection.makefile("rwb")
+        try:
+            for line in (b"not json\n", b'{"op": "submit", "scores": [["X", 1e400]]}\n',
+                         b'{"op": "submit", "scores": [["X", 99999999999999999999]]}\n', b"[" * 10000 + b"\n"):
+                stream.write(line)
+                stream.flush()
+                self.assertIn("error", json.loads(stream.readline().decode("utf-8")))
+            stream.write(b'{"op": "top"}\n')
+            stream.flush()
+            self.assertIn("top", json.loads(stream.readline().decode("utf-8")))
+        finally:
+            connection.close()
+        connection = socket.create_connection(self.standIn.address)
+        stream = connection.makefile("rwb")
+        try:
+            stream.write(b'{"op": "top", "pad": "' + b"x" * 100000 + b'"}\n')
+            stream.flush()
+            self.assertEqual(json.loads(stream.readline().decode("utf-8")), {"error": "request too long"})
+            self.assertEqual(stream.readline(), b"")
+        finally:
+            connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+__author__ = 'Simon'
+"""Spectators get the size of the world, not of the window, and a stalled one holds up nobody"""
+
+import socket
+import time
+import unittest
+import pygame
+import Benchmark
+import Game
+import Highscore
+import NetSync
+import SimThread
+
+
+def mirroredSize(width, height):
+    """Broadcast a window of the classic size on a world of width * height, return the size a client mirrors"""
+    game = Game.Game(320, 480, Highscore.Highscore(":memory:"), broadcast=0, world=(width, height))
+    client = NetSync.SyncClient(("127.0.0.1", game.syncServer.address[1]))
+    try:
+        game.simulation.spawnLander()
+        deadline = time.perf_counter() + 5.0
+        while client.mirror.drawSize is None and time.perf_counter() < deadline:
+            game.syncServer.publish(SimThread.takeSnapshot(game.simulation, 1, time.perf_counter()))
+            time.sleep(0.02)
+            client.poll()
+        return client.mirror.drawSize
+    finally:
+        client.close()
+        game.syncServer.close()
+        pygame.quit()
+
+
+def stalledClient(address):
+    """Connect with a tiny receive buffer and never read"""
+    connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    connection.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    connection.connect(address)
+    return connection
+
+
+class NetSyncTest(unittest.TestCase):
+    def testStalledClientDoesNotHoldUpOthers(self):
+        simulation = Benchmark.runningSimulation(50000)
+        Benchmark.populate(simulation, 5000, 500)
+        # a keyframe every tick fills the socket buffers of the stalled client quickly
+        server = NetSync.SyncServer(simulation.drawSize, port=0, keyframeInterval=1, backlog=8, sendTimeout=0.5)
+        address = ("127.0.0.1", server.address[1])
+        stalled = stalledClient(address)
+        client = NetSync.SyncClient(address)
+        try:
+            deadline = time.perf_counter() + 5.0
+            while len(server.clients) < 2 and time.perf_counter() < deadline:
+                time.sleep(0.01)
+            longestQueue = 0
+            for tick in range(1, 121):
+                simulation.step(1 / 60.0)
+                start = time.perf_counter()
+                server.publish(SimThread.takeSnapshot(simulation, tick))
+                self.assertLess(time.perf_counter() - start, 0.1)
+                longestQueue = max([longestQueue] + [len(spectator.queue) for spectator in server.clients])
+                client.poll()
+                time.sleep(0.005)
+            deadline = time.perf_counter() + 5.0
+            while (client.mirror.snapshot() is None or client.mirror.snapshot().tick != 120) \
+                    and time.perf_counter() < deadline:
+                time.sleep(0.01)
+                client.poll()
+            self.assertEqual(client.mirror.snapshot().tick, 120)
+            self.assertLessEqual(longestQueue, 8)
+            stats = server.stats()
+            self.assertGreater(stats["resyncs"] + stats["dropped"], 0)
+        finally:
+            stalled.close()
+            client.close()
+            server.close()
+
+    def testMirrorGetsWorldSize(self):
+        self.assertEqual(mirroredSize(4000, 480), (4000, 480))
+
+    def testWorldWiderThanUint16(self):
+        self.assertEqual(mirroredSize(200000, 480), (200000, 480))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+__author__ = 'Simon'
+"""Recordings replay the session they were recorded from"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import Controls
+import Replay
+import Simulation
+import enums
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.directory, "session.clr")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testWideLevelRoundTrip(self):
+        simulation = Simulation.Simulation(200000, 480, seed=5)
+        recorder = Replay.Recorder(self.fileName, simulation)
+        clicks = [(150000, 300), (199990, 470)]
+        for frame in range(120):
+            controls = Controls.ControlState()
+            if frame == 0:
+                controls.started = True
+                simulation.GAMESTATE = enums.GAMESTATE.RUNNING
+                controls.spawns = 3
+            if frame == 30:
+                controls.clicks = list(clicks)
+            controls.thrust = frame % 20 < 5
+            recorder.record(simulation, 16, controls)
+            simulation.step(0.016, controls)
+        recorder.close(simulation)
+
+        replayer = Replay.Replayer(self.fileName)
+        self.assertEqual((replayer.width, replayer.height, replayer.seed), (200000, 480, 5))
+        self.assertEqual(replayer.frames[30][1].clicks, clicks)
+        self.assertTrue(replayer.verify(replayer.run()))
+
+    def testOtherFormatIsRejected(self):
+        with open(self.fileName, "wb") as replayFile:
+            replayFile.write(b"CLREPLAY" + bytes(20))
+        with self.assertRaisesRegex(ValueError, "header b'CLREPLAY'"):
+            Replay.Replayer(self.fileName)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+__author__ = 'Simon'
+"""SaveState snapshots restore the landers and continue like the original"""
+
+import unittest
+import Benchmark
+import Level
+import SaveState
+
+
+def populated(count, level=None):
+    """Return a running simulation with count falling landers, stepped a few frames"""
+    simulation = Benchmark.runningSimulation(6000, level=level)
+    Benchmark.populate(simulation, count, 500)
+    for i in range(10):
+        simulation.step(1 / 60.0)
+    return simulation
+
+
+class SaveStateTest(unittest.TestCase):
+    def testLandersKeepColorSerialAndGrab(self):
+        simulation = populated(60)
+        grabbed = simulation.landerList[7]
+        simulation.grabbed.add(grabbed)
+        expected = [(lander.serial, lander.color, lander.xPos, lander.yPos) for lander in simulation.landerList]
+        data = SaveState.capture(simulation)
+        for i in range(30):
+            simulation.step(1 / 60.0)
+        SaveState.restore(simulation, data)
+        self.assertEqual([(lander.serial, lander.color, lander.xPos, lander.yPos)
+                          for lander in simulation.landerList], expected)
+        self.assertEqual([lander.slot for lander in simulation.landerList], list(range(60)))
+        self.assertEqual(set(lander.serial for lander in simulation.grabbed), {grabbed.serial})
+        self.assertEqual(SaveState.capture(simulation), data)
+
+    def testLoadedCopyContinuesAlike(self):
+        simulation = populated(100)
+        copy = SaveState.load(SaveState.capture(simulation))
+        for i in range(120):
+            simulation.step(1 / 60.0)
+            copy.step(1 / 60.0)
+        self.assertEqual(SaveState.capture(copy), SaveState.capture(simulation))
+
+    def testWideLevelRoundTrip(self):
+        simulation = populated(30, Level.forSize(200000, 6000))
+        for lander in simulation.landerList[::3]:
+            lander.xPos += 150000
+        data = SaveState.capture(simulation)
+        copy = SaveState.load(data)
+        self.assertEqual(copy.drawSize, (200000, 6000))
+        self.assertEqual(SaveState.capture(copy), data)
+        for i in range(60):
+            simulation.step(1 / 60.0)
+            copy.step(1 / 60.0)
+        self.assertEqual(SaveState.capture(copy), SaveState.capture(simulation))
+
+    def testOtherVersionIsNamed(self):
+        data = bytearray(SaveState.capture(populated(3)))
+        data[len(SaveState.MAGIC)] = 1
+        with self.assertRaisesRegex(ValueError, "version 1, only version %d" % SaveState.VERSION):
+            SaveState.load(bytes(data))
+        with self.assertRaisesRegex(ValueError, "no CargoLander state"):
+            SaveState.load(b"CLREPLY2" + bytes(data[8:]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+__author__ = 'Simon'
+"""Interpolated drone positions use the wrap width of the world they fly in"""
+
+import unittest
+import numpy
+import Benchmark
+import Level
+import NetSync
+import SimThread
+
+
+def movedBy(simulation, distance):
+    """Return snapshots before and after the first drone of simulation moved distance px to the right"""
+    previous = SimThread.takeSnapshot(simulation, 1)
+    simulation.landerList[0].xPos = (simulation.landerList[0].xPos + distance) % simulation.physics.wrapWidth
+    return previous, SimThread.takeSnapshot(simulation, 2)
+
+
+class InterpolateTest(unittest.TestCase):
+    def setUp(self):
+        self.simulation = Benchmark.runningSimulation(480, level=Level.forSize(4000, 480))
+        Benchmark.populate(self.simulation, 1, 0)
+        self.simulation.landerList[0].xPos = 3800
+
+    def testFarMoveInWideWorldIsInterpolated(self):
+        previous, current = movedBy(self.simulation, 180)
+        self.assertEqual(current.wrapWidth, 3990)
+        xPos, yPos = SimThread.interpolate(previous, current, 0.5)
+        self.assertAlmostEqual(xPos[0], 3890)
+
+    def testWrappingDroneIsDrawnInPlace(self):
+        previous, current = movedBy(self.simulation, 200)
+        xPos, yPos = SimThread.interpolate(previous, current, 0.5)
+        self.assertAlmostEqual(xPos[0], 10)
+
+    def testMirrorKnowsWrapWidth(self):
+        encoder = NetSync.DeltaEncoder(self.simulation.drawSize)
+        mirror = NetSync.Mirror()
+        message = encoder.keyframe(SimThread.takeSnapshot(self.simulation, 1))
+        mirror.apply(NetSync.KEYFRAME, message[NetSync.FRAMING.size:])
+        self.assertEqual(mirror.snapshot().wrapWidth, 3990)
+        self.assertTrue(numpy.array_equal(mirror.snapshot().xPos, [3800]))
+
+
+if __name__ == "__main__":
+    unittest.main()
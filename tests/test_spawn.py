@@ -0,0 +1,60 @@
+__author__ = 'Simon'
+"""The spawn allocator keeps its blocked intervals up to date without reading every lander again"""
+
+import random
+import unittest
+import Benchmark
+import Controls
+import Spawn
+
+
+def fresh(spawner):
+    """Blocked intervals of a new allocator reading the same physics from scratch"""
+    other = Spawn.SpawnAllocator(spawner.physics, spawner.xMin, spawner.xMax, spawner.bandHeight,
+                                 spawner.landerWidth)
+    other.freeSpace()
+    return other.blocked, other.freeIntervals
+
+
+class SpawnTest(unittest.TestCase):
+    def testIncrementalMatchesFromScratch(self):
+        simulation = Benchmark.runningSimulation(480)
+        spawner = simulation.spawner
+        rng = random.Random(4)
+        for step in range(600):
+            controls = Controls.ControlState()
+            controls.spawns = rng.randint(0, 3)
+            if rng.random() < 0.1:
+                controls.horizontal = rng.choice((Controls.LEFT, Controls.RIGHT, Controls.RELEASE))
+            simulation.step(1 / 60.0, controls)
+            spawner.freeSpace()
+            self.assertEqual((spawner.blocked, spawner.freeIntervals), fresh(spawner))
+            self.assertLessEqual(len(spawner.blocked), spawner.maxInBand())
+        # falling straight down keeps the blocked range, only entering and leaving changes it
+        self.assertLess(spawner.changes, 600)
+
+    def testUnchangedBandIsNotRederived(self):
+        simulation = Benchmark.runningSimulation(480)
+        controls = Controls.ControlState()
+        controls.spawns = 1
+        simulation.step(1 / 60.0, controls)
+        simulation.spawner.freeSpace()
+        changes = simulation.spawner.changes
+        for step in range(5):
+            simulation.step(1 / 60.0)
+            simulation.spawner.freeSpace()
+        self.assertEqual(simulation.spawner.changes, changes)
+
+    def testFullBandStaysWithinBound(self):
+        simulation = Benchmark.runningSimulation(480)
+        controls = Controls.ControlState()
+        controls.spawns = 10
+        for step in range(120):
+            simulation.step(1 / 60.0, controls)
+            simulation.spawner.freeSpace()
+            self.assertLessEqual(len(simulation.spawner.blocked), simulation.spawner.maxInBand())
+        self.assertLess(simulation.spawner.successRate(), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()